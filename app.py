@@ -2,11 +2,16 @@
 Flask Application Factory
 Main application entry point
 """
+from utils.startup import start_timer
+
+# Started before the other imports so the startup report can include them
+startup_timer = start_timer()
+
 from flask import Flask
 from flask_cors import CORS
-from flask_session import Session
 from flask_bcrypt import Bcrypt
 from dotenv import load_dotenv
+import logging
 import os
 
 from config import ApplicationConfig
@@ -14,25 +19,62 @@ from models import db
 from routes.auth import init_auth_routes
 from routes.spotify import init_spotify_routes
 from routes.playlists import init_playlists_routes
+from routes.library import init_library_routes
+from routes.jobs import init_jobs_routes
+from routes.recommendations import init_recommendations_routes
+from routes.metrics import init_metrics_routes
 from errors.handlers import register_error_handlers
+from cli import init_cli
+from services.http_client import init_http_client
+from services.job_queue import init_job_queue
+from services.audio_feature_fetcher import init_audio_feature_fetcher
+from services.db_engine import init_database
+from services.playlist_cache import init_playlist_cache
+from services.search_index import init_search_index
+from services.feature_store import init_feature_store
+from services.similarity_store import init_similarity_store
+from services.password_hasher import init_password_hasher
+from services.sessions import init_sessions
+from services.spotify_rate_limiter import init_spotify_rate_limiter
+from services.token_refresher import init_token_refresher
+from services.token_scheduler import init_token_scheduler
+from services.token_vault import init_token_vault
+from services.user_cache import init_user_cache
+from utils.metrics import init_metrics
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
 
-def create_app():
+def create_app(config_overrides=None):
     """
     Application factory function
     
+    Args:
+        config_overrides: Optional dict applied on top of ApplicationConfig
+            (used by benchmarks to point at SQLite, fakeredis and a fake Spotify)
+    
     Returns:
         Flask: Configured Flask application instance
     """
     app = Flask(__name__)
     app.config.from_object(ApplicationConfig)
+    if config_overrides:
+        app.config.update(config_overrides)
+    
+    # Redis client is built here rather than in config.py; redis-py connects on first command
+    if app.config.get('SESSION_TYPE') == 'redis' and app.config.get('SESSION_REDIS') is None:
+        import redis
+        app.config['SESSION_REDIS'] = redis.from_url(app.config['REDIS_URL'])
     
-    # Initialize extensions
-    db.init_app(app)
-    bcrypt = Bcrypt(app)
+    with startup_timer.phase('database'):
+        # Initialize extensions (engine pool and per-connection settings from DB_* config)
+        init_database(app)
+    with startup_timer.phase('password hasher'):
+        bcrypt = Bcrypt(app)
+        init_password_hasher(app, bcrypt)
     
     # Configure CORS with proper origin handling
     # Support both production and development origins
@@ -55,30 +97,83 @@ def create_app():
         supports_credentials=True,
         origins=allowed_origins,
         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        allow_headers=["Content-Type", "Authorization"],
-        expose_headers=["Content-Type"],
+        allow_headers=["Content-Type", "Authorization", "If-None-Match"],
+        expose_headers=["Content-Type", "ETag"],
         max_age=3600
     )
     
-    server_session = Session(app)
+    with startup_timer.phase('sessions and metrics'):
+        # Small session records, written only when changed (tokens are in the token vault)
+        init_sessions(app)
+        
+        # Latency histograms (requests, DB, sessions) exported at /metrics
+        init_metrics(app)
     
-    # Create database tables if they don't exist
-    with app.app_context():
-        db.create_all()
+    with startup_timer.phase('services'):
+        # Shared keep-alive connection pool for Spotify calls
+        init_http_client(app)
+        
+        # Shared Spotify quota and in-flight GET coalescing (before anything builds a SpotifyService)
+        init_spotify_rate_limiter(app)
+        
+        # Cross-user audio feature cache with batched, coalesced Spotify lookups
+        init_audio_feature_fetcher(app)
+        
+        # Per-user playlist cache (reuses SESSION_REDIS when available)
+        init_playlist_cache(app)
+        
+        # Per-worker type-ahead search over synced libraries
+        init_search_index(app)
+        
+        # Audio features for mood scoring, mapped from one file by every worker on the host
+        init_feature_store(app)
+        
+        # "More like this" index, mapped from one file by every worker on the host
+        init_similarity_store(app)
+        
+        # Per-worker user lookups for /@me and login_required(load_user=True)
+        init_user_cache(app)
+        
+        # Per-user Spotify tokens shared by all of a user's sessions
+        init_token_vault(app)
+        
+        # Single-flight Spotify token refresh used by spotify_auth_required
+        init_token_refresher(app)
+        
+        # Optional background refresh of hot sessions (started per worker by gunicorn.conf.py)
+        init_token_scheduler(app)
+        
+        # Library syncs and mood playlists run as queued jobs, polled at /jobs/<id>
+        init_job_queue(app)
     
-    # Register error handlers
-    register_error_handlers(app)
+    # Schema is managed by `flask init-db` (run before deploys); DB_CREATE_ALL
+    # keeps the old create-on-boot behaviour for local SQLite
+    if app.config.get('DB_CREATE_ALL'):
+        with startup_timer.phase('create_all'), app.app_context():
+            db.create_all()
     
-    # Register blueprints
-    init_auth_routes(app, bcrypt)
-    init_spotify_routes(app)
-    init_playlists_routes(app)
+    with startup_timer.phase('routes'):
+        # Register error handlers
+        register_error_handlers(app)
+        
+        # Register blueprints
+        init_auth_routes(app, bcrypt)
+        init_spotify_routes(app)
+        init_playlists_routes(app)
+        init_library_routes(app)
+        init_jobs_routes(app)
+        init_recommendations_routes(app)
+        init_metrics_routes(app)
+        
+        # flask init-db and other management commands
+        init_cli(app)
     
     return app
 
 
-# Create app instance
+# Create app instance (once in the gunicorn master when preload_app is on)
 app = create_app()
+logger.info(startup_timer.report())
 
 
 if __name__ == "__main__":
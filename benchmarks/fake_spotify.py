@@ -0,0 +1,212 @@
+"""
+Local Spotify stand-in for benchmarks
+Serves the token endpoint, playlists, saved/playlist tracks and audio features
+with configurable latency, 429 responses and pagination so the app can be
+load-tested offline
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeSpotifyConfig:
+    """Knobs for the fake server (mutable while it runs)"""
+
+    def __init__(self, latency_ms=40, jitter_ms=10, rate_limit_ratio=0.0, retry_after=1,
+                 playlist_count=250, expires_in=3600, saved_track_count=500, tracks_per_playlist=20,
+                 catalog_size=5000):
+        """
+        Args:
+            latency_ms: Base response latency in milliseconds
+            jitter_ms: Random +/- jitter added to latency
+            rate_limit_ratio: Fraction of requests answered with 429
+            retry_after: Retry-After seconds sent with 429s
+            playlist_count: Total playlists reported for every user
+            expires_in: Token lifetime returned by the token endpoint
+            saved_track_count: Tracks in every user's library
+            tracks_per_playlist: Tracks in every playlist
+            catalog_size: Distinct tracks that libraries and playlists draw from
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.playlist_count = playlist_count
+        self.expires_in = expires_in
+        self.saved_track_count = saved_track_count
+        self.tracks_per_playlist = tracks_per_playlist
+        self.catalog_size = catalog_size
+        self.counters = {'token': 0, 'playlists': 0, 'tracks': 0, 'audio_features': 0, 'rate_limited': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+def _track(number):
+    return {
+        'id': f'track{number:06d}',
+        'type': 'track',
+        'name': f'Track {number}',
+        'uri': f'spotify:track:track{number:06d}',
+        'artists': [{'id': f'artist{number % 300:04d}', 'name': f'Artist {number % 300}'}],
+        'album': {'id': f'album{number % 900:04d}', 'name': f'Album {number % 900}'},
+    }
+
+
+def _audio_features(track_id):
+    # Deterministic per track so repeated runs rank the same way
+    rng = random.Random(track_id)
+    return {
+        'id': track_id,
+        'valence': rng.random(),
+        'energy': rng.random(),
+        'danceability': rng.random(),
+        'acousticness': rng.random(),
+        'instrumentalness': rng.random() ** 3,
+        'speechiness': rng.random() / 3,
+        'liveness': rng.random() / 2,
+        'tempo': rng.uniform(60, 180),
+        'loudness': rng.uniform(-30, -3),
+    }
+
+
+def _paging(base, items, limit, offset, total):
+    return {
+        'href': f'{base}?offset={offset}&limit={limit}',
+        'items': items,
+        'limit': limit,
+        'offset': offset,
+        'total': total,
+        'next': f'{base}?offset={offset + limit}&limit={limit}' if offset + limit < total else None,
+        'previous': None,
+    }
+
+
+def _make_handler(config):
+    class FakeSpotifyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass
+
+        def _delay(self):
+            jitter = random.uniform(-config.jitter_ms, config.jitter_ms)
+            time.sleep(max(config.latency_ms + jitter, 0) / 1000)
+
+        def _send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _rate_limited(self):
+            if config.rate_limit_ratio and random.random() < config.rate_limit_ratio:
+                config.count('rate_limited')
+                self._send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                                {'Retry-After': str(config.retry_after)})
+                return True
+            return False
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self._delay()
+            if urlparse(self.path).path != '/api/token':
+                return self._send_json(404, {'error': 'not found'})
+            if self._rate_limited():
+                return
+            config.count('token')
+            self._send_json(200, {
+                'access_token': f'fake-access-{random.getrandbits(48):x}',
+                'refresh_token': 'fake-refresh',
+                'token_type': 'Bearer',
+                'expires_in': config.expires_in,
+            })
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            self._delay()
+            query = parse_qs(url.query)
+            limit = int(query.get('limit', [50])[0])
+            offset = int(query.get('offset', [0])[0])
+            base = f'http://{self.headers.get("Host")}{url.path}'
+            parts = url.path.strip('/').split('/')
+
+            if url.path == '/v1/me/playlists':
+                counter, handler = 'playlists', lambda: self._playlists(base, min(limit, 50), offset)
+            elif url.path == '/v1/me/tracks':
+                counter, handler = 'tracks', lambda: self._saved_tracks(base, min(limit, 50), offset)
+            elif len(parts) == 4 and parts[:2] == ['v1', 'playlists'] and parts[3] == 'tracks':
+                counter, handler = 'tracks', lambda: self._playlist_tracks(base, parts[2], min(limit, 100), offset)
+            elif url.path == '/v1/audio-features':
+                ids = [track_id for track_id in query.get('ids', [''])[0].split(',') if track_id][:100]
+                counter, handler = 'audio_features', lambda: {'audio_features': [_audio_features(i) for i in ids]}
+            else:
+                return self._send_json(404, {'error': 'not found'})
+
+            if self._rate_limited():
+                return
+            config.count(counter)
+            self._send_json(200, handler())
+
+        def _playlists(self, base, limit, offset):
+            total = config.playlist_count
+            return _paging(base, [
+                {
+                    'id': f'playlist{i:06d}',
+                    'name': f'Playlist {i}',
+                    'snapshot_id': f'snap{i}',
+                    'public': bool(i % 2),
+                    'collaborative': False,
+                    'owner': {'id': 'bench-user', 'display_name': 'Bench User'},
+                    'images': [{'url': f'https://example.invalid/{i}.jpg', 'height': 640, 'width': 640}],
+                    'tracks': {'href': f'{base}/{i}/tracks', 'total': config.tracks_per_playlist},
+                }
+                for i in range(offset, min(offset + limit, total))
+            ], limit, offset, total)
+
+        def _saved_tracks(self, base, limit, offset):
+            # Newest first; the n-th track ever saved keeps its ID and timestamp as more are added
+            total = config.saved_track_count
+            return _paging(base, [
+                {'added_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1700000000 + (total - i) * 60)),
+                 'track': _track(((total - i) * 7) % config.catalog_size)}
+                for i in range(offset, min(offset + limit, total))
+            ], limit, offset, total)
+
+        def _playlist_tracks(self, base, playlist_id, limit, offset):
+            total = config.tracks_per_playlist
+            seed = sum(map(ord, playlist_id)) * 31
+            return _paging(base, [
+                {'added_at': '2024-01-01T00:00:00Z', 'track': _track((seed + i * 13) % config.catalog_size)}
+                for i in range(offset, min(offset + limit, total))
+            ], limit, offset, total)
+
+    return FakeSpotifyHandler
+
+
+def start_fake_spotify(config=None, host='127.0.0.1', port=0):
+    """
+    Start the fake Spotify server in a background thread
+
+    Args:
+        config: FakeSpotifyConfig (defaults used if None)
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+
+    Returns:
+        tuple: (server, base_url, config)
+    """
+    config = config or FakeSpotifyConfig()
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-spotify', daemon=True).start()
+    return server, f'http://{host}:{server.server_port}', config
@@ -0,0 +1,290 @@
+"""
+Benchmark / load-test runner
+Starts create_app() against a local fake Spotify, SQLite and fakeredis, drives
+register/login/@me/playlists/refresh-token/mood at a target concurrency, and
+reports p50/p95/p99 latency, throughput and memory. Runs fully offline.
+
+Usage:
+    python -m benchmarks.run --users 20 --duration 30
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json --tolerance 0.2   # exit 1 on regression
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_spotify import FakeSpotifyConfig, start_fake_spotify
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the API against a fake Spotify")
+    parser.add_argument('--users', type=int, default=20, help="concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=20, help="seconds each user keeps looping")
+    parser.add_argument('--latency-ms', type=float, default=40, help="fake Spotify base latency")
+    parser.add_argument('--jitter-ms', type=float, default=10, help="fake Spotify latency jitter")
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="fraction of Spotify calls answered 429")
+    parser.add_argument('--playlists', type=int, default=250, help="playlists per user (pagination depth)")
+    parser.add_argument('--token-expires-in', type=int, default=3600, help="fake token lifetime in seconds")
+    parser.add_argument('--bcrypt-rounds', type=int, default=12, help="BCRYPT_LOG_ROUNDS for the run")
+    parser.add_argument('--mix', default='@me,playlists,@me,refresh-token',
+                        help="comma-separated endpoints each user loops over")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="compare against a previous --output file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed p95 regression (0.2 = +20%%)")
+    return parser.parse_args(argv)
+
+
+def build_app(spotify_url, args, db_path):
+    """
+    Create the app wired to SQLite, fakeredis and the fake Spotify server
+
+    Environment is set before importing app.py because config.py reads it at import.
+    """
+    os.environ['FLASK_ENV'] = 'development'
+    os.environ['SECRET_KEY'] = 'benchmark-secret'
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.pop('REDIS_URL', None)
+    os.environ.pop('REDISCLOUD_URL', None)
+
+    import fakeredis
+    from app import create_app
+
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'SESSION_TYPE': 'redis',
+        'SESSION_REDIS': fakeredis.FakeRedis(),
+        'SESSION_COOKIE_SECURE': False,
+        'SESSION_COOKIE_SAMESITE': 'Lax',
+        'BCRYPT_LOG_ROUNDS': args.bcrypt_rounds,
+        'SPOTIFY_CLIENT_ID': 'bench-client',
+        'SPOTIFY_CLIENT_SECRET': 'bench-secret',
+        'SPOTIFY_TOKEN_URL': f'{spotify_url}/api/token',
+        'SPOTIFY_API_BASE_URL': f'{spotify_url}/v1/',
+    })
+
+
+def serve(app):
+    """Serve the app on a free local port with a threaded WSGI server"""
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no per-request access log
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class Recorder:
+    """Collects per-endpoint latencies and error counts from all virtual users"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, started, response):
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            if response is None or response.status_code >= 400:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def virtual_user(base_url, recorder, deadline, mix):
+    """One user: register, log in, connect Spotify, then loop over the endpoint mix"""
+    http = requests.Session()
+    username = f'bench_{uuid.uuid4().hex[:12]}'
+    credentials = {'username': username, 'password': 'benchmark-password'}
+
+    def call(name, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = http.request(method, base_url + path, timeout=60, **kwargs)
+        except requests.RequestException:
+            response = None
+        recorder.record(name, started, response)
+        return response
+
+    def call_with_backoff(name, method, path, attempts=10, **kwargs):
+        # Behave like the frontend: honor Retry-After when the hashing pool sheds load
+        for _ in range(attempts):
+            response = call(name, method, path, **kwargs)
+            if response is None or response.status_code != 503:
+                return response
+            time.sleep(float(response.headers.get('Retry-After', 1)))
+        return response
+
+    def call_job(name, method, path, **kwargs):
+        # Queued work answers 202; poll the job like the frontend and time the whole round trip
+        started = time.perf_counter()
+        try:
+            response = http.request(method, base_url + path, timeout=60, **kwargs)
+            while response.status_code == 202 or (
+                    response.ok and response.json().get('status') not in ('succeeded', 'failed')):
+                time.sleep(min(float(response.headers.get('Retry-After', 1)), 0.05))
+                response = http.get(base_url + response.headers.get('Location', f"/jobs/{response.json()['id']}"),
+                                    timeout=60)
+            if response.ok and response.json().get('status') == 'failed':
+                response.status_code = 500
+        except requests.RequestException:
+            response = None
+        recorder.record(name, started, response)
+        return response
+
+    call_with_backoff('register', 'POST', '/register', json=credentials)
+    call_with_backoff('user-login', 'POST', '/user-login', json=credentials)
+    call('spotify-exchange', 'POST', '/spotify-exchange', json={'code': 'benchmark-code'})
+
+    routes = {
+        '@me': ('GET', '/@me', None),
+        'playlists': ('GET', '/playlists', None),
+        'playlists-page': ('GET', '/playlists?all=false', None),
+        'refresh-token': ('POST', '/refresh-token', None),
+        'mood': ('POST', '/playlists/mood', {'mood': 'happy', 'limit': 30}),
+    }
+    queued = {'mood'}
+    while time.time() < deadline:
+        for name in mix:
+            method, path, body = routes[name]
+            (call_job if name in queued else call)(name, method, path, json=body)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def rss_mb():
+    """Current and peak resident memory of this process in MB (Linux /proc, else getrusage)"""
+    current = peak = None
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return current, peak
+
+
+def summarize(recorder, elapsed, memory, spotify_config):
+    endpoints = {}
+    total_requests = 0
+    for name, values in sorted(recorder.latencies.items()):
+        values.sort()
+        total_requests += len(values)
+        endpoints[name] = {
+            'count': len(values),
+            'errors': recorder.errors.get(name, 0),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2),
+        }
+    return {
+        'elapsed_s': round(elapsed, 2),
+        'requests': total_requests,
+        'throughput_rps': round(total_requests / elapsed, 1) if elapsed else 0,
+        'endpoints': endpoints,
+        'memory': memory,
+        'spotify_calls': dict(spotify_config.counters),
+    }
+
+
+def print_report(result):
+    print(f"\n{result['requests']} requests in {result['elapsed_s']}s "
+          f"({result['throughput_rps']} req/s)")
+    print(f"{'endpoint':<18}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in result['endpoints'].items():
+        print(f"{name:<18}{stats['count']:>8}{stats['errors']:>8}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    memory = result['memory']
+    print(f"memory (app worker + harness): rss {memory['rss_mb']} MB, peak {memory['peak_rss_mb']} MB, "
+          f"hash pool peak {memory['hash_pool_peak_rss_mb']} MB")
+    print(f"fake Spotify calls: {result['spotify_calls']}")
+
+
+def compare(result, baseline, tolerance):
+    """
+    Find endpoints whose p95 regressed beyond tolerance
+
+    Returns:
+        list: Human-readable regression descriptions
+    """
+    regressions = []
+    for name, stats in result['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if before and before['p95_ms'] and stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms")
+    if baseline.get('throughput_rps') and result['throughput_rps'] < baseline['throughput_rps'] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    spotify_config = FakeSpotifyConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_limit_ratio=args.rate_limit_ratio,
+        playlist_count=args.playlists,
+        expires_in=args.token_expires_in,
+    )
+    _, spotify_url, spotify_config = start_fake_spotify(spotify_config)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(spotify_url, args, os.path.join(tmp, 'bench.db'))
+        app.extensions['password_hasher'].warm_up()
+        app_server, base_url = serve(app)
+
+        recorder = Recorder()
+        mix = [name.strip() for name in args.mix.split(',') if name.strip()]
+        started = time.perf_counter()
+        deadline = time.time() + args.duration
+        with ThreadPoolExecutor(max_workers=args.users) as executor:
+            for future in [executor.submit(virtual_user, base_url, recorder, deadline, mix)
+                           for _ in range(args.users)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+        app_server.shutdown()
+
+    current, peak = rss_mb()
+    memory = {
+        'rss_mb': round(current or 0, 1),
+        'peak_rss_mb': round(peak, 1),
+        'hash_pool_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+    result = summarize(recorder, elapsed, memory, spotify_config)
+    print_report(result)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(result, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
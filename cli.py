@@ -0,0 +1,78 @@
+"""
+Management commands
+Run with `flask --app app <command>`; deploys run `init-db` before starting gunicorn
+and can run `jobs-worker` as a separate process
+"""
+import os
+import time
+
+import click
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+
+def init_cli(app):
+    """
+    Register management commands on the app
+
+    Args:
+        app: Flask application instance
+    """
+
+    @app.cli.command('init-db')
+    @click.option('--retries', default=5, show_default=True, help='Attempts while the database is unreachable')
+    @click.option('--delay', default=2.0, show_default=True, help='Seconds between attempts (doubles each time)')
+    def init_db(retries, delay):
+        """Create missing tables (existing tables are left as they are)"""
+        for attempt in range(1, retries + 1):
+            try:
+                start = time.perf_counter()
+                db.create_all()
+                click.echo(f"Database schema ready ({(time.perf_counter() - start) * 1000:.0f} ms)")
+                return
+            except OperationalError as e:
+                if attempt == retries:
+                    raise click.ClickException(f"Database unreachable after {retries} attempts: {e.orig}")
+                click.echo(f"Database unreachable (attempt {attempt}/{retries}), retrying in {delay:.0f}s", err=True)
+                time.sleep(delay)
+                delay *= 2
+
+    @app.cli.command('jobs-worker')
+    @click.option('--threads', type=int, help='Jobs run at once (defaults to JOB_WORKER_THREADS)')
+    def jobs_worker(threads):
+        """Run queued background jobs until interrupted"""
+        from services.job_queue import get_job_queue
+
+        queue = get_job_queue()
+        if threads is not None:
+            queue.worker_threads = threads
+        if not queue.worker_threads:
+            raise click.ClickException("Nothing to run: use --threads or set JOB_WORKER_THREADS")
+        click.echo(f"Running jobs on {queue.worker_threads} threads (pid {os.getpid()})")
+        try:
+            queue.run_forever()
+        except KeyboardInterrupt:
+            pass
+
+    @app.cli.command('feature-store')
+    @click.option('--rewrite', is_flag=True, help='Rewrite from every stored feature instead of merging new ones')
+    def feature_store(rewrite):
+        """Bring the shared audio feature file up to date"""
+        from services.feature_store import get_feature_store
+
+        start = time.perf_counter()
+        summary = get_feature_store().update(rewrite=rewrite)
+        click.echo(f"Feature file {'rewritten' if summary['rewritten'] else 'updated'}: {summary['tracks']} tracks, "
+                   f"{summary['changed']} added or changed ({(time.perf_counter() - start) * 1000:.0f} ms)")
+
+    @app.cli.command('similarity-index')
+    @click.option('--rebuild', is_flag=True, help='Rebuild from scratch instead of adding new tracks')
+    def similarity_index(rebuild):
+        """Bring the track similarity index file up to date"""
+        from services.similarity_store import get_similarity_store
+
+        start = time.perf_counter()
+        summary = get_similarity_store().update(rebuild=rebuild)
+        click.echo(f"Similarity index {'rebuilt' if summary['rebuilt'] else 'updated'}: {summary['tracks']} tracks, "
+                   f"{summary['inserted']} new ({(time.perf_counter() - start) * 1000:.0f} ms)")
@@ -1,11 +1,11 @@
 # separate config file so can determine environment settings, security, app behavior, etc.
 
 from dotenv import load_dotenv
+import importlib.util
 import os
-try:
-    import redis
-except ImportError:
-    redis = None  # Redis is optional if using filesystem sessions
+
+# Redis is optional if using filesystem sessions; the client itself is created in create_app()
+REDIS_AVAILABLE = importlib.util.find_spec("redis") is not None
 
 load_dotenv()
 
@@ -14,6 +14,16 @@ load_dotenv()
 ENV = os.environ.get("RAILWAY_ENVIRONMENT") or os.environ.get("FLASK_ENV", "development")
 
 
+def optional_env(name, cast):
+    """Read an env var that is None (profile default) when unset"""
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return None
+    if cast is bool:
+        return value.lower() == "true"
+    return cast(value)
+
+
 class ApplicationConfig:
     SECRET_KEY = os.environ.get("SECRET_KEY")  # using secret key from .env
 
@@ -32,21 +42,53 @@ class ApplicationConfig:
         SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
         if not SQLALCHEMY_DATABASE_URI:
             raise ValueError("DATABASE_URL must be set in production environment")
+    # Create missing tables on boot (local convenience); deploys run `flask init-db` instead
+    DB_CREATE_ALL = os.environ.get("DB_CREATE_ALL", str(ENV == "development")).lower() == "true"
+
+    # --database engine-- (services/db_engine.py; every gunicorn worker has its own pool)
+    GUNICORN_WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
+    GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", 1))
+    DB_REQUEST_THREADS = GUNICORN_THREADS
+    DB_ENGINE_PROFILE = os.environ.get("DB_ENGINE_PROFILE", "development" if ENV == "development" else "production")
+    DB_POOL_SIZE = optional_env("DB_POOL_SIZE", int)  # default: request threads + 2 per job thread + 1 (see db_engine)
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", DB_REQUEST_THREADS))  # short bursts above pool_size
+    DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", 0))  # server limit shared by all workers (0 = no cap)
+    DB_POOL_SLOW_CHECKOUT = float(os.environ.get("DB_POOL_SLOW_CHECKOUT", 0.1))  # log checkouts slower than this (s)
+    # Profile overrides (unset = use the DB_ENGINE_PROFILE value)
+    DB_POOL_PRE_PING = optional_env("DB_POOL_PRE_PING", bool)
+    DB_POOL_RECYCLE = optional_env("DB_POOL_RECYCLE", int)  # seconds; -1 disables
+    DB_POOL_TIMEOUT = optional_env("DB_POOL_TIMEOUT", float)  # seconds to wait for a connection
+    DB_STATEMENT_TIMEOUT_MS = optional_env("DB_STATEMENT_TIMEOUT_MS", int)  # PostgreSQL statement_timeout; 0 disables
+    DB_QUERY_CACHE_SIZE = optional_env("DB_QUERY_CACHE_SIZE", int)  # compiled SQL statements cached per engine
+
+    # --password hashing-- (bcrypt runs on a per-worker process pool)
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))  # raising it upgrades hashes on next login
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))  # per host, shared by the workers; 0 = inline
+    PASSWORD_HASH_QUEUE_SIZE = optional_env("PASSWORD_HASH_QUEUE_SIZE", int)  # per worker; default 4 x its processes
+    PASSWORD_HASH_ADMISSION_TIMEOUT = float(os.environ.get("PASSWORD_HASH_ADMISSION_TIMEOUT", 0.05))  # seconds
+    PASSWORD_HASH_RETRY_AFTER = int(os.environ.get("PASSWORD_HASH_RETRY_AFTER", 1))  # Retry-After on 503
+
+    # --User cache-- (per worker; invalidated across workers via Redis pub/sub when available)
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 300))  # upper bound on staleness if a broadcast is missed
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", 10000))
 
     # --session-- configurations
     SESSION_PERMANENT = False  # dont want session to be permanent, will end when user logs out
     SESSION_USE_SIGNER = True  # uses secret key signer to allow access into app
     PERMANENT_SESSION_LIFETIME = 3600  # session will last for 1 hour
+    SESSION_REFRESH_EACH_REQUEST = False  # only write sessions that changed...
+    SESSION_TOUCH_INTERVAL = int(os.environ.get("SESSION_TOUCH_INTERVAL", 300))  # ...or are this old (s) and in use
+    TOKEN_VAULT_TTL = int(os.environ.get("TOKEN_VAULT_TTL", 30 * 86400))  # Redis: keep Spotify tokens this long after last write
     SESSION_COOKIE_PATH = '/'  # Cookie available for all paths
     
     # Session storage: Use Redis if available, otherwise fall back to filesystem
     # Railway uses REDIS_URL, Heroku uses REDISCLOUD_URL
-    redis_url = os.environ.get("REDIS_URL") or os.environ.get("REDISCLOUD_URL")
+    REDIS_URL = os.environ.get("REDIS_URL") or os.environ.get("REDISCLOUD_URL")
     
-    if redis_url and redis:
+    if REDIS_URL and REDIS_AVAILABLE:
         # Use Redis if URL is provided (better for production, especially with multiple instances)
         SESSION_TYPE = 'redis'
-        SESSION_REDIS = redis.from_url(redis_url)
+        SESSION_REDIS = None  # built from REDIS_URL by create_app()
         # Cookie settings for production HTTPS with cross-origin
         SESSION_COOKIE_SECURE = True  # True for production HTTPS
         SESSION_COOKIE_SAMESITE = 'None'  # Required for cross-site cookies with HTTPS
@@ -55,7 +97,8 @@ class ApplicationConfig:
     else:
         # Fall back to filesystem sessions (works fine for single-instance deployments)
         SESSION_TYPE = 'filesystem'
-        SESSION_FILE_DIR = './flask_session'  # Directory to store session files
+        SESSION_FILE_DIR = './flask_session'  # Directory to store session files (sharded by hash)
+        SESSION_SWEEP_INTERVAL = int(os.environ.get("SESSION_SWEEP_INTERVAL", 600))  # seconds between expiry sweeps
         # Cookie settings based on environment
         if ENV == "development":
             SESSION_COOKIE_SECURE = False  # False for local HTTP development
@@ -72,6 +115,52 @@ class ApplicationConfig:
     # --Frontend-- (for OAuth redirects back to app)
     FRONTEND_URL = (os.environ.get("FRONTEND_URL") or "http://localhost:3000").rstrip("/")
 
+    # --Playlist cache-- (Redis when SESSION_REDIS is set, in-process otherwise)
+    PLAYLIST_CACHE_TTL = int(os.environ.get("PLAYLIST_CACHE_TTL", 300))  # seconds a listing is served from cache
+    PLAYLIST_CACHE_ENTRY_TTL = int(os.environ.get("PLAYLIST_CACHE_ENTRY_TTL", 86400))  # snapshot-validated entries
+    PLAYLIST_CACHE_MAX_ENTRIES = int(os.environ.get("PLAYLIST_CACHE_MAX_ENTRIES", 2000))  # LRU bound
+
+    # --Library sync-- (/playlists and mood playlists read the database after a recent sync)
+    LIBRARY_SYNC_MAX_AGE = int(os.environ.get("LIBRARY_SYNC_MAX_AGE", 3600))  # seconds a sync is trusted
+
+    # --Library search-- (per-worker inverted indexes of synced libraries)
+    SEARCH_INDEX_MAX_USERS = int(os.environ.get("SEARCH_INDEX_MAX_USERS", 200))  # LRU bound per worker
+    SEARCH_INDEX_IDLE_TTL = int(os.environ.get("SEARCH_INDEX_IDLE_TTL", 1800))  # seconds an unused index is kept
+    SEARCH_INDEX_CHECK_INTERVAL = float(os.environ.get("SEARCH_INDEX_CHECK_INTERVAL", 5))  # seconds between sync checks
+
+    # --Audio features-- (shared by all users; per-process LRU plus Redis when SESSION_REDIS is set)
+    AUDIO_FEATURE_CACHE_TTL = int(os.environ.get("AUDIO_FEATURE_CACHE_TTL", 604800))  # features rarely change
+    AUDIO_FEATURE_CACHE_MAX_ENTRIES = int(os.environ.get("AUDIO_FEATURE_CACHE_MAX_ENTRIES", 50000))  # per worker
+    AUDIO_FEATURE_SHARED_MAX_ENTRIES = int(os.environ.get("AUDIO_FEATURE_SHARED_MAX_ENTRIES", 200000))  # in Redis
+
+    # --Mood playlists-- (tracks are pulled from saved tracks plus the user's first N playlists)
+    MOOD_SOURCE_PLAYLISTS = int(os.environ.get("MOOD_SOURCE_PLAYLISTS", 20))  # used when playlist_ids isn't given
+
+    # --Feature store-- (normalized audio features for mood scoring, one mapped file per host)
+    FEATURE_STORE_PATH = os.environ.get("FEATURE_STORE_PATH", "./data/features.col")  # shared by all workers
+    FEATURE_STORE_CHECK_INTERVAL = int(os.environ.get("FEATURE_STORE_CHECK_INTERVAL", 30))  # seconds between file checks
+    FEATURE_STORE_REFRESH_INTERVAL = int(os.environ.get("FEATURE_STORE_REFRESH_INTERVAL", 600))  # readers have an older file updated in the background
+    FEATURE_STORE_COMPACT_INTERVAL = int(os.environ.get("FEATURE_STORE_COMPACT_INTERVAL", 86400))  # full rewrite after this
+
+    # --Similarity index-- (LSH over every synced track's audio features, one mapped file per host)
+    SIMILARITY_INDEX_PATH = os.environ.get("SIMILARITY_INDEX_PATH", "./data/similarity.idx")  # shared by all workers
+    SIMILARITY_INDEX_TABLES = int(os.environ.get("SIMILARITY_INDEX_TABLES", 10))  # more tables, better recall
+    SIMILARITY_INDEX_HASHES = int(os.environ.get("SIMILARITY_INDEX_HASHES", 6))  # more hashes, smaller buckets
+    SIMILARITY_INDEX_EXACT_MAX = int(os.environ.get("SIMILARITY_INDEX_EXACT_MAX", 20000))  # scan below this many tracks
+    SIMILARITY_INDEX_CHECK_INTERVAL = int(os.environ.get("SIMILARITY_INDEX_CHECK_INTERVAL", 30))  # seconds between file checks
+    SIMILARITY_INDEX_REFRESH_INTERVAL = int(os.environ.get("SIMILARITY_INDEX_REFRESH_INTERVAL", 600))  # readers have an older file updated in the background
+    SIMILARITY_INDEX_COMPACT_INTERVAL = int(os.environ.get("SIMILARITY_INDEX_COMPACT_INTERVAL", 86400))  # full rebuild after this
+
+    # --Background jobs-- (library syncs, mood playlists; Redis queue when SESSION_REDIS is set, database otherwise)
+    JOB_WORKER_THREADS = int(os.environ.get("JOB_WORKER_THREADS", 2))  # per web worker; 0 leaves jobs to `flask jobs-worker`
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))  # tries before a job is marked failed
+    JOB_RETRY_BACKOFF = float(os.environ.get("JOB_RETRY_BACKOFF", 5.0))  # seconds before the first retry (doubles)
+    JOB_RETRY_BACKOFF_MAX = float(os.environ.get("JOB_RETRY_BACKOFF_MAX", 300.0))
+    JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 900))  # running longer than this counts as a lost worker
+    JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", 86400))  # seconds finished jobs stay pollable
+    JOB_POLL_INTERVAL = int(os.environ.get("JOB_POLL_INTERVAL", 1))  # Retry-After hint for status polling
+    JOB_SPOTIFY_MAX_WAIT = float(os.environ.get("JOB_SPOTIFY_MAX_WAIT", 30.0))  # jobs queue for Spotify quota this long
+
     # --Spotify API-- configurations
     SPOTIFY_CLIENT_ID = os.environ.get("CLIENT_ID")
     SPOTIFY_CLIENT_SECRET = os.environ.get("CLIENT_SECRET")
@@ -81,3 +170,38 @@ class ApplicationConfig:
     SPOTIFY_AUTH_URL = "https://accounts.spotify.com/authorize"
     SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
     SPOTIFY_API_BASE_URL = "https://api.spotify.com/v1/"
+
+    # --Spotify HTTP client-- (shared keep-alive pool, one per worker process)
+    SPOTIFY_HTTP_POOL_CONNECTIONS = int(os.environ.get("SPOTIFY_HTTP_POOL_CONNECTIONS", 4))  # distinct hosts pooled
+    SPOTIFY_HTTP_POOL_MAXSIZE = int(os.environ.get("SPOTIFY_HTTP_POOL_MAXSIZE", 20))  # keep-alive connections per host
+    SPOTIFY_HTTP_CONNECT_TIMEOUT = float(os.environ.get("SPOTIFY_HTTP_CONNECT_TIMEOUT", 3.05))
+    SPOTIFY_HTTP_READ_TIMEOUT = float(os.environ.get("SPOTIFY_HTTP_READ_TIMEOUT", 10))
+    SPOTIFY_HTTP_MAX_RETRIES = int(os.environ.get("SPOTIFY_HTTP_MAX_RETRIES", 3))  # retries on 429/5xx
+    SPOTIFY_HTTP_BACKOFF_FACTOR = float(os.environ.get("SPOTIFY_HTTP_BACKOFF_FACTOR", 0.5))
+    SPOTIFY_HTTP_BACKOFF_MAX = float(os.environ.get("SPOTIFY_HTTP_BACKOFF_MAX", 10))  # also caps Retry-After waits
+    SPOTIFY_ASYNC_MAX_CONNECTIONS = int(os.environ.get("SPOTIFY_ASYNC_MAX_CONNECTIONS", 200))  # async in-flight calls per worker
+    SPOTIFY_PAGINATION_CONCURRENCY = int(os.environ.get("SPOTIFY_PAGINATION_CONCURRENCY", 4))  # pages fetched in parallel
+    SPOTIFY_TOKEN_REFRESH_WINDOW = int(os.environ.get("SPOTIFY_TOKEN_REFRESH_WINDOW", 300))  # refresh this long before expiry
+    SPOTIFY_TOKEN_REFRESH_LOCK_TIMEOUT = int(os.environ.get("SPOTIFY_TOKEN_REFRESH_LOCK_TIMEOUT", 10))  # wait for another worker's refresh
+
+    # --Spotify rate limiting-- (app-wide quota shared through Redis, plus a per-user share)
+    SPOTIFY_RATE_LIMIT_ENABLED = os.environ.get("SPOTIFY_RATE_LIMIT_ENABLED", "true").lower() == "true"
+    SPOTIFY_RATE_LIMIT_RATE = float(os.environ.get("SPOTIFY_RATE_LIMIT_RATE", 25.0))  # calls/second for the whole app
+    SPOTIFY_RATE_LIMIT_BURST = int(os.environ.get("SPOTIFY_RATE_LIMIT_BURST", 100))
+    SPOTIFY_RATE_LIMIT_USER_RATE = float(os.environ.get("SPOTIFY_RATE_LIMIT_USER_RATE", 5.0))  # calls/second per user
+    SPOTIFY_RATE_LIMIT_USER_BURST = int(os.environ.get("SPOTIFY_RATE_LIMIT_USER_BURST", 50))
+    SPOTIFY_RATE_LIMIT_MAX_WAIT = float(os.environ.get("SPOTIFY_RATE_LIMIT_MAX_WAIT", 2.0))  # longer waits get 429 + Retry-After
+
+    # --Background token refresh-- (Redis sessions only; leader worker scans session store)
+    TOKEN_SCHEDULER_ENABLED = os.environ.get("TOKEN_SCHEDULER_ENABLED", "false").lower() == "true"
+    TOKEN_SCHEDULER_SCAN_INTERVAL = int(os.environ.get("TOKEN_SCHEDULER_SCAN_INTERVAL", 60))  # seconds
+    TOKEN_SCHEDULER_HORIZON = int(os.environ.get("TOKEN_SCHEDULER_HORIZON", 900))  # queue tokens expiring this soon
+    TOKEN_SCHEDULER_LEAD = int(os.environ.get("TOKEN_SCHEDULER_LEAD", 120))  # refresh this long before request-time window
+    TOKEN_SCHEDULER_ACTIVE_WITHIN = int(os.environ.get("TOKEN_SCHEDULER_ACTIVE_WITHIN", 1800))  # "hot" session cutoff
+    TOKEN_SCHEDULER_RATE = float(os.environ.get("TOKEN_SCHEDULER_RATE", 2.0))  # token endpoint calls/second
+    TOKEN_SCHEDULER_BURST = int(os.environ.get("TOKEN_SCHEDULER_BURST", 5))
+
+    # --Metrics-- (bearer token required to scrape /metrics)
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    # Without a token /metrics is refused, except in development or when explicitly made public
+    METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", str(ENV == "development")).lower() == "true"
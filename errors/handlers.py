@@ -5,6 +5,8 @@ from flask import jsonify
 from sqlalchemy.exc import SQLAlchemyError
 from services.auth_service import AuthService
 from utils.validators import ValidationError
+from services.password_hasher import PasswordHasherBusyError
+from services.spotify_rate_limiter import SpotifyRateLimitedError
 
 
 def register_error_handlers(app):
@@ -31,6 +33,23 @@ def register_error_handlers(app):
             'message': str(error)
         }), 400
     
+    @app.errorhandler(PasswordHasherBusyError)
+    def handle_hasher_busy_error(error):
+        """Handle saturated password hashing pool"""
+        return jsonify({
+            'error': 'Service Busy',
+            'message': str(error)
+        }), 503, {'Retry-After': str(error.retry_after)}
+    
+    @app.errorhandler(SpotifyRateLimitedError)
+    def handle_spotify_rate_limited_error(error):
+        """Handle Spotify calls turned away by the rate limiter"""
+        return jsonify({
+            'error': 'Too Many Requests',
+            'message': str(error),
+            'retry_after': error.retry_after
+        }), 429, {'Retry-After': str(error.retry_after)}
+    
     @app.errorhandler(SQLAlchemyError)
     def handle_database_error(error):
         """Handle database errors"""
@@ -0,0 +1,75 @@
+# gunicorn settings, shared by the Procfile and railway.json start command
+#
+# Worker class is picked from the environment so the same app can run as:
+#   sync (default)                        - one request per worker at a time
+#   gthread (+ GUNICORN_THREADS)          - threaded workers
+#
+# A request holds its worker thread throughout, async views included; what those
+# views gain is that the Spotify calls they fan out run concurrently on the worker's
+# event loop (services/async_runtime.py).
+
+import os
+import shutil
+
+# Workers write Prometheus samples here so /metrics can aggregate across processes.
+# Must be set before the app (and prometheus_client) is imported in the workers.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/nowtify-metrics")
+# preload_app imports the app (and creates metric files) before on_starting runs
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+wsgi_app = "app:app"
+
+# Import and build the app once in the master; workers fork with it already loaded
+# (per-worker pools, threads and process pools are created lazily after fork)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def on_starting(server):
+    """Start each deploy with an empty metrics directory"""
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop live-gauge files of dead workers (histograms are kept)"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """Drop database connections a preloaded master may have opened"""
+    if not server.cfg.preload_app:
+        return
+    from app import app
+    from models import db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    """Start per-worker background threads once the app is loaded"""
+    from app import app
+    from services.token_scheduler import start_token_scheduler
+    app.extensions["password_hasher"].warm_up()
+    start_token_scheduler(app)
+    app.extensions["job_queue"].start_workers()
+
+
+def worker_exit(server, worker):
+    """Stop per-worker background resources on shutdown"""
+    from services.async_runtime import shutdown_runtime
+    shutdown_runtime()
+
+    from app import app
+    from services.token_scheduler import stop_token_scheduler
+    stop_token_scheduler(app)
+    app.extensions["job_queue"].stop()
+    app.extensions["user_cache"].stop()
+    app.extensions["password_hasher"].shutdown()
@@ -20,6 +20,135 @@ class User(db.Model):
     password = db.Column(db.String(128), nullable = False)
 
 
+class SpotifyToken(db.Model):
+    __tablename__ = 'spotify_tokens'  # the token vault without Redis (see services/token_vault.py)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id', ondelete = 'CASCADE'), primary_key = True)
+    access_token = db.Column(db.Text, nullable = False)
+    refresh_token = db.Column(db.Text)
+    expires_at = db.Column(db.Float, nullable = False)  # unix timestamp
+    updated_at = db.Column(db.Float, nullable = False)
+
+
+# --synced Spotify library-- (filled by services/library_sync.py, read by services/library_store.py)
+    # tracks, audio features and playlist contents are shared by every user that has them;
+    # user_playlists/saved_tracks say which of them belong to whom
+
+class Track(db.Model):
+    __tablename__ = 'tracks'
+    id = db.Column(db.String(64), primary_key = True)  # Spotify track ID
+    name = db.Column(db.String(512), nullable = False, default = '')
+    uri = db.Column(db.String(128))
+    artists = db.Column(db.JSON, nullable = False, default = list)  # [{'id', 'name'}, ...]
+    album_name = db.Column(db.String(512))
+
+
+# Audio features stored per track, in the column order the mood engine uses
+FEATURE_COLUMNS = (
+    'valence', 'energy', 'danceability', 'acousticness',
+    'instrumentalness', 'speechiness', 'liveness', 'tempo', 'loudness'
+)
+
+
+class AudioFeature(db.Model):
+    __tablename__ = 'audio_features'
+    track_id = db.Column(db.String(64), db.ForeignKey('tracks.id', ondelete = 'CASCADE'), primary_key = True)
+    valence = db.Column(db.Float)
+    energy = db.Column(db.Float)
+    danceability = db.Column(db.Float)
+    acousticness = db.Column(db.Float)
+    instrumentalness = db.Column(db.Float)
+    speechiness = db.Column(db.Float)
+    liveness = db.Column(db.Float)
+    tempo = db.Column(db.Float)
+    loudness = db.Column(db.Float)
+    fetched_at = db.Column(db.Float, nullable = False)  # unix timestamp
+
+
+class Playlist(db.Model):
+    __tablename__ = 'playlists'
+    id = db.Column(db.String(64), primary_key = True)  # Spotify playlist ID
+    name = db.Column(db.String(512), nullable = False, default = '')
+    snapshot_id = db.Column(db.String(128))  # latest snapshot seen in the listing
+    tracks_snapshot_id = db.Column(db.String(128))  # snapshot playlist_tracks were synced at
+    owner_id = db.Column(db.String(128))
+    owner_name = db.Column(db.String(256))
+    public = db.Column(db.Boolean)
+    collaborative = db.Column(db.Boolean, nullable = False, default = False)
+    image_url = db.Column(db.String(1024))
+    track_count = db.Column(db.Integer, nullable = False, default = 0)
+
+
+class PlaylistTrack(db.Model):
+    __tablename__ = 'playlist_tracks'
+    playlist_id = db.Column(db.String(64), db.ForeignKey('playlists.id', ondelete = 'CASCADE'), primary_key = True)
+    position = db.Column(db.Integer, primary_key = True)
+    track_id = db.Column(db.String(64), db.ForeignKey('tracks.id'), nullable = False, index = True)
+    added_at = db.Column(db.String(32))  # ISO 8601 from Spotify
+
+
+class UserPlaylist(db.Model):
+    __tablename__ = 'user_playlists'
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id', ondelete = 'CASCADE'), primary_key = True)
+    playlist_id = db.Column(db.String(64), db.ForeignKey('playlists.id', ondelete = 'CASCADE'), primary_key = True)
+    position = db.Column(db.Integer, nullable = False)  # order in the user's Spotify listing
+
+
+class SavedTrack(db.Model):
+    __tablename__ = 'saved_tracks'
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id', ondelete = 'CASCADE'), primary_key = True)
+    track_id = db.Column(db.String(64), db.ForeignKey('tracks.id'), primary_key = True)
+    added_at = db.Column(db.String(32), nullable = False, index = True)  # ISO 8601, sorts chronologically
+
+
+class LibrarySyncState(db.Model):
+    __tablename__ = 'library_sync_state'
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id', ondelete = 'CASCADE'), primary_key = True)
+    saved_tracks_cursor = db.Column(db.String(32))  # newest saved-track added_at already stored
+    saved_tracks_skipped = db.Column(db.Integer, default = 0)  # saved items that aren't stored (local files, episodes)
+    playlists_etag = db.Column(db.String(64))  # ETag of the stored playlist listing (see utils/conditional.py)
+    synced_at = db.Column(db.Float)  # unix timestamp of the last completed sync
+
+
+# --playlist writes-- (progress of chunked writes back to Spotify, see services/playlist_writer.py)
+
+class PlaylistWrite(db.Model):
+    __tablename__ = 'playlist_writes'
+    id = db.Column(db.String(36), primary_key = True, default = get_uuid)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id', ondelete = 'CASCADE'), nullable = False, index = True)
+    operation = db.Column(db.String(16), nullable = False)  # create, add, replace or remove
+    playlist_id = db.Column(db.String(64))  # set once a 'create' has made the playlist
+    name = db.Column(db.String(512))  # create only
+    description = db.Column(db.String(512))
+    public = db.Column(db.Boolean, nullable = False, default = False)
+    uris = db.Column(db.JSON, nullable = False, default = list)  # every track URI of the write
+    position = db.Column(db.Integer)  # where added tracks start (fixed before the first chunk)
+    chunks_done = db.Column(db.Integer, nullable = False, default = 0)
+    snapshot_id = db.Column(db.String(128))  # playlist snapshot after the last applied chunk
+    attempts = db.Column(db.Integer, nullable = False, default = 0)
+    created_at = db.Column(db.Float, nullable = False)  # unix timestamp
+    completed_at = db.Column(db.Float)
+
+
+# --background jobs-- (queue and records when there is no Redis, see services/job_queue.py)
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    id = db.Column(db.String(32), primary_key = True)
+    record = db.Column(db.JSON, nullable = False)  # the job record returned by JobQueue.get
+    status = db.Column(db.String(16), nullable = False)
+    queued = db.Column(db.Boolean, nullable = False, default = False)  # waiting for a worker to claim it
+    run_at = db.Column(db.Float, nullable = False, default = 0)  # not claimed before this unix timestamp
+    updated_at = db.Column(db.Float, nullable = False)
+    __table_args__ = (db.Index('ix_jobs_queued_run_at', 'queued', 'run_at'),)
+
+
+class JobClaim(db.Model):
+    __tablename__ = 'job_claims'
+    key = db.Column(db.String(255), primary_key = True)  # job type, user and payload digest
+    job_id = db.Column(db.String(32), nullable = False)  # the user's pending job with that key
+    expires_at = db.Column(db.Float, nullable = False)
+
+
 
 
 
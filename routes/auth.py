@@ -2,13 +2,13 @@
 Authentication routes
 Handles user registration, login, logout, and current user info
 """
-from flask import Blueprint, request, session, jsonify
+from flask import Blueprint, request, session, jsonify, current_app
 from services.auth_service import AuthService
-from utils.decorators import login_required
+from services.password_hasher import PasswordHasherBusyError
+from services.user_cache import get_user_cache
+from utils.conditional import is_not_modified, make_etag, not_modified, with_etag
+from utils.decorators import login_required, load_current_user
 from utils.validators import validate_register_data, validate_login_data, ValidationError
-from flask_bcrypt import Bcrypt
-
-auth_bp = Blueprint('auth', __name__)
 
 
 def init_auth_routes(app, bcrypt_instance):
@@ -19,31 +19,37 @@ def init_auth_routes(app, bcrypt_instance):
         app: Flask application instance
         bcrypt_instance: Bcrypt instance for password hashing
     """
+    auth_bp = Blueprint('auth', __name__)
+    
     @auth_bp.route("/@me", methods=['GET'])
     @login_required
     def get_current_user():
-        """Get current logged-in user information. Never 500s; returns 401 if session invalid or user missing."""
+        """
+        Get current logged-in user information. Never 500s; returns 401 if session invalid or user missing.
+        
+        The user comes from the per-worker user cache, so polling doesn't hit
+        the database. The response carries an ETag of the user row; pollers
+        sending it back in If-None-Match get an empty 304.
+        """
         try:
-            auth_service = AuthService(bcrypt_instance)
             user_id = session.get('user_id')
             if not user_id:
                 return jsonify({'logged_in': False}), 401
-            user = auth_service.get_user_by_id(user_id)
+            user = load_current_user()
             if not user:
                 session.pop('user_id', None)
-                session.modified = True
                 return jsonify({'logged_in': False}), 401
-            return jsonify({
+            etag = make_etag('me', user.id, user.username)
+            if is_not_modified(etag):
+                return not_modified(etag, 'private, no-cache')
+            return with_etag(jsonify({
                 'logged_in': True,
                 'id': user.id,
                 'username': user.username
-            }), 200
-        except Exception as e:
-            import traceback
-            print(f"@me error: {e}")
-            traceback.print_exc()
+            }), etag, 'private, no-cache'), 200
+        except Exception:
+            current_app.logger.exception("@me failed")
             session.pop('user_id', None)
-            session.modified = True
             return jsonify({'logged_in': False, 'error': 'Session invalid'}), 401
     
     @auth_bp.route("/register", methods=['POST'])
@@ -60,9 +66,8 @@ def init_auth_routes(app, bcrypt_instance):
                 validated_data['password']
             )
             
-            # Set session and mark as modified to ensure cookie is sent
+            # Assigning marks the session modified, so it is saved and the cookie sent
             session['user_id'] = new_user.id
-            session.modified = True  # Explicitly mark session as modified
             
             return jsonify({
                 'id': new_user.id,
@@ -73,13 +78,11 @@ def init_auth_routes(app, bcrypt_instance):
             return jsonify({'message': str(e)}), 400
         except ValueError as e:
             return jsonify({'message': str(e)}), 400
+        except PasswordHasherBusyError:
+            raise  # answered with 503 and Retry-After by the error handler
         except Exception as e:
-            # Log the actual error for debugging
-            import traceback
-            error_msg = str(e)
-            print(f"Registration error: {error_msg}")
-            print(traceback.format_exc())
-            return jsonify({'message': f'An error occurred during registration: {error_msg}'}), 500
+            current_app.logger.exception("Registration failed")
+            return jsonify({'message': f'An error occurred during registration: {e}'}), 500
     
     @auth_bp.route("/user-login", methods=['POST'])
     def login():
@@ -96,9 +99,8 @@ def init_auth_routes(app, bcrypt_instance):
             )
             
             if user:
-                # Set session and mark as modified to ensure cookie is sent
+                # Assigning marks the session modified, so it is saved and the cookie sent
                 session['user_id'] = user.id
-                session.modified = True  # Explicitly mark session as modified
                 
                 return jsonify({
                     'logged_in': True,
@@ -110,23 +112,23 @@ def init_auth_routes(app, bcrypt_instance):
                 
         except ValidationError as e:
             return jsonify({'message': str(e)}), 400
+        except PasswordHasherBusyError:
+            raise  # answered with 503 and Retry-After by the error handler
         except Exception as e:
-            # Log the actual error for debugging
-            import traceback
-            error_msg = str(e)
-            print(f"Login error: {error_msg}")
-            print(traceback.format_exc())
-            return jsonify({'message': f'An error occurred during login: {error_msg}'}), 500
+            current_app.logger.exception("Login failed")
+            return jsonify({'message': f'An error occurred during login: {e}'}), 500
     
     @auth_bp.route('/logout', methods=['POST'])
     @login_required
     def logout():
-        """Logout user"""
-        session.pop('user_id', None)
-        session.pop('access_token', None)
-        session.pop('refresh_token', None)
-        session.pop('expires_at', None)
-        session.modified = True  # Mark session as modified
+        """
+        Logout user
+        
+        Ends this session only; Spotify tokens stay in the token vault for the
+        user's other sessions.
+        """
+        get_user_cache().invalidate(session['user_id'])
+        session.clear()
         return jsonify({'message': 'Logged out'}), 200
     
     app.register_blueprint(auth_bp)
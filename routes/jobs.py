@@ -0,0 +1,53 @@
+"""
+Job routes
+Status polling for work queued with the job queue
+"""
+from flask import Blueprint, session, jsonify, current_app
+from services.job_queue import get_job_queue, job_view, SUCCEEDED, FAILED
+from utils.decorators import login_required
+
+
+def job_accepted(job):
+    """
+    Build the 202 response for a queued job
+
+    Args:
+        job: Job record returned by JobQueue.enqueue
+
+    Returns:
+        tuple: (response, 202, headers) pointing the client at the status endpoint
+    """
+    return jsonify(job_view(job)), 202, {
+        'Location': f"/jobs/{job['id']}",
+        'Retry-After': str(current_app.config.get('JOB_POLL_INTERVAL', 1)),
+    }
+
+
+def init_jobs_routes(app):
+    """
+    Initialize job routes
+
+    Args:
+        app: Flask application instance
+    """
+    jobs_bp = Blueprint('jobs', __name__)
+
+    @jobs_bp.route("/jobs/<job_id>", methods=['GET'])
+    @login_required
+    def get_job(job_id):
+        """
+        Get a job's status, and its result once it has finished
+
+        Unfinished jobs carry a Retry-After header suggesting when to poll again.
+        """
+        job = get_job_queue().get(job_id)
+        if job is None or job['user_id'] != session['user_id']:
+            return jsonify({
+                'error': 'Not Found',
+                'message': 'Job not found'
+            }), 404
+        if job['status'] in (SUCCEEDED, FAILED):
+            return jsonify(job_view(job)), 200
+        return jsonify(job_view(job)), 200, {'Retry-After': str(current_app.config.get('JOB_POLL_INTERVAL', 1))}
+
+    app.register_blueprint(jobs_bp)
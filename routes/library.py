@@ -0,0 +1,107 @@
+"""
+Library routes
+Syncs the user's Spotify library into the database and reports its state
+"""
+from flask import Blueprint, request, session, jsonify, current_app
+from routes.jobs import job_accepted
+from services.job_queue import get_job_queue
+from services.library_store import LibraryStore
+from services.search_index import get_search_index
+from utils.decorators import login_required, spotify_auth_required
+from utils.streaming import json_stream, streaming_json_response, trim_track
+from utils.validators import validate_search_params, ValidationError
+import time
+
+
+def init_library_routes(app):
+    """
+    Initialize library routes
+    
+    Args:
+        app: Flask application instance
+    """
+    library_bp = Blueprint('library', __name__)
+    
+    @library_bp.route("/library/sync", methods=['POST'])
+    @login_required
+    @spotify_auth_required
+    def sync_library():
+        """
+        Queue a sync of the user's playlists, saved tracks and audio features
+        
+        Only changed playlists, newly saved tracks and tracks without stored
+        audio features are fetched, so repeat syncs are cheap. Answers 202
+        with the job (the same job while one is already pending); the sync
+        summary is the job's result at /jobs/<id>.
+        """
+        job = get_job_queue().enqueue('library_sync', session['user_id'])
+        return job_accepted(job)
+    
+    @library_bp.route("/library/status", methods=['GET'])
+    @login_required
+    def library_status():
+        """Get when the user's library was last synced"""
+        state = LibraryStore().get_sync_state(session['user_id'])
+        return jsonify({
+            'synced': state is not None and state.synced_at is not None,
+            'synced_at': state.synced_at if state else None
+        }), 200
+    
+    @library_bp.route("/library/tracks", methods=['GET'])
+    @login_required
+    def stream_library_tracks():
+        """
+        Stream every track in the user's synced library, ordered by name
+        
+        Written item by item from the database (gzip/brotli per
+        Accept-Encoding), so libraries with thousands of tracks start arriving
+        immediately and never sit in memory whole.
+        """
+        user_id = session['user_id']
+        store = LibraryStore()
+        if not store.is_synced(user_id, current_app.config.get('LIBRARY_SYNC_MAX_AGE', 3600)):
+            return jsonify({
+                'error': 'Library not synced',
+                'message': 'Sync your library before listing its tracks'
+            }), 409
+        
+        items = (trim_track(track) for track in store.iter_library_tracks(user_id))
+        chunks = json_stream(items, {'total': store.count_library_tracks(user_id)})
+        return streaming_json_response(chunks, request.headers.get('Accept-Encoding'))
+    
+    @library_bp.route("/library/search", methods=['GET'])
+    @login_required
+    def search_library():
+        """
+        Search the user's synced playlists and tracks
+        
+        Query: q (words to match; the last one may be partly typed), limit
+        and type ('playlist', 'track' or both). Matches playlist names, track
+        titles, artists and albums, tolerating small typos, from an
+        in-memory index, so it is quick enough for type-ahead.
+        """
+        try:
+            params = validate_search_params(request.args)
+        except ValidationError as e:
+            return jsonify({
+                'error': 'Validation Error',
+                'message': str(e)
+            }), 400
+        
+        user_id = session['user_id']
+        if not LibraryStore().is_synced(user_id, current_app.config.get('LIBRARY_SYNC_MAX_AGE', 3600)):
+            return jsonify({
+                'error': 'Library not synced',
+                'message': 'Sync your library before searching it'
+            }), 409
+        
+        started = time.perf_counter()
+        results = get_search_index().search(user_id, params['q'], params['limit'], params['types'])
+        return jsonify({
+            'query': params['q'],
+            'items': results,
+            'total': len(results),
+            'took_ms': round((time.perf_counter() - started) * 1000, 2)
+        }), 200
+    
+    app.register_blueprint(library_bp)
@@ -0,0 +1,39 @@
+"""
+Metrics routes
+Prometheus scrape endpoint
+"""
+import hmac
+
+from flask import Blueprint, Response, current_app, jsonify, request
+from utils.metrics import render_metrics
+
+
+def init_metrics_routes(app):
+    """
+    Initialize metrics routes
+    
+    Args:
+        app: Flask application instance
+    """
+    metrics_bp = Blueprint('metrics', __name__)
+    
+    @metrics_bp.route("/metrics", methods=['GET'])
+    def metrics():
+        """
+        Expose latency histograms and cache/scheduler counters in Prometheus format
+        
+        Requires METRICS_TOKEN as a bearer token; without one configured the
+        endpoint is only served when METRICS_PUBLIC is on (development).
+        """
+        token = current_app.config.get('METRICS_TOKEN')
+        if token:
+            supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            if not hmac.compare_digest(supplied, token):
+                return jsonify({'error': 'Unauthorized', 'message': 'Invalid metrics token'}), 401
+        elif not current_app.config.get('METRICS_PUBLIC', False):
+            return jsonify({'error': 'Forbidden', 'message': 'Set METRICS_TOKEN to enable /metrics'}), 403
+        
+        body, content_type = render_metrics(current_app)
+        return Response(body, content_type=content_type)
+    
+    app.register_blueprint(metrics_bp)
@@ -2,14 +2,28 @@
 Playlist routes
 Handles playlist-related operations
 """
-from flask import Blueprint, request, session, jsonify
+from flask import Blueprint, request, session, jsonify, current_app, g
+from routes.jobs import job_accepted
+from services.async_spotify_service import AsyncSpotifyService
+from services.job_queue import get_job_queue
+from services.library_store import LibraryStore
+from services.playlist_cache import get_playlist_cache
+from services.playlist_writer import RECONNECT_MESSAGE, PlaylistWriter
+from services.search_index import get_search_index
 from services.spotify_service import SpotifyService
+from services.spotify_rate_limiter import SpotifyRateLimitedError
+from utils.conditional import is_not_modified, not_modified, playlists_etag, with_etag
 from utils.decorators import login_required, spotify_auth_required
-from utils.validators import validate_playlist_unlink_data, ValidationError
+from utils.streaming import json_stream, streaming_json_response, trim_playlist
+from utils.validators import (
+    validate_playlist_unlink_data, validate_mood_data, validate_playlist_create_data,
+    validate_playlist_tracks_data, ValidationError
+)
+from models import db, PlaylistWrite
+import time
+import httpx
 import requests
 
-playlists_bp = Blueprint('playlists', __name__)
-
 
 def init_playlists_routes(app):
     """
@@ -18,42 +32,266 @@ def init_playlists_routes(app):
     Args:
         app: Flask application instance
     """
+    playlists_bp = Blueprint('playlists', __name__)
+    
+    def playlists_cache_control():
+        """Let the browser reuse a listing while both the cache entry and the Spotify token are valid"""
+        token_lifetime = g.spotify_tokens['expires_at'] - time.time()
+        max_age = int(max(0, min(current_app.config.get('PLAYLIST_CACHE_TTL', 300), token_lifetime)))
+        return f'private, max-age={max_age}, must-revalidate'
+    
+    def respond(playlists, etag):
+        """304 if the client already has this ETag, otherwise the listing with ETag headers"""
+        cache_control = playlists_cache_control()
+        if is_not_modified(etag):
+            return not_modified(etag, cache_control)
+        return with_etag(jsonify(playlists), etag, cache_control), 200
+    
     @playlists_bp.route("/playlists", methods=['GET'])
     @login_required
     @spotify_auth_required
-    def get_playlists():
-        """Get user's Spotify playlists"""
+    async def get_playlists():
+        """
+        Get user's Spotify playlists
+        
+        Returns the whole library by default; pass ?all=false (with optional
+        limit/offset) to get a single page. The full library is served from the
+        playlist cache or, after a recent library sync, the database;
+        ?refresh=true forces a Spotify fetch.
+        
+        Responses carry a weak ETag derived from the playlists' snapshot IDs;
+        a matching If-None-Match gets 304 without serializing the listing
+        (and, when the cache or database can answer, without calling Spotify).
+        """
         try:
-            spotify_service = SpotifyService()
-            access_token = session['access_token']
+            spotify_service = AsyncSpotifyService()
+            access_token = g.spotify_tokens['access_token']
+            fetch_all = request.args.get('all', 'true').lower() != 'false'
+            limit = min(max(request.args.get('limit', 50, type=int), 1), 50)
+            offset = max(request.args.get('offset', 0, type=int), 0)
+            
+            # Only the full library (from offset 0) is cached
+            cacheable = fetch_all and offset == 0
+            playlist_cache = get_playlist_cache()
+            if cacheable and request.args.get('refresh', 'false').lower() != 'true':
+                cached, etag = playlist_cache.get_listing(session['user_id'])
+                if cached is not None:
+                    return respond(cached, etag)
+                
+                store = LibraryStore()
+                state = store.get_fresh_sync_state(
+                    session['user_id'], current_app.config.get('LIBRARY_SYNC_MAX_AGE', 3600)
+                )
+                # No ETag: changed on Spotify since the sync (see LibraryStore.mark_playlists_stale)
+                if state is not None and state.playlists_etag is not None:
+                    etag = state.playlists_etag
+                    if is_not_modified(etag):
+                        return not_modified(etag, playlists_cache_control())
+                    return respond(store.get_playlists(session['user_id']), etag)
             
             # Get playlists from Spotify
-            playlists = spotify_service.get_user_playlists(access_token)
+            playlists = await spotify_service.get_user_playlists(
+                access_token, limit=limit, offset=offset, fetch_all=fetch_all
+            )
+            if cacheable and not playlists.get('partial'):
+                playlist_cache.set_playlists(session['user_id'], playlists)
             
-            return jsonify(playlists), 200
+            if cacheable:
+                etag = playlists_etag(playlists.get('items', []), 'spotify')
+            else:
+                etag = playlists_etag(playlists.get('items', []), 'spotify', fetch_all, limit, offset,
+                                      playlists.get('total'))
+            return respond(playlists, etag)
             
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             return jsonify({
                 'error': 'Failed to fetch playlists',
                 'message': 'Could not retrieve playlists from Spotify'
-            }), e.response.status_code if hasattr(e, 'response') else 500
+            }), e.response.status_code
+        except SpotifyRateLimitedError:
+            raise  # answered with 429 and Retry-After by the error handler
         except Exception as e:
             return jsonify({
                 'error': 'Playlist fetch error',
                 'message': 'An error occurred while fetching playlists'
             }), 500
     
+    @playlists_bp.route("/playlists/stream", methods=['GET'])
+    @login_required
+    @spotify_auth_required
+    def stream_playlists():
+        """
+        Stream the user's playlists as they are read
+        
+        Same JSON shape as /playlists but trimmed to the fields the frontend
+        uses, written item by item (gzip/brotli per Accept-Encoding). Reads
+        the database after a recent library sync, otherwise Spotify page by
+        page; ?refresh=true forces Spotify. 'partial' at the end of the body
+        reports whether the listing was cut short.
+        """
+        user_id = session['user_id']
+        store = LibraryStore()
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        
+        if not refresh and store.is_synced(user_id, current_app.config.get('LIBRARY_SYNC_MAX_AGE', 3600)):
+            items = (trim_playlist(playlist) for playlist in store.iter_playlists(user_id))
+            header = {'total': store.count_playlists(user_id), 'source': 'db'}
+            chunks = json_stream(items, header, lambda: {'partial': False, 'next': None})
+            return streaming_json_response(chunks, request.headers.get('Accept-Encoding'))
+        
+        # Fetch the first page up front so Spotify errors still get a proper status
+        pages = SpotifyService().iter_user_playlists(g.spotify_tokens['access_token'])
+        try:
+            first_page = next(pages)
+        except requests.exceptions.HTTPError as e:
+            return jsonify({
+                'error': 'Failed to fetch playlists',
+                'message': 'Could not retrieve playlists from Spotify'
+            }), e.response.status_code if e.response is not None else 502
+        except requests.exceptions.RequestException:
+            return jsonify({
+                'error': 'Playlist fetch error',
+                'message': 'An error occurred while fetching playlists'
+            }), 502
+        
+        footer = {'partial': False, 'next': None}
+        
+        def items():
+            page = first_page
+            try:
+                while page is not None:
+                    if page.get('partial'):
+                        footer.update(partial=True, next=page.get('next'))
+                    for playlist in page.get('items', []):
+                        if playlist:
+                            yield trim_playlist(playlist)
+                    page = next(pages, None)
+            except requests.exceptions.RequestException:
+                # Too late to change the status; report it in the body instead
+                footer.update(partial=True, error='Could not retrieve all playlists from Spotify')
+        
+        header = {'total': first_page.get('total', 0), 'source': 'spotify'}
+        return streaming_json_response(json_stream(items(), header, lambda: footer), request.headers.get('Accept-Encoding'))
+    
+    @playlists_bp.route("/playlists/mood", methods=['POST'])
+    @login_required
+    @spotify_auth_required
+    def generate_mood_playlist():
+        """
+        Queue ranking the user's tracks against a mood
+        
+        Body: {"mood": "happy"} and/or {"targets": {"valence": 0.8, "tempo": 120}},
+        plus optional "limit" (1-100) and "playlist_ids" to choose the source
+        playlists. Answers 202 with the job; the ranked tracks are the job's
+        result at /jobs/<id> (see services.jobs.build_mood_playlist).
+        """
+        # NumPy is only loaded once a mood playlist is actually requested
+        from services.mood_engine import MoodEngine
+        
+        try:
+            validated_data = validate_mood_data(request.get_json(silent=True))
+            MoodEngine().mood_vector(validated_data['mood'], validated_data['targets'])
+        except (ValidationError, ValueError) as e:
+            return jsonify({
+                'error': 'Validation Error',
+                'message': str(e)
+            }), 400
+        
+        job = get_job_queue().enqueue('mood_playlist', session['user_id'], validated_data)
+        return job_accepted(job)
+    
+    def queue_write(operation, playlist_id=None, **fields):
+        """Record a playlist write and queue the job that applies it"""
+        write = PlaylistWriter().create(session['user_id'], operation, playlist_id, **fields)
+        job = get_job_queue().enqueue('playlist_write', session['user_id'], {'write_id': write.id})
+        return job_accepted(job)
+    
+    def validation_error(e):
+        return jsonify({
+            'error': 'Validation Error',
+            'message': str(e)
+        }), 400
+    
+    @playlists_bp.route("/playlists", methods=['POST'])
+    @login_required
+    @spotify_auth_required
+    def create_playlist():
+        """
+        Queue creating a Spotify playlist, optionally filled with tracks
+        
+        Body: {"name": "...", "description": "...", "public": false, "uris": [...]}
+        (e.g. the URIs of a mood playlist result). Answers 202 with the job;
+        its result has the new playlist's ID and snapshot ID.
+        """
+        try:
+            validated_data = validate_playlist_create_data(request.get_json(silent=True))
+        except ValidationError as e:
+            return validation_error(e)
+        return queue_write('create', **validated_data)
+    
+    @playlists_bp.route("/playlists/<playlist_id>/tracks", methods=['POST', 'PUT', 'DELETE'])
+    @login_required
+    @spotify_auth_required
+    def write_playlist_tracks(playlist_id):
+        """
+        Queue adding (POST), replacing (PUT) or removing (DELETE) playlist tracks
+        
+        Body: {"uris": [...]}, plus an optional "position" for POST (appends
+        by default). Any number of tracks up to Spotify's playlist limit;
+        they are sent PLAYLIST_WRITE_CHUNK_SIZE at a time. Answers 202 with the job.
+        """
+        try:
+            validated_data = validate_playlist_tracks_data(
+                request.get_json(silent=True), allow_empty=request.method == 'PUT'
+            )
+        except ValidationError as e:
+            return validation_error(e)
+        if request.method == 'POST':
+            return queue_write('add', playlist_id, uris=validated_data['uris'], position=validated_data['position'])
+        operation = 'replace' if request.method == 'PUT' else 'remove'
+        return queue_write(operation, playlist_id, uris=validated_data['uris'])
+    
+    @playlists_bp.route("/playlists/writes/<write_id>/resume", methods=['POST'])
+    @login_required
+    @spotify_auth_required
+    def resume_playlist_write(write_id):
+        """Queue a failed playlist write again; it continues from its first unapplied chunk"""
+        write = db.session.get(PlaylistWrite, write_id)
+        if write is None or write.user_id != session['user_id']:
+            return jsonify({
+                'error': 'Not Found',
+                'message': 'Playlist write not found'
+            }), 404
+        if write.completed_at is not None:
+            return jsonify({
+                'error': 'Already complete',
+                'message': 'This playlist write has already been applied'
+            }), 409
+        job = get_job_queue().enqueue('playlist_write', session['user_id'], {'write_id': write.id})
+        return job_accepted(job)
+    
     @playlists_bp.route("/unlink-playlist", methods=['POST'])
     @login_required
+    @spotify_auth_required
     def unlink_playlist():
-        """Unlink a playlist (placeholder for future implementation)"""
+        """
+        Remove a playlist from the user's synced library
+        
+        Drops it from the user's stored listing only. With {"unfollow": true}
+        it is also unfollowed on Spotify, which for a playlist the user owns
+        is how Spotify deletes it.
+        """
         try:
             # Validate input
             validated_data = validate_playlist_unlink_data(request.get_json())
             playlist_id = validated_data['playlist_id']
             
-            # TODO: Implement actual unlink logic
-            # This is a placeholder for future implementation
+            if validated_data['unfollow']:
+                SpotifyService().unfollow_playlist(g.spotify_tokens['access_token'], playlist_id)
+            LibraryStore().remove_playlist(session['user_id'], playlist_id)
+            db.session.commit()
+            get_playlist_cache().invalidate_user(session['user_id'])
+            get_search_index().invalidate(session['user_id'])
             
             return jsonify({
                 'success': True,
@@ -65,7 +303,20 @@ def init_playlists_routes(app):
                 'error': 'Validation Error',
                 'message': str(e)
             }), 400
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 403:
+                return jsonify({
+                    'error': 'Spotify permissions missing',
+                    'message': RECONNECT_MESSAGE
+                }), 403
+            return jsonify({
+                'error': 'Unlink failed',
+                'message': 'Spotify did not remove the playlist'
+            }), e.response.status_code if e.response is not None else 502
+        except SpotifyRateLimitedError:
+            raise  # answered with 429 and Retry-After by the error handler
         except Exception as e:
+            db.session.rollback()
             return jsonify({
                 'error': 'Unlink error',
                 'message': 'Failed to unlink playlist'
@@ -0,0 +1,112 @@
+"""
+Recommendation routes
+"More like these tracks" and mood blends over every synced track's audio features
+"""
+from flask import Blueprint, request, session, jsonify, current_app
+from models import db
+from services.library_store import LibraryStore
+from services.similarity_store import get_similarity_store
+from utils.decorators import login_required
+from utils.validators import validate_similar_data, validate_blend_data, ValidationError
+
+
+def init_recommendations_routes(app):
+    """
+    Initialize recommendation routes
+    
+    Args:
+        app: Flask application instance
+    """
+    recommendations_bp = Blueprint('recommendations', __name__)
+    
+    def validation_error(e):
+        return jsonify({
+            'error': 'Validation Error',
+            'message': str(e)
+        }), 400
+    
+    def library_scope(from_library):
+        """Track IDs results are limited to (None = every indexed track), or an error response"""
+        if not from_library:
+            return None, None
+        store = LibraryStore()
+        user_id = session['user_id']
+        if not store.is_synced(user_id, current_app.config.get('LIBRARY_SYNC_MAX_AGE', 3600)):
+            return None, (jsonify({
+                'error': 'Library not synced',
+                'message': 'Sync your library before asking for recommendations from it'
+            }), 409)
+        return db.session.execute(store.library_track_ids(user_id)).scalars().all(), None
+    
+    def recommendations_response(ranked, **extra):
+        tracks = LibraryStore().get_tracks([track_id for track_id, _ in ranked])
+        items = []
+        for track_id, score in ranked:
+            track = tracks.get(track_id, {'id': track_id})
+            items.append({
+                'id': track_id,
+                'name': track.get('name'),
+                'uri': track.get('uri'),
+                'artists': [artist.get('name') for artist in track.get('artists', [])],
+                'album': (track.get('album') or {}).get('name'),
+                'score': round(score, 4)
+            })
+        return jsonify(dict(extra, items=items, total=len(items))), 200
+    
+    @recommendations_bp.route("/recommendations/similar", methods=['POST'])
+    @login_required
+    def similar_tracks():
+        """
+        Tracks whose audio features are closest to any of the seed tracks
+        
+        Body: {"track_ids": [...]} (1-25 seeds), plus optional "limit" (1-100)
+        and "from_library" (only return the user's own synced tracks).
+        Candidates come from every track any user has synced; seeds without
+        stored audio features are listed in "missing".
+        """
+        try:
+            validated_data = validate_similar_data(request.get_json(silent=True))
+        except ValidationError as e:
+            return validation_error(e)
+        track_ids, error = library_scope(validated_data['from_library'])
+        if error is not None:
+            return error
+        
+        ranked, missing = get_similarity_store().similar(
+            validated_data['track_ids'], validated_data['limit'], track_ids
+        )
+        if len(missing) == len(validated_data['track_ids']):
+            return jsonify({
+                'error': 'Unknown seeds',
+                'message': 'None of the seed tracks have audio features yet; sync the library first',
+                'missing': missing
+            }), 404
+        return recommendations_response(ranked, missing=missing)
+    
+    @recommendations_bp.route("/recommendations/blend", methods=['POST'])
+    @login_required
+    def blend_moods():
+        """
+        Tracks closest to a blend of two to four moods
+        
+        Body: {"moods": [{"mood": "happy", "weight": 2}, {"targets": {"tempo": 90}}]},
+        plus optional "limit" (1-100) and "from_library".
+        """
+        # NumPy is only loaded once recommendations are actually requested
+        from services.mood_engine import MoodEngine
+        
+        try:
+            validated_data = validate_blend_data(request.get_json(silent=True))
+            target, weights = MoodEngine().blend(
+                (mood['mood'], mood['targets'], mood['weight']) for mood in validated_data['moods']
+            )
+        except (ValidationError, ValueError) as e:
+            return validation_error(e)
+        track_ids, error = library_scope(validated_data['from_library'])
+        if error is not None:
+            return error
+        
+        ranked = get_similarity_store().nearest(target, weights, validated_data['limit'], track_ids)
+        return recommendations_response(ranked)
+    
+    app.register_blueprint(recommendations_bp)
@@ -5,12 +5,16 @@ Handles Spotify authentication and token management
 from flask import Blueprint, request, session, jsonify, redirect, current_app
 from urllib.parse import urlencode
 from services.spotify_service import SpotifyService
+from services.async_spotify_service import AsyncSpotifyService
+from services.playlist_cache import get_playlist_cache
+from services.spotify_rate_limiter import SpotifyRateLimitedError
+from services.token_refresher import get_token_refresher, TokenRefreshBusyError
+from services.token_vault import get_token_vault
 from utils.decorators import login_required
 from datetime import datetime
+import httpx
 import requests
 
-spotify_bp = Blueprint('spotify', __name__)
-
 
 def init_spotify_routes(app):
     """
@@ -19,6 +23,8 @@ def init_spotify_routes(app):
     Args:
         app: Flask application instance
     """
+    spotify_bp = Blueprint('spotify', __name__)
+    
     # SpotifyService will use current_app.config when called from route handlers
     
     @spotify_bp.route("/spotify-login", methods=['GET'])
@@ -29,7 +35,8 @@ def init_spotify_routes(app):
             spotify_service = SpotifyService()
             scope = (
                 'user-read-private user-read-email user-library-read '
-                'playlist-read-private playlist-read-collaborative'
+                'playlist-read-private playlist-read-collaborative '
+                'playlist-modify-private playlist-modify-public'
             )
             auth_url = spotify_service.get_auth_url(scope=scope, show_dialog=True)
             return jsonify({'auth_url': auth_url}), 200
@@ -41,7 +48,7 @@ def init_spotify_routes(app):
     
     @spotify_bp.route("/callback", methods=['GET'])
     @login_required
-    def callback():
+    async def callback():
         """Legacy: backend callback (only works when request has session cookie, e.g. same origin as login)."""
         frontend_url = current_app.config.get("FRONTEND_URL", "http://localhost:3000")
         dashboard_url = f"{frontend_url}/dashboard"
@@ -59,20 +66,26 @@ def init_spotify_routes(app):
             if 'code' not in request.args:
                 return redirect_to_dashboard(error="no_code")
             code = request.args['code']
-            spotify_service = SpotifyService()
-            token_response = spotify_service.exchange_code_for_tokens(code)
-            session['access_token'] = token_response['access_token']
-            session['refresh_token'] = token_response.get('refresh_token')
-            session['expires_at'] = datetime.now().timestamp() + token_response['expires_in']
+            spotify_service = AsyncSpotifyService()
+            token_response = await spotify_service.exchange_code_for_tokens(code)
+            get_token_vault().set(session['user_id'], {
+                'access_token': token_response['access_token'],
+                'refresh_token': token_response.get('refresh_token'),
+                'expires_at': datetime.now().timestamp() + token_response['expires_in']
+            })
+            # A (re)connected Spotify account may not be the one we cached
+            get_playlist_cache().invalidate_user(session['user_id'])
             return redirect_to_dashboard(success=True)
-        except requests.exceptions.HTTPError:
+        except httpx.HTTPStatusError:
             return redirect_to_dashboard(error="token_exchange_failed")
+        except SpotifyRateLimitedError:
+            return redirect_to_dashboard(error="rate_limited")
         except Exception:
             return redirect_to_dashboard(error="callback_error")
 
     @spotify_bp.route("/spotify-exchange", methods=['POST'])
     @login_required
-    def spotify_exchange():
+    async def spotify_exchange():
         """
         Exchange Spotify auth code for tokens. Called by the frontend after user is
         redirected to the frontend with ?code=... so the request carries the session cookie.
@@ -84,14 +97,20 @@ def init_spotify_routes(app):
         if not code:
             return jsonify({"error": "Missing code", "message": "No authorization code"}), 400
         try:
-            spotify_service = SpotifyService()
-            token_response = spotify_service.exchange_code_for_tokens(code)
-            session['access_token'] = token_response['access_token']
-            session['refresh_token'] = token_response.get('refresh_token')
-            session['expires_at'] = datetime.now().timestamp() + token_response['expires_in']
+            spotify_service = AsyncSpotifyService()
+            token_response = await spotify_service.exchange_code_for_tokens(code)
+            get_token_vault().set(session['user_id'], {
+                'access_token': token_response['access_token'],
+                'refresh_token': token_response.get('refresh_token'),
+                'expires_at': datetime.now().timestamp() + token_response['expires_in']
+            })
+            # A (re)connected Spotify account may not be the one we cached
+            get_playlist_cache().invalidate_user(session['user_id'])
             return jsonify({"success": True, "redirect": dashboard_url}), 200
-        except requests.exceptions.HTTPError:
+        except httpx.HTTPStatusError:
             return jsonify({"error": "Token exchange failed"}), 400
+        except SpotifyRateLimitedError:
+            raise  # answered with 429 and Retry-After by the error handler
         except Exception:
             return jsonify({"error": "Callback error"}), 500
     
@@ -100,25 +119,16 @@ def init_spotify_routes(app):
     def refresh_token():
         """Refresh Spotify access token"""
         try:
-            if 'refresh_token' not in session:
+            tokens = get_token_vault().get(session['user_id'])
+            if not tokens or not tokens.get('refresh_token'):
                 return jsonify({
                     'error': 'No refresh token',
                     'message': 'Please connect your Spotify account first'
                 }), 401
             
-            # Check if token is expired
-            expires_at = session.get('expires_at', 0)
-            if datetime.now().timestamp() > expires_at:
-                spotify_service = SpotifyService()
-                refresh_token_value = session['refresh_token']
-                token_response = spotify_service.refresh_access_token(refresh_token_value)
-                
-                # Update session with new tokens
-                session['access_token'] = token_response['access_token']
-                if 'refresh_token' in token_response:
-                    session['refresh_token'] = token_response['refresh_token']
-                session['expires_at'] = datetime.now().timestamp() + token_response.get('expires_in', 3600)
-                
+            # Through the single-flight refresher: Spotify may rotate the refresh token,
+            # so a refresh racing another one would leave the loser's tokens invalid
+            if get_token_refresher().ensure_fresh(session['user_id'], tokens) is not None:
                 return jsonify({'success': True, 'message': 'Token refreshed'}), 200
             else:
                 return jsonify({'message': 'Token is still valid'}), 200
@@ -128,6 +138,13 @@ def init_spotify_routes(app):
                 'error': 'Token refresh failed',
                 'message': 'Failed to refresh Spotify token. Please reconnect your account.'
             }), 500
+        except TokenRefreshBusyError:
+            return jsonify({
+                'error': 'Refresh in progress',
+                'message': 'The token is being refreshed; try again shortly'
+            }), 503
+        except SpotifyRateLimitedError:
+            raise  # answered with 429 and Retry-After by the error handler
         except Exception as e:
             return jsonify({
                 'error': 'Refresh error',
@@ -0,0 +1,66 @@
+"""
+Async Runtime
+One long-lived event loop per worker process for outbound async I/O
+
+Flask runs each async view on a short-lived event loop, so anything that
+must outlive a request (like an httpx.AsyncClient and its keep-alive
+connections) lives on this loop instead and is awaited from the view.
+"""
+import asyncio
+import os
+import threading
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def get_runtime_loop():
+    """
+    Get the process-wide runtime loop, starting it on first use
+
+    The loop runs in a daemon thread. It is recreated after a fork so each
+    gunicorn worker gets its own loop.
+
+    Returns:
+        asyncio.AbstractEventLoop: Running runtime loop
+    """
+    global _loop, _loop_pid
+    if _loop is None or _loop_pid != os.getpid():
+        with _loop_lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name='async-runtime', daemon=True
+                )
+                thread.start()
+                _loop, _loop_pid = loop, os.getpid()
+    return _loop
+
+
+async def run_in_runtime(coro):
+    """
+    Await a coroutine on the runtime loop from any other event loop
+
+    Args:
+        coro: Coroutine to run
+
+    Returns:
+        The coroutine's result
+    """
+    loop = get_runtime_loop()
+    try:
+        if asyncio.get_running_loop() is loop:
+            return await coro
+    except RuntimeError:
+        pass
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def shutdown_runtime():
+    """Stop the runtime loop (called when a worker exits)"""
+    global _loop
+    with _loop_lock:
+        if _loop is not None and _loop_pid == os.getpid():
+            _loop.call_soon_threadsafe(_loop.stop)
+        _loop = None
@@ -0,0 +1,414 @@
+"""
+Async Spotify API Service
+Non-blocking counterpart of SpotifyService for async route handlers
+"""
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+
+from services.async_runtime import run_in_runtime
+from services.http_client import RETRY_STATUS_CODES
+from services.library_store import is_music_track
+from services.spotify_service import (
+    AUDIO_FEATURES_BATCH_SIZE,
+    PLAYLIST_TRACK_FIELDS,
+    PLAYLIST_TRACKS_PAGE_SIZE,
+    SAVED_TRACKS_PAGE_SIZE,
+    SKIPPABLE_STATUS_CODES,
+    is_throttled,
+)
+from services.spotify_rate_limiter import SpotifyRateLimitedError, get_spotify_rate_limiter, request_key
+from utils.metrics import timed, SPOTIFY_CALL_LATENCY
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_pid = None
+
+
+def _get_async_client(config):
+    """
+    Get the per-process httpx.AsyncClient (must be called on the runtime loop)
+
+    Args:
+        config: Flask app config object or dict with SPOTIFY_HTTP_* settings
+
+    Returns:
+        httpx.AsyncClient: Shared client with a bounded keep-alive pool
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        limits = httpx.Limits(
+            max_connections=config.get('SPOTIFY_ASYNC_MAX_CONNECTIONS', 200),  # in-flight calls per worker
+            max_keepalive_connections=config.get('SPOTIFY_HTTP_POOL_MAXSIZE', 20),
+        )
+        timeout = httpx.Timeout(
+            config.get('SPOTIFY_HTTP_READ_TIMEOUT', 10),
+            connect=config.get('SPOTIFY_HTTP_CONNECT_TIMEOUT', 3.05),
+            pool=config.get('SPOTIFY_HTTP_READ_TIMEOUT', 10),
+        )
+        _client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        _client_pid = os.getpid()
+    return _client
+
+
+def _page_tracks(page):
+    """Track objects of a saved-track or playlist-track paging object, music tracks only"""
+    return [item['track'] for item in page.get('items', []) if is_music_track(item.get('track'))]
+
+
+class AsyncSpotifyService:
+    """Async service for interacting with Spotify API"""
+
+    def __init__(self, config=None, rate_limiter=None, rate_limit_wait=None):
+        """
+        Initialize async Spotify service
+
+        Args:
+            config: Flask app config object or dict with Spotify config
+            rate_limiter: Optional SpotifyRateLimiter (defaults to the current app's, if any)
+            rate_limit_wait: Seconds to wait for rate limit quota (defaults to the limiter's max_wait)
+        """
+        if config is None:
+            from flask import current_app
+            config = current_app.config
+
+        # Plain dict so coroutines running on the runtime loop never touch current_app
+        self.config = {key: config.get(key) for key in config if key.startswith('SPOTIFY_')}
+        self.client_id = config.get('SPOTIFY_CLIENT_ID')
+        self.client_secret = config.get('SPOTIFY_CLIENT_SECRET')
+        self.redirect_uri = config.get('SPOTIFY_REDIRECT_URI')
+        self.token_url = config.get('SPOTIFY_TOKEN_URL')
+        self.api_base_url = config.get('SPOTIFY_API_BASE_URL')
+        self.page_concurrency = config.get('SPOTIFY_PAGINATION_CONCURRENCY', 4)
+        self.max_retries = config.get('SPOTIFY_HTTP_MAX_RETRIES', 3)
+        self.backoff_factor = config.get('SPOTIFY_HTTP_BACKOFF_FACTOR', 0.5)
+        self.backoff_max = config.get('SPOTIFY_HTTP_BACKOFF_MAX', 10)
+        self.limiter = rate_limiter or get_spotify_rate_limiter()
+        self.rate_limit_wait = rate_limit_wait
+
+    async def _request(self, method, url, access_token=None, **kwargs):
+        """
+        Send a request through the rate limiter, sharing identical in-flight GETs
+
+        Args:
+            method: HTTP method
+            url: Request URL
+            access_token: Spotify access token (None for token endpoint calls)
+
+        Returns:
+            dict: Parsed JSON body (shared with coalesced callers; don't modify it)
+
+        Raises:
+            SpotifyRateLimitedError: If the app or user is over its quota
+            httpx.HTTPStatusError: If the final response is an error
+        """
+        if access_token is not None:
+            kwargs['headers'] = {'Authorization': f"Bearer {access_token}"}
+        if self.limiter is None:
+            return await self._send(method, url, **kwargs)
+
+        async def send():
+            await self.limiter.acquire_async(access_token, self.rate_limit_wait)
+            return await self._send(method, url, **kwargs)
+
+        if method != 'GET':
+            return await send()
+        key = request_key(method, url, kwargs.get('params'), access_token)
+        return await self.limiter.coalesce_async(key, send)
+
+    async def _send(self, method, url, **kwargs):
+        """
+        Send a request on the shared client, retrying 429/5xx with backoff (POSTs only on 429)
+
+        Honors Spotify's Retry-After header (capped at SPOTIFY_HTTP_BACKOFF_MAX).
+
+        Returns:
+            dict: Parsed JSON body
+
+        Raises:
+            httpx.HTTPStatusError: If the final response is an error
+        """
+        client = _get_async_client(self.config)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.ConnectError:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            # As in SpotifyRetry: a POST that got a server error may still have been applied
+            # (e.g. an authorization code already exchanged), so only a 429 is replayed
+            if method == 'POST':
+                retryable = response.status_code == 429
+            else:
+                retryable = response.status_code in RETRY_STATUS_CODES
+            if not retryable or attempt == self.max_retries:
+                break
+            retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self._backoff(attempt)
+            await asyncio.sleep(min(delay, self.backoff_max))
+
+        if response.status_code == 429 and self.limiter is not None:
+            # Still throttled after our retries: pause every worker's calls
+            await self.limiter.throttled_async(response.headers.get('Retry-After'))
+        response.raise_for_status()
+        return response.json()
+
+    def _backoff(self, attempt):
+        """Exponential backoff with jitter for the given attempt number"""
+        return min(self.backoff_factor * (2 ** attempt) * random.uniform(0.5, 1.5), self.backoff_max)
+
+    @timed(SPOTIFY_CALL_LATENCY, 'exchange_code_for_tokens')
+    async def exchange_code_for_tokens(self, code):
+        """
+        Exchange authorization code for access and refresh tokens
+
+        Args:
+            code: Authorization code from Spotify callback
+
+        Returns:
+            dict: Token response containing access_token, refresh_token, expires_in
+        """
+        request_body = {
+            'code': code,
+            'grant_type': 'authorization_code',
+            'redirect_uri': self.redirect_uri,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret
+        }
+        return await run_in_runtime(self._request('POST', self.token_url, data=request_body))
+
+    @timed(SPOTIFY_CALL_LATENCY, 'refresh_access_token')
+    async def refresh_access_token(self, refresh_token):
+        """
+        Refresh access token using refresh token
+
+        Args:
+            refresh_token: Refresh token from previous authorization
+
+        Returns:
+            dict: New token response containing access_token, expires_in
+        """
+        request_body = {
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret
+        }
+        return await run_in_runtime(self._request('POST', self.token_url, data=request_body))
+
+    @timed(SPOTIFY_CALL_LATENCY, 'get_user_playlists')
+    async def get_user_playlists(self, access_token, limit=50, offset=0, fetch_all=False):
+        """
+        Get user's playlists from Spotify
+
+        Args:
+            access_token: Spotify access token
+            limit: Number of playlists to retrieve (max 50)
+            offset: Offset for pagination
+            fetch_all: Fetch every page after offset and merge them into one response
+
+        Returns:
+            dict: Playlists response, same shape as SpotifyService.get_user_playlists
+        """
+        return await run_in_runtime(self._get_user_playlists(access_token, limit, offset, fetch_all))
+
+    async def _get_user_playlists(self, access_token, limit, offset, fetch_all):
+        url = f"{self.api_base_url}me/playlists"
+        return await self._get_paged(url, access_token, limit, offset, fetch_all)
+
+    async def _get_paged(self, url, access_token, limit, offset, fetch_all, params=None):
+        """
+        Get one page of a Spotify paging object, or every page from offset on
+
+        Args:
+            url: Endpoint returning a paging object
+            access_token: Spotify access token
+            limit: Page size
+            offset: Offset of the first page
+            fetch_all: Fetch and merge the remaining pages too
+            params: Extra query parameters sent with every page
+
+        Returns:
+            dict: Paging object (merged when fetch_all)
+        """
+        async def fetch_page(page_offset):
+            page_params = dict(params or {}, limit=limit, offset=page_offset)
+            return await self._request('GET', url, access_token, params=page_params)
+
+        first_page = await fetch_page(offset)
+        if not fetch_all:
+            return first_page
+        return await self._fetch_remaining_pages(fetch_page, first_page, limit, offset)
+
+    @timed(SPOTIFY_CALL_LATENCY, 'get_saved_tracks')
+    async def get_saved_tracks(self, access_token):
+        """
+        Get every track in the user's library ("Liked Songs")
+
+        Args:
+            access_token: Spotify access token
+
+        Returns:
+            dict: Merged paging object of saved-track items ({'added_at', 'track'})
+        """
+        url = f"{self.api_base_url}me/tracks"
+        return await run_in_runtime(self._get_paged(url, access_token, SAVED_TRACKS_PAGE_SIZE, 0, True))
+
+    @timed(SPOTIFY_CALL_LATENCY, 'get_playlist_tracks')
+    async def get_playlist_tracks(self, access_token, playlist_id):
+        """
+        Get every track of a playlist
+
+        Args:
+            access_token: Spotify access token
+            playlist_id: Spotify playlist ID
+
+        Returns:
+            dict: Merged paging object of playlist-track items ({'added_at', 'track'})
+        """
+        return await run_in_runtime(self._get_playlist_tracks(access_token, playlist_id))
+
+    async def _get_playlist_tracks(self, access_token, playlist_id):
+        url = f"{self.api_base_url}playlists/{playlist_id}/tracks"
+        params = {'fields': PLAYLIST_TRACK_FIELDS}
+        return await self._get_paged(url, access_token, PLAYLIST_TRACKS_PAGE_SIZE, 0, True, params)
+
+    @timed(SPOTIFY_CALL_LATENCY, 'get_library_tracks')
+    async def get_library_tracks(self, access_token, playlist_ids, playlist_tracks=None):
+        """
+        Get the user's saved tracks plus the tracks of the given playlists
+
+        Playlists are fetched concurrently (page_concurrency at a time).
+        Local files, podcast episodes and removed tracks are dropped, and each
+        track appears once.
+
+        Args:
+            access_token: Spotify access token
+            playlist_ids: Playlists whose tracks should be included
+            playlist_tracks: Optional dict of playlist ID -> track objects already
+                known (e.g. cached at the playlist's current snapshot); those
+                playlists aren't fetched, and the ones that are get added to it
+                (except those Spotify refuses with SKIPPABLE_STATUS_CODES, which are skipped)
+
+        Returns:
+            dict: Track ID -> track object, in first-seen order
+        """
+        return await run_in_runtime(self._get_library_tracks(access_token, playlist_ids, playlist_tracks))
+
+    async def _get_library_tracks(self, access_token, playlist_ids, playlist_tracks):
+        semaphore = asyncio.Semaphore(max(1, self.page_concurrency))
+        known = playlist_tracks if playlist_tracks is not None else {}
+        to_fetch = [playlist_id for playlist_id in dict.fromkeys(playlist_ids) if playlist_id not in known]
+
+        async def fetch_playlist(playlist_id):
+            async with semaphore:
+                try:
+                    return await self._get_playlist_tracks(access_token, playlist_id)
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code not in SKIPPABLE_STATUS_CODES:
+                        raise
+                    logger.info("Skipping tracks of playlist %s: HTTP %s", playlist_id, e.response.status_code)
+                    return None
+
+        url = f"{self.api_base_url}me/tracks"
+        saved_page, *playlist_pages = await asyncio.gather(
+            self._get_paged(url, access_token, SAVED_TRACKS_PAGE_SIZE, 0, True),
+            *(fetch_playlist(playlist_id) for playlist_id in to_fetch)
+        )
+        for playlist_id, page in zip(to_fetch, playlist_pages):
+            if page is not None:
+                known[playlist_id] = _page_tracks(page)
+
+        tracks = {}
+        for track in _page_tracks(saved_page) + [track for playlist_id in playlist_ids
+                                                 for track in known.get(playlist_id, ())]:
+            tracks.setdefault(track['id'], track)
+        return tracks
+
+    @timed(SPOTIFY_CALL_LATENCY, 'get_audio_features')
+    async def get_audio_features(self, access_token, track_ids):
+        """
+        Get audio features for many tracks, AUDIO_FEATURES_BATCH_SIZE IDs per request
+
+        Args:
+            access_token: Spotify access token
+            track_ids: Track IDs (any number)
+
+        Returns:
+            list: Audio-feature dicts; tracks Spotify has no analysis for are omitted
+        """
+        return await run_in_runtime(self._get_audio_features(access_token, list(track_ids)))
+
+    async def _get_audio_features(self, access_token, track_ids):
+        url = f"{self.api_base_url}audio-features"
+        semaphore = asyncio.Semaphore(max(1, self.page_concurrency))
+
+        async def fetch_batch(batch):
+            async with semaphore:
+                response = await self._request('GET', url, access_token, params={'ids': ','.join(batch)})
+            return response.get('audio_features') or []
+
+        batches = [track_ids[i:i + AUDIO_FEATURES_BATCH_SIZE]
+                   for i in range(0, len(track_ids), AUDIO_FEATURES_BATCH_SIZE)]
+        results = await asyncio.gather(*(fetch_batch(batch) for batch in batches))
+        return [features for batch in results for features in batch if features]
+
+    async def _fetch_remaining_pages(self, fetch_page, first_page, limit, offset):
+        """
+        Fetch the pages after first_page concurrently and merge them in order
+
+        Same degradation rules as SpotifyService._fetch_remaining_pages: stop
+        starting pages once Spotify throttles, retry the skipped ones
+        sequentially, and return the contiguous prefix as partial if needed.
+        """
+        offsets = list(range(offset + limit, first_page.get('total', 0), limit))
+        pages = {offset: first_page}
+        semaphore = asyncio.Semaphore(max(1, self.page_concurrency))
+        throttled = asyncio.Event()
+
+        async def fetch_unless_throttled(page_offset):
+            async with semaphore:
+                if throttled.is_set():
+                    return
+                try:
+                    pages[page_offset] = await fetch_page(page_offset)
+                except (httpx.HTTPStatusError, SpotifyRateLimitedError) as e:
+                    if not is_throttled(e):
+                        raise
+                    throttled.set()
+
+        await asyncio.gather(*(fetch_unless_throttled(page_offset) for page_offset in offsets))
+
+        # Degrade to sequential fetching for pages skipped while throttled
+        for page_offset in offsets:
+            if page_offset in pages:
+                continue
+            try:
+                pages[page_offset] = await fetch_page(page_offset)
+            except (httpx.HTTPStatusError, SpotifyRateLimitedError) as e:
+                if is_throttled(e):
+                    break
+                raise
+
+        # Merge the contiguous run of pages so offsets stay meaningful
+        items = []
+        last_page = first_page
+        for page_offset in [offset] + offsets:
+            page = pages.get(page_offset)
+            if page is None:
+                break
+            items.extend(page.get('items', []))
+            last_page = page
+
+        merged = dict(first_page)
+        merged['items'] = items
+        merged['partial'] = any(page_offset not in pages for page_offset in offsets)
+        merged['next'] = last_page.get('next') if merged['partial'] else None
+        return merged
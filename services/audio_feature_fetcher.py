@@ -0,0 +1,192 @@
+"""
+Audio Feature Fetcher
+Cross-user cache, request coalescing and batching in front of SpotifyService.get_audio_features
+"""
+import threading
+from concurrent.futures import Future
+
+from models import FEATURE_COLUMNS
+from services.playlist_cache import MemoryCacheBackend, RedisCacheBackend
+from services.spotify_service import SpotifyService
+
+# Cached for tracks Spotify has no analysis for, so they aren't requested again
+_NO_FEATURES = []
+
+
+class AudioFeatureFetcher:
+    """
+    Gets audio features for any number of tracks with as few Spotify calls as possible
+
+    Audio features describe the track, not the listener, so one cache serves
+    every user:
+
+    - a per-process LRU/TTL cache (compact tuples) answers most lookups,
+    - an optional shared Redis layer lets workers reuse each other's fetches,
+    - tracks another thread is already fetching are waited for instead of
+      requested again,
+    - the remaining misses go to Spotify in batches of AUDIO_FEATURES_BATCH_SIZE.
+    """
+
+    def __init__(self, spotify_service, local_backend, shared_backend=None, ttl=604800, wait_timeout=30):
+        """
+        Initialize fetcher
+
+        Args:
+            spotify_service: SpotifyService used for the batched API calls
+            local_backend: MemoryCacheBackend for this process
+            shared_backend: Optional RedisCacheBackend shared by all workers
+            ttl: Seconds features are cached
+            wait_timeout: Seconds to wait for another thread's in-flight fetch
+        """
+        self.spotify = spotify_service
+        self.local = local_backend
+        self.shared = shared_backend
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._inflight = {}  # track ID -> Future of its packed features
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'coalesced': 0, 'fetched': 0}
+
+    def get_audio_features(self, access_token, track_ids, spotify_service=None):
+        """
+        Get audio features for the given tracks
+
+        Args:
+            access_token: Any valid Spotify access token (features are not user-specific)
+            track_ids: Track IDs (any number, duplicates allowed)
+            spotify_service: SpotifyService for the misses (e.g. a job's, which waits longer
+                for rate limit quota); defaults to the fetcher's own
+
+        Returns:
+            list: Audio-feature dicts, same shape as SpotifyService.get_audio_features;
+                tracks Spotify has no analysis for are omitted
+
+        Raises:
+            requests.exceptions.RequestException: If fetching the misses fails
+        """
+        track_ids = list(dict.fromkeys(track_ids))
+        packed = self.local.get_many(track_ids)
+        local_hits = len(packed)
+
+        missing = [track_id for track_id in track_ids if track_id not in packed]
+        if missing and self.shared is not None:
+            shared = self.shared.get_many(missing)
+            if shared:
+                self.local.set_many(shared, self.ttl)
+                packed.update(shared)
+            missing = [track_id for track_id in missing if track_id not in shared]
+
+        owned, waiting = self._claim(missing)
+        self._count(hits=local_hits, shared_hits=len(track_ids) - local_hits - len(missing),
+                    misses=len(owned), coalesced=len(waiting))
+
+        if owned:
+            packed.update(self._fetch(spotify_service or self.spotify, access_token, owned))
+        for track_id, future in waiting.items():
+            packed[track_id] = future.result(timeout=self.wait_timeout)
+
+        return [_unpack(track_id, packed[track_id]) for track_id in track_ids if packed.get(track_id)]
+
+    def stats(self):
+        """
+        Get fetcher counters
+
+        Returns:
+            dict: Local/shared hits, misses fetched from Spotify, coalesced waits, cache size
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['size'] = self.local.stats()['size']
+        return stats
+
+    def _claim(self, track_ids):
+        """Split misses into ones this call fetches and ones already in flight elsewhere"""
+        owned = []
+        waiting = {}
+        with self._lock:
+            for track_id in track_ids:
+                future = self._inflight.get(track_id)
+                if future is None:
+                    self._inflight[track_id] = Future()
+                    owned.append(track_id)
+                else:
+                    waiting[track_id] = future
+        return owned, waiting
+
+    def _fetch(self, spotify_service, access_token, track_ids):
+        """Fetch owned misses from Spotify, cache them and resolve their futures"""
+        try:
+            audio_features = spotify_service.get_audio_features(access_token, track_ids)
+            packed = {track_id: _NO_FEATURES for track_id in track_ids}
+            for features in audio_features:
+                if features.get('id') in packed:
+                    packed[features['id']] = _pack(features)
+            self.local.set_many(packed, self.ttl)
+            if self.shared is not None:
+                self.shared.set_many(packed, self.ttl)
+            self._count(fetched=len(track_ids))
+        except BaseException as e:
+            self._resolve(track_ids, error=e)
+            raise
+        self._resolve(track_ids, packed=packed)
+        return packed
+
+    def _resolve(self, track_ids, packed=None, error=None):
+        with self._lock:
+            futures = [self._inflight.pop(track_id) for track_id in track_ids]
+        for track_id, future in zip(track_ids, futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(packed[track_id])
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self._stats[name] += amount
+
+
+def _pack(features):
+    # A list rather than a dict: a fraction of the memory, and JSON-friendly for Redis
+    return [features.get(name) for name in FEATURE_COLUMNS]
+
+
+def _unpack(track_id, packed):
+    features = dict(zip(FEATURE_COLUMNS, packed))
+    features['id'] = track_id
+    return features
+
+
+def init_audio_feature_fetcher(app):
+    """
+    Create the audio feature fetcher and attach it to the app
+
+    Adds a shared Redis layer when Redis sessions are configured.
+
+    Args:
+        app: Flask application instance (call after init_http_client and init_spotify_rate_limiter)
+    """
+    shared = None
+    if app.config.get('SESSION_TYPE') == 'redis' and app.config.get('SESSION_REDIS') is not None:
+        shared = RedisCacheBackend(
+            app.config['SESSION_REDIS'],
+            max_entries=app.config.get('AUDIO_FEATURE_SHARED_MAX_ENTRIES', 200000),
+            key_prefix='audio_features:'
+        )
+    app.extensions['audio_feature_fetcher'] = AudioFeatureFetcher(
+        SpotifyService(app.config, rate_limiter=app.extensions.get('spotify_rate_limiter')),
+        MemoryCacheBackend(max_entries=app.config.get('AUDIO_FEATURE_CACHE_MAX_ENTRIES', 50000)),
+        shared_backend=shared,
+        ttl=app.config.get('AUDIO_FEATURE_CACHE_TTL', 604800)
+    )
+
+
+def get_audio_feature_fetcher():
+    """
+    Get the audio feature fetcher for the current app
+
+    Returns:
+        AudioFeatureFetcher: Fetcher attached by init_audio_feature_fetcher
+    """
+    from flask import current_app
+    return current_app.extensions['audio_feature_fetcher']
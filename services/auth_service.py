@@ -4,13 +4,26 @@ Handles user authentication and registration logic
 """
 from flask_bcrypt import Bcrypt
 from models import db, User
+from services.password_hasher import PasswordHasherBusyError
 
 
 class AuthService:
     """Service for user authentication and registration"""
     
-    def __init__(self, bcrypt_instance):
+    def __init__(self, bcrypt_instance, password_hasher=None):
+        """
+        Initialize auth service
+        
+        Args:
+            bcrypt_instance: Bcrypt instance for password hashing
+            password_hasher: PasswordHasher that runs bcrypt off the request thread
+                (defaults to the one attached to the current app)
+        """
         self.bcrypt = bcrypt_instance
+        if password_hasher is None:
+            from flask import current_app
+            password_hasher = current_app.extensions['password_hasher']
+        self.password_hasher = password_hasher
     
     def register_user(self, username, password):
         """
@@ -25,17 +38,15 @@ class AuthService:
             
         Raises:
             ValueError: If username already exists
+            PasswordHasherBusyError: If the hashing pool is saturated
         """
         # Check if user already exists
         existing_user = User.query.filter_by(username=username).first()
         if existing_user:
             raise ValueError("Username already exists")
         
-        # Hash password - ensure it's stored as a string (decode bytes if needed)
-        hashed_password = self.bcrypt.generate_password_hash(password)
-        # Convert bytes to string if needed (Flask-Bcrypt returns bytes)
-        if isinstance(hashed_password, bytes):
-            hashed_password = hashed_password.decode('utf-8')
+        # Hash password on the hashing pool (returned as a string)
+        hashed_password = self.password_hasher.hash_password(password)
         
         new_user = User(username=username, password=hashed_password)
         
@@ -54,6 +65,9 @@ class AuthService:
             
         Returns:
             User: Authenticated user object if credentials are valid, None otherwise
+            
+        Raises:
+            PasswordHasherBusyError: If the hashing pool is saturated
         """
         user = User.query.filter_by(username=username).first()
         
@@ -67,14 +81,22 @@ class AuthService:
         
         # Check password with error handling for invalid hashes
         try:
-            if self.bcrypt.check_password_hash(password_hash, password):
-                return user
+            if not self.password_hasher.check_password(password_hash, password):
+                return None
         except (ValueError, TypeError) as e:
             # Invalid password hash format - log and return None
             print(f"Password hash error for user {username}: {str(e)}")
             return None
         
-        return None
+        # Upgrade hashes made with an older (lower) cost factor while we have the password
+        if self.password_hasher.needs_rehash(password_hash):
+            try:
+                user.password = self.password_hasher.hash_password(password)
+                db.session.commit()
+            except PasswordHasherBusyError:
+                pass  # login still succeeds; upgrade on a later login
+        
+        return user
     
     def get_user_by_id(self, user_id):
         """
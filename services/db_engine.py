@@ -0,0 +1,167 @@
+"""
+Database engine setup
+Builds SQLALCHEMY_ENGINE_OPTIONS from a named profile plus DB_* settings,
+applies per-connection settings (SQLite WAL, PostgreSQL statement timeout)
+and times pool checkouts so the pool can be sized from data
+"""
+import logging
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Defaults per DB_ENGINE_PROFILE; any DB_* setting that isn't None overrides them
+ENGINE_PROFILES = {
+    # Local SQLite: no network between app and database, so no pings or recycling
+    'development': {
+        'pool_pre_ping': False,
+        'pool_recycle': -1,
+        'pool_timeout': 30,
+        'statement_timeout_ms': 0,
+        'query_cache_size': 500,
+    },
+    # Managed PostgreSQL behind a proxy that drops idle connections
+    'production': {
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        'pool_timeout': 5,
+        'statement_timeout_ms': 15000,
+        'query_cache_size': 1200,
+    },
+}
+
+# SQLite PRAGMAs run on every new connection (file databases only)
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),  # readers no longer block on the writer
+    ('synchronous', 'NORMAL'),  # fsync at checkpoints only; safe with WAL
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited"""
+
+    # Set per engine by timed_pool_class
+    slow_checkout = 0.1
+
+    def _do_get(self):
+        from utils.metrics import DB_POOL_CHECKOUT_LATENCY
+
+        # Covers queueing for a free connection plus opening a new one when below the limit
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            DB_POOL_CHECKOUT_LATENCY.observe(waited)
+            if waited >= self.slow_checkout:
+                logger.warning("Waited %.3fs for a database connection (%s)", waited, self.status())
+
+
+def timed_pool_class(slow_checkout):
+    """
+    Build a TimedQueuePool subclass with its own slow-checkout threshold
+
+    Args:
+        slow_checkout: Seconds after which a checkout is logged as slow
+
+    Returns:
+        type: QueuePool subclass for create_engine(poolclass=...)
+    """
+    return type('TimedQueuePool', (TimedQueuePool,), {'slow_checkout': slow_checkout})
+
+
+def build_engine_options(config):
+    """
+    Build SQLAlchemy engine options for the configured database
+
+    Args:
+        config: Flask app config with SQLALCHEMY_DATABASE_URI and DB_* settings
+
+    Returns:
+        dict: Keyword arguments for create_engine
+    """
+    profile = dict(ENGINE_PROFILES[config.get('DB_ENGINE_PROFILE', 'development')])
+    for key in profile:
+        override = config.get('DB_' + key.upper())
+        if override is not None:
+            profile[key] = override
+
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = {'query_cache_size': profile['query_cache_size']}
+
+    # In-memory SQLite gets a StaticPool from Flask-SQLAlchemy; pool sizing doesn't apply
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return options
+
+    pool_size, max_overflow = config.get('DB_POOL_SIZE'), config['DB_MAX_OVERFLOW']
+    if pool_size is None:
+        # A job thread can hold its db.session connection and one of the job store or token
+        # vault's own transactions at once; +1 for the other background threads
+        pool_size = config['DB_REQUEST_THREADS'] + 2 * config.get('JOB_WORKER_THREADS', 2) + 1
+    max_connections = config.get('DB_MAX_CONNECTIONS', 0)
+    if max_connections:
+        # Every worker process has its own pool; keep all of them under the server limit
+        per_worker = max(1, max_connections // max(1, config.get('GUNICORN_WORKERS', 1)))
+        pool_size = min(pool_size, per_worker)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+
+    options.update({
+        'poolclass': timed_pool_class(config.get('DB_POOL_SLOW_CHECKOUT', 0.1)),
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': profile['pool_timeout'],
+        'pool_recycle': profile['pool_recycle'],
+        'pool_pre_ping': profile['pool_pre_ping'],
+    })
+
+    if url.get_backend_name() == 'postgresql':
+        connect_args = {
+            # Detect dead peers on idle pooled connections before the proxy does
+            'keepalives': 1,
+            'keepalives_idle': 30,
+            'keepalives_interval': 10,
+            'keepalives_count': 3,
+        }
+        if profile['statement_timeout_ms']:
+            connect_args['options'] = f"-c statement_timeout={int(profile['statement_timeout_ms'])}"
+        options['connect_args'] = connect_args
+    elif url.get_backend_name() == 'sqlite':
+        # Seconds a writer waits on a locked database before raising
+        options['connect_args'] = {'timeout': max(5, profile['statement_timeout_ms'] / 1000)}
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def init_database(app):
+    """
+    Configure the engine and initialize Flask-SQLAlchemy for the app
+
+    Explicit SQLALCHEMY_ENGINE_OPTIONS (e.g. from config_overrides) are kept
+    and only extended with the computed defaults.
+
+    Args:
+        app: Flask application instance
+    """
+    options = build_engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+                event.listen(engine, 'connect', _set_sqlite_pragmas)
+            logger.info("Database engine %s: %s", engine.url.render_as_string(hide_password=True), engine.pool.status())
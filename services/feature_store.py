@@ -0,0 +1,242 @@
+"""
+Feature Store
+Audio features of every synced track as a columnar file that all workers map read-only
+
+The file holds the sorted track IDs plus one float32 column per feature
+(FEATURE_COLUMNS, normalized to 0..1 like FeatureMatrix), written with
+utils.mapped_file. Mood scoring gathers a user's rows straight from the
+mapping. Workers share the page cache instead of each building a matrix
+from database rows, so another worker costs almost no extra memory. NumPy
+is imported on first use.
+"""
+import logging
+import os
+import time
+
+from sqlalchemy import or_, select
+
+from models import db, AudioFeature, FEATURE_COLUMNS
+from utils.mapped_file import MappedStore
+
+logger = logging.getLogger(__name__)
+
+FILE_FORMAT = 1
+# Track IDs per database lookup of features the mapped version lacks (stays under SQLite's bind limit)
+MISSING_BATCH = 500
+
+
+def load_feature_vectors(since=None, track_ids=None, batch_size=5000):
+    """
+    Read stored audio features as normalized vectors
+
+    Tracks Spotify has no analysis for (every feature NULL) are left out;
+    single missing features sit mid-range, as in FeatureMatrix.
+
+    Args:
+        since: Only features fetched after this unix timestamp (None = all)
+        track_ids: Only these tracks (None = all)
+        batch_size: Rows read from the database at a time
+
+    Returns:
+        tuple: (track IDs, float32 array (n, len(FEATURE_COLUMNS)), newest fetched_at)
+    """
+    import numpy as np
+    from services.mood_engine import normalize
+
+    columns = [getattr(AudioFeature, name) for name in FEATURE_COLUMNS]
+    query = (
+        select(AudioFeature.track_id, AudioFeature.fetched_at, *columns)
+        .where(or_(*[column.is_not(None) for column in columns]))
+        .execution_options(yield_per=batch_size)
+    )
+    if since is not None:
+        query = query.where(AudioFeature.fetched_at > since)
+    if track_ids is not None:
+        query = query.where(AudioFeature.track_id.in_(list(track_ids)))
+
+    ids = []
+    rows = []
+    watermark = since or 0.0
+    for row in db.session.execute(query):
+        ids.append(row[0])
+        watermark = max(watermark, row[1])
+        rows.append(row[2:])
+    if not rows:
+        return [], np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32), watermark
+    raw = np.array(rows, dtype=np.float32)  # None becomes nan
+    vectors = normalize(raw)
+    vectors[np.isnan(raw)] = 0.5
+    return ids, vectors, watermark
+
+
+class FeatureStore(MappedStore):
+    """
+    Owns the feature file and this worker's mapping of it
+
+    update() merges features fetched since the file's watermark (new tracks
+    and refetched ones) into a new version and swaps it in atomically; a
+    library sync calls it once it has stored new features. A feature whose
+    fetched_at is at or below the watermark when it is committed (another
+    sync's transaction finishing late) is missed by that merge; matrix()
+    reads such tracks from the database, and a full rewrite once the file
+    is older than compact_interval picks them up. get() returns the mapped
+    version (a MappedFile), refreshed as described in MappedStore.
+    """
+
+    label = 'feature file'
+
+    def __init__(self, path, check_interval=30, refresh_interval=600, compact_interval=86400):
+        """
+        Initialize feature store
+
+        Args:
+            path: Feature file shared by every worker on the host
+            check_interval: Seconds between checks for a newer file
+            refresh_interval: Seconds after which a reader has the file updated
+            compact_interval: Seconds after which an update rewrites the file from every stored feature
+        """
+        super().__init__(path, check_interval, refresh_interval)
+        self.compact_interval = compact_interval
+        self.metrics.update(lookups=0, rows_served=0, rows_missing=0, rewrites=0)
+
+    def matrix(self, track_ids):
+        """
+        Build the FeatureMatrix of some tracks from the mapped columns
+
+        Only the requested rows are copied out of the mapping. Tracks the
+        published version doesn't have (features stored since it was
+        written) are read from the database.
+
+        Args:
+            track_ids: Track IDs (e.g. a user's library)
+
+        Returns:
+            FeatureMatrix: One row per track with features, found tracks first
+        """
+        import numpy as np
+        from services.mood_engine import FeatureMatrix
+
+        mapped = self.get()
+        wanted = np.array(sorted(track_ids), dtype=np.bytes_)
+        sorted_ids = mapped.arrays['track_ids']
+        if len(wanted) and len(sorted_ids):
+            positions = np.minimum(np.searchsorted(sorted_ids, wanted), len(sorted_ids) - 1)
+            found = sorted_ids[positions] == wanted
+        else:
+            positions = np.zeros(len(wanted), dtype=np.intp)
+            found = np.zeros(len(wanted), dtype=bool)
+        rows = positions[found]
+        matrix = np.empty((len(rows), len(FEATURE_COLUMNS)), dtype=np.float32)
+        for column, name in enumerate(FEATURE_COLUMNS):
+            matrix[:, column] = mapped.arrays[name][rows]
+        found_ids = [track_id.decode() for track_id in wanted[found]]
+
+        missing = [track_id.decode() for track_id in wanted[~found]]
+        parts = [matrix]
+        for start in range(0, len(missing), MISSING_BATCH):
+            extra_ids, extra, _ = load_feature_vectors(track_ids=missing[start:start + MISSING_BATCH])
+            found_ids.extend(extra_ids)
+            parts.append(extra)
+        if len(parts) > 1:
+            matrix = np.concatenate(parts)
+        self.metrics['lookups'] += 1
+        self.metrics['rows_served'] += len(rows)
+        self.metrics['rows_missing'] += len(missing)
+        return FeatureMatrix(found_ids, matrix)
+
+    def update(self, rewrite=False):
+        """
+        Publish a version including every feature fetched since the last one
+
+        Args:
+            rewrite: Rewrite from every stored feature even if compaction isn't due
+
+        Returns:
+            dict: tracks in the file, tracks added or changed and whether it was rewritten
+        """
+        import numpy as np
+        from utils.mapped_file import MappedFile, write_lock, write_mapped_file
+
+        with write_lock(self.path):
+            try:
+                current = MappedFile(self.path)
+                if current.meta.get('format') != FILE_FORMAT:
+                    raise ValueError(f"Unsupported feature file format in {self.path}")
+            except FileNotFoundError:
+                current = None
+            except ValueError:
+                logger.warning("Rewriting unreadable feature file %s", self.path, exc_info=True)
+                current = None
+            self.metrics['updates'] += 1
+
+            if current is not None:
+                # Files from before compaction was tracked count from their last update
+                written_at = current.meta.get('written_at', current.meta['updated_at'])
+                rewrite = rewrite or time.time() - written_at > self.compact_interval
+            if current is None or rewrite:
+                new_ids, vectors, watermark = load_feature_vectors()
+                written_at = time.time()
+                current = None
+                self.metrics['rewrites'] += 1
+            else:
+                new_ids, vectors, watermark = load_feature_vectors(since=current.meta['watermark'])
+                if not new_ids:
+                    os.utime(self.path)  # checked and current: readers needn't update it for a while
+                    return {'tracks': current.meta['count'], 'changed': 0, 'rewritten': False}
+
+            new_ids = np.array(new_ids, dtype=np.bytes_)
+            if current is not None:
+                # Refetched tracks replace their old rows
+                old_ids = current.arrays['track_ids']
+                keep = ~np.isin(old_ids, new_ids)
+                ids = np.concatenate([old_ids[keep], new_ids])
+                columns = [np.concatenate([current.arrays[name][keep], vectors[:, i]])
+                           for i, name in enumerate(FEATURE_COLUMNS)]
+            else:
+                ids = new_ids
+                columns = [vectors[:, i] for i in range(len(FEATURE_COLUMNS))]
+            order = np.argsort(ids, kind='stable')
+            arrays = {'track_ids': ids[order]}
+            arrays.update({name: column[order] for name, column in zip(FEATURE_COLUMNS, columns)})
+            write_mapped_file(self.path, {
+                'format': FILE_FORMAT,
+                'count': len(ids),
+                'watermark': watermark,
+                'updated_at': time.time(),
+                'written_at': written_at,
+            }, arrays)
+
+        logger.info("Feature file %s: %d tracks (%d added or changed)", 'rewritten' if current is None else 'updated',
+                    len(ids), len(new_ids))
+        return {'tracks': len(ids), 'changed': len(new_ids), 'rewritten': current is None}
+
+    def _load(self, mapped):
+        if mapped.meta.get('format') != FILE_FORMAT:
+            raise ValueError(f"Unsupported feature file format in {self.path}")
+        return mapped
+
+
+def init_feature_store(app):
+    """
+    Create the feature store and attach it to the app
+
+    Args:
+        app: Flask application instance
+    """
+    app.extensions['feature_store'] = FeatureStore(
+        app.config.get('FEATURE_STORE_PATH', './data/features.col'),
+        check_interval=app.config.get('FEATURE_STORE_CHECK_INTERVAL', 30),
+        refresh_interval=app.config.get('FEATURE_STORE_REFRESH_INTERVAL', 600),
+        compact_interval=app.config.get('FEATURE_STORE_COMPACT_INTERVAL', 86400)
+    )
+
+
+def get_feature_store():
+    """
+    Get the feature store for the current app
+
+    Returns:
+        FeatureStore: Store attached by init_feature_store
+    """
+    from flask import current_app
+    return current_app.extensions['feature_store']
@@ -0,0 +1,147 @@
+"""
+Pooled HTTP client for outbound Spotify calls
+Builds one keep-alive requests.Session per process so connections to
+accounts.spotify.com and api.spotify.com are reused across requests
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Status codes Spotify documents as transient (rate limit + server errors)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+class SpotifyRetry(Retry):
+    """Retry policy that caps how long a Retry-After header may stall a worker and never replays failed POSTs"""
+
+    def __init__(self, *args, retry_after_max=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after_max = retry_after_max
+
+    def new(self, **kwargs):
+        return super().new(retry_after_max=self.retry_after_max, **kwargs)
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        # A POST that failed with a server error may still have been applied
+        # (e.g. tracks added to a playlist), so only a 429 is safe to replay
+        if method == 'POST' and status_code != 429:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is not None and self.retry_after_max is not None:
+            return min(retry_after, self.retry_after_max)
+        return retry_after
+
+
+def create_http_session(config):
+    """
+    Build a requests session with a bounded connection pool and retry policy
+
+    Args:
+        config: Flask app config object or dict with SPOTIFY_HTTP_* settings
+
+    Returns:
+        requests.Session: Session with keep-alive adapters mounted for https/http
+    """
+    retry = SpotifyRetry(
+        total=config.get('SPOTIFY_HTTP_MAX_RETRIES', 3),
+        connect=config.get('SPOTIFY_HTTP_MAX_RETRIES', 3),
+        read=0,  # never replay a request whose response may already have been processed
+        status=config.get('SPOTIFY_HTTP_MAX_RETRIES', 3),
+        backoff_factor=config.get('SPOTIFY_HTTP_BACKOFF_FACTOR', 0.5),
+        backoff_max=config.get('SPOTIFY_HTTP_BACKOFF_MAX', 10),
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        respect_retry_after_header=True,  # Spotify sends Retry-After (seconds) on 429
+        raise_on_status=False,  # hand the final response back so raise_for_status() applies
+        retry_after_max=config.get('SPOTIFY_HTTP_BACKOFF_MAX', 10),
+    )
+
+    adapter = HTTPAdapter(
+        pool_connections=config.get('SPOTIFY_HTTP_POOL_CONNECTIONS', 4),  # number of hosts kept pooled
+        pool_maxsize=config.get('SPOTIFY_HTTP_POOL_MAXSIZE', 20),  # connections kept alive per host
+        pool_block=config.get('SPOTIFY_HTTP_POOL_BLOCK', False),
+        max_retries=retry,
+    )
+
+    http_session = requests.Session()
+    http_session.mount('https://', adapter)
+    http_session.mount('http://', adapter)
+    return http_session
+
+
+def get_timeout(config):
+    """
+    Get (connect, read) timeout tuple for outbound requests
+
+    Args:
+        config: Flask app config object or dict with SPOTIFY_HTTP_* settings
+
+    Returns:
+        tuple: (connect_timeout, read_timeout) in seconds
+    """
+    return (
+        config.get('SPOTIFY_HTTP_CONNECT_TIMEOUT', 3.05),
+        config.get('SPOTIFY_HTTP_READ_TIMEOUT', 10),
+    )
+
+
+def max_request_time(config, rate_limit_wait=0):
+    """
+    Longest one outbound request can take, counting every retry
+
+    Args:
+        config: Flask app config object or dict with SPOTIFY_HTTP_* settings
+        rate_limit_wait: Seconds the caller may first wait for rate limit quota
+
+    Returns:
+        float: Seconds (timeouts of every attempt plus the longest backoffs between them)
+    """
+    retries = config.get('SPOTIFY_HTTP_MAX_RETRIES', 3)
+    connect_timeout, read_timeout = get_timeout(config)
+    return (rate_limit_wait + (retries + 1) * (connect_timeout + read_timeout)
+            + retries * config.get('SPOTIFY_HTTP_BACKOFF_MAX', 10))
+
+
+def init_http_client(app):
+    """
+    Create the process-wide pooled session and attach it to the app
+
+    Args:
+        app: Flask application instance
+    """
+    app.extensions['spotify_http'] = create_http_session(app.config)
+
+
+def get_http_session(config=None):
+    """
+    Get the shared pooled session
+
+    Uses the session owned by the current Flask app when one is active,
+    otherwise a lazily created module-level session built from config.
+
+    Args:
+        config: Optional config used when no app session exists
+
+    Returns:
+        requests.Session: Shared pooled session
+    """
+    from flask import current_app, has_app_context
+
+    if has_app_context() and 'spotify_http' in current_app.extensions:
+        return current_app.extensions['spotify_http']
+
+    global _default_session
+    if _default_session is None:
+        with _default_session_lock:
+            if _default_session is None:
+                _default_session = create_http_session(config or {})
+    return _default_session
@@ -0,0 +1,549 @@
+"""
+Job Queue
+Runs long Spotify work (library syncs, mood playlists, playlist writes) outside the request cycle
+
+Routes enqueue a job and answer 202 with its ID; clients poll /jobs/<id>
+for the result. The queue lives in Redis when Redis sessions are set up,
+and in the database otherwise; either way any web worker can answer a
+poll, and any web worker or a dedicated `flask jobs-worker` process can
+run a job queued by another one (handlers load the user's tokens from the
+token vault, which is shared too).
+
+A user can have only one job of a kind with the same payload queued or
+running at a time; enqueueing it again returns the existing job. Jobs
+that fail for transient reasons (Spotify 429/5xx, network errors, rate
+limiter, database busy) are retried with exponential backoff.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import httpx
+import requests
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from models import db, Job, JobClaim
+from services.spotify_rate_limiter import SpotifyRateLimitedError
+from services.token_refresher import TokenRefreshBusyError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+RETRYING = 'retrying'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# Fields returned by the status endpoint (payloads never hold tokens)
+PUBLIC_FIELDS = ('id', 'type', 'status', 'attempts', 'payload', 'result', 'error', 'created_at', 'updated_at', 'run_at')
+
+
+class JobError(Exception):
+    """Raised by a job handler for failures that retrying won't fix; the message is shown to the user"""
+    pass
+
+
+def is_retryable(error):
+    """
+    Check whether a failed job should be tried again
+
+    Args:
+        error: Exception raised by the job handler
+
+    Returns:
+        bool: True for throttling, server errors and connection problems
+    """
+    if isinstance(error, (SpotifyRateLimitedError, TokenRefreshBusyError, OperationalError)):
+        return True
+    if isinstance(error, (requests.exceptions.HTTPError, httpx.HTTPStatusError)):
+        response = error.response
+        return response is None or response.status_code == 429 or response.status_code >= 500
+    return isinstance(error, (requests.exceptions.RequestException, httpx.TransportError))
+
+
+class DatabaseJobStore:
+    """
+    Job records and queue in the database (used without Redis)
+
+    Every web worker and `flask jobs-worker` share the tables. A worker
+    claims a job by clearing its queued flag, which only one UPDATE can do.
+    Jobs queued in this process wake its workers at once; others are picked
+    up on the next poll (claim's timeout).
+    """
+
+    def __init__(self, app, ttl=86400):
+        self.app = app
+        self.ttl = ttl
+        self._ready = threading.Condition()
+
+    @contextmanager
+    def _connection(self):
+        # Own app context and transaction: callers may be worker threads or inside a request
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                yield connection
+
+    def save(self, job):
+        values = {'record': job, 'status': job['status'], 'updated_at': job['updated_at']}
+        with self._connection() as connection:
+            if not connection.execute(update(Job).where(Job.id == job['id']).values(**values)).rowcount:
+                connection.execute(insert(Job).values(id=job['id'], **values))
+
+    def get(self, job_id):
+        with self._connection() as connection:
+            return connection.execute(select(Job.record).where(Job.id == job_id)).scalar()
+
+    def push(self, job_id, run_at=0):
+        with self._connection() as connection:
+            connection.execute(update(Job).where(Job.id == job_id).values(queued=True, run_at=run_at))
+        with self._ready:
+            self._ready.notify()
+
+    def claim(self, timeout):
+        job_id = self._claim_due()
+        if job_id is None:
+            # Woken by push; delayed retries are found on the next call
+            with self._ready:
+                self._ready.wait(timeout)
+            job_id = self._claim_due()
+        return job_id
+
+    def _claim_due(self):
+        with self._connection() as connection:
+            due = connection.execute(
+                select(Job.id)
+                .where(Job.queued.is_(True), Job.run_at <= time.time())
+                .order_by(Job.run_at).limit(5)
+            ).scalars().all()
+            for job_id in due:
+                # Another worker may have claimed it since the SELECT
+                claimed = connection.execute(
+                    update(Job).where(Job.id == job_id, Job.queued.is_(True)).values(queued=False)
+                ).rowcount
+                if claimed:
+                    return job_id
+        return None
+
+    def finish(self, job_id):
+        pass  # claiming already took it off the queue
+
+    def promote_due(self):
+        pass  # claim picks delayed jobs up once run_at has passed
+
+    def reap(self, timeout):
+        """Return IDs of jobs still marked running long after they started, and drop expired ones"""
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(delete(Job).where(Job.status.in_((SUCCEEDED, FAILED)), Job.updated_at < now - self.ttl))
+            connection.execute(delete(JobClaim).where(JobClaim.expires_at < now))
+            return connection.execute(
+                select(Job.id).where(Job.status == RUNNING, Job.updated_at < now - timeout)
+            ).scalars().all()
+
+    def claim_dedup(self, key, job_id, ttl):
+        now = time.time()
+        with self._connection() as connection:
+            existing = connection.execute(
+                select(JobClaim.job_id, JobClaim.expires_at).where(JobClaim.key == key)
+            ).first()
+            if existing is not None:
+                if existing.expires_at > now:
+                    return existing.job_id
+                taken = connection.execute(
+                    update(JobClaim).where(JobClaim.key == key, JobClaim.job_id == existing.job_id)
+                    .values(job_id=job_id, expires_at=now + ttl)
+                ).rowcount
+                if taken:
+                    return None
+        try:
+            with self._connection() as connection:
+                connection.execute(insert(JobClaim).values(key=key, job_id=job_id, expires_at=now + ttl))
+            return None
+        except IntegrityError:
+            # Claimed by another worker in the meantime
+            with self._connection() as connection:
+                return connection.execute(select(JobClaim.job_id).where(JobClaim.key == key)).scalar()
+
+    def release_dedup(self, key, job_id):
+        with self._connection() as connection:
+            connection.execute(delete(JobClaim).where(JobClaim.key == key, JobClaim.job_id == job_id))
+
+    def depth(self):
+        with self._connection() as connection:
+            return connection.execute(select(func.count()).select_from(Job).where(Job.queued.is_(True))).scalar()
+
+
+class RedisJobStore:
+    """Job records and queue in Redis, shared by every worker process"""
+
+    KEY_PREFIX = 'jobs:'
+
+    def __init__(self, redis_client, ttl=86400):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.queue_key = f'{self.KEY_PREFIX}queue'
+        self.running_key = f'{self.KEY_PREFIX}running'
+        self.delayed_key = f'{self.KEY_PREFIX}delayed'
+
+    def save(self, job):
+        self.redis.set(f"{self.KEY_PREFIX}job:{job['id']}", json.dumps(job), ex=self.ttl)
+
+    def get(self, job_id):
+        raw = self.redis.get(f'{self.KEY_PREFIX}job:{job_id}')
+        return json.loads(raw) if raw else None
+
+    def push(self, job_id, run_at=0):
+        pipe = self.redis.pipeline()
+        pipe.lrem(self.running_key, 0, job_id)
+        if run_at > time.time():
+            pipe.zadd(self.delayed_key, {job_id: run_at})
+        else:
+            pipe.lpush(self.queue_key, job_id)
+        pipe.execute()
+
+    def claim(self, timeout):
+        # Moved atomically onto the running list so a crashed worker's job can be found again
+        job_id = self.redis.brpoplpush(self.queue_key, self.running_key, timeout=max(1, int(timeout)))
+        return job_id.decode() if job_id is not None else None
+
+    def finish(self, job_id):
+        self.redis.lrem(self.running_key, 0, job_id)
+
+    def promote_due(self):
+        for job_id in self.redis.zrangebyscore(self.delayed_key, 0, time.time(), start=0, num=100):
+            # Whoever removes it from the delayed set queues it, so it is queued once
+            if self.redis.zrem(self.delayed_key, job_id):
+                self.redis.lpush(self.queue_key, job_id)
+
+    def reap(self, timeout):
+        """Return IDs of jobs still marked running long after they started (their worker died)"""
+        stale = []
+        now = time.time()
+        for raw_id in self.redis.lrange(self.running_key, 0, -1):
+            job_id = raw_id.decode()
+            job = self.get(job_id)
+            if job is None:
+                self.redis.lrem(self.running_key, 0, job_id)
+            elif job['status'] == RUNNING and now - job['updated_at'] > timeout:
+                stale.append(job_id)
+        return stale
+
+    def claim_dedup(self, key, job_id, ttl):
+        dedup_key = f'{self.KEY_PREFIX}dedup:{key}'
+        if self.redis.set(dedup_key, job_id, nx=True, ex=ttl):
+            return None
+        existing = self.redis.get(dedup_key)
+        return existing.decode() if existing is not None else None
+
+    def release_dedup(self, key, job_id):
+        dedup_key = f'{self.KEY_PREFIX}dedup:{key}'
+        if self.redis.get(dedup_key) == job_id.encode():
+            self.redis.delete(dedup_key)
+
+    def depth(self):
+        return self.redis.llen(self.queue_key) + self.redis.zcard(self.delayed_key)
+
+
+class JobQueue:
+    """
+    Queues jobs, runs them on worker threads and records their outcome
+
+    Handlers are registered by job type and called as handler(user_id, payload)
+    inside an app context; whatever they return (JSON-serializable) becomes
+    the job's result.
+    """
+
+    def __init__(self, app, store, worker_threads=2, max_attempts=3, retry_backoff=5.0,
+                 retry_backoff_max=300.0, job_timeout=900):
+        """
+        Initialize job queue
+
+        Args:
+            app: Flask application instance (jobs run in its app context)
+            store: DatabaseJobStore or RedisJobStore
+            worker_threads: Threads running jobs in each process (0 to only queue)
+            max_attempts: Tries per job before it is marked failed
+            retry_backoff: Seconds before the first retry (doubles per attempt, with jitter)
+            retry_backoff_max: Longest delay between retries
+            job_timeout: Seconds after which a running job is presumed lost and retried
+        """
+        self.app = app
+        self.store = store
+        self.worker_threads = worker_threads
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.job_timeout = job_timeout
+        self.handlers = {}
+        self.metrics = {
+            'enqueued': 0,
+            'deduplicated': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'retried': 0,
+            'running': 0,
+        }
+        self._workers_pid = None
+        self._workers_guard = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def register(self, job_type, handler):
+        """
+        Register the handler for a job type
+
+        Args:
+            job_type: Name used when enqueueing
+            handler: Callable taking (user_id, payload) and returning the result
+        """
+        self.handlers[job_type] = handler
+
+    def stats(self):
+        """
+        Get job counters
+
+        Returns:
+            dict: Counters plus jobs waiting to run
+        """
+        try:
+            depth = self.store.depth()
+        except Exception:
+            depth = -1
+        return dict(self.metrics, queue_depth=depth)
+
+    def enqueue(self, job_type, user_id, payload=None):
+        """
+        Queue a job, or return the user's identical job if one is still pending
+
+        Args:
+            job_type: Registered job type
+            user_id: User the job runs for
+            payload: JSON-serializable job arguments
+
+        Returns:
+            dict: The job record (status 'queued' for a new job)
+        """
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        payload = payload or {}
+        digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+        dedup_key = f'{job_type}:{user_id}:{digest}'
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'type': job_type,
+            'user_id': user_id,
+            'payload': payload,
+            'status': QUEUED,
+            'attempts': 0,
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+            'run_at': now,
+            'dedup_key': dedup_key,
+        }
+
+        # Held until the job finishes; the TTL only matters if that never happens
+        dedup_ttl = max(1, int(self.job_timeout * self.max_attempts))
+        existing_id = self.store.claim_dedup(dedup_key, job['id'], dedup_ttl)
+        if existing_id is not None:
+            existing = self.store.get(existing_id)
+            if existing is not None and existing['status'] not in (SUCCEEDED, FAILED):
+                self.metrics['deduplicated'] += 1
+                return existing
+            # The claim outlived its job; take it over
+            self.store.release_dedup(dedup_key, existing_id)
+            self.store.claim_dedup(dedup_key, job['id'], dedup_ttl)
+
+        self.store.save(job)
+        self.store.push(job['id'])
+        self.metrics['enqueued'] += 1
+        self.start_workers()
+        return job
+
+    def get(self, job_id):
+        """
+        Get a job record
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            dict: Job record, or None if unknown or expired
+        """
+        return self.store.get(job_id)
+
+    def start_workers(self):
+        """Start this process's worker threads (no-op if already running here)"""
+        # Started lazily (and again after fork) so each process has its own threads
+        if not self.worker_threads or self._workers_pid == os.getpid():
+            return
+        with self._workers_guard:
+            if self._workers_pid == os.getpid():
+                return
+            self._workers_pid = os.getpid()
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True)
+                for index in range(self.worker_threads)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        """
+        Stop this process's worker threads after their current jobs
+
+        Args:
+            timeout: Seconds to wait for each thread
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._workers_pid = None
+
+    def run_forever(self):
+        """Run jobs on worker_threads threads until interrupted (for `flask jobs-worker`)"""
+        self.start_workers()
+        try:
+            while any(thread.is_alive() for thread in self._threads):
+                time.sleep(1)
+        finally:
+            self.stop()
+
+    def _work(self):
+        next_reap = 0
+        while not self._stop.is_set():
+            try:
+                self.store.promote_due()
+                if time.time() >= next_reap:
+                    next_reap = time.time() + 60
+                    for job_id in self.store.reap(self.job_timeout):
+                        self._retry_lost(job_id)
+                job_id = self.store.claim(timeout=1)
+                if job_id is not None:
+                    self._run(job_id)
+            except Exception:
+                logger.exception("Job worker iteration failed")
+                self._stop.wait(1)
+
+    def _run(self, job_id):
+        job = self.store.get(job_id)
+        if job is None or job['status'] in (SUCCEEDED, FAILED, RUNNING):
+            self.store.finish(job_id)
+            return
+        handler = self.handlers.get(job['type'])
+        job.update(status=RUNNING, attempts=job['attempts'] + 1, updated_at=time.time())
+        self.store.save(job)
+        self.metrics['running'] += 1
+        try:
+            with self.app.app_context():
+                result = handler(job['user_id'], job['payload'])
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            job.update(status=SUCCEEDED, result=result, error=None, updated_at=time.time())
+            self.metrics['succeeded'] += 1
+            self._finish(job)
+        finally:
+            self.metrics['running'] -= 1
+
+    def _fail(self, job, error):
+        if is_retryable(error) and job['attempts'] < self.max_attempts:
+            delay = min(self.retry_backoff * (2 ** (job['attempts'] - 1)) * random.uniform(0.5, 1.5),
+                        self.retry_backoff_max)
+            if isinstance(error, SpotifyRateLimitedError):
+                delay = max(delay, error.retry_after)
+            job.update(status=RETRYING, error=str(error), run_at=time.time() + delay, updated_at=time.time())
+            self.store.save(job)
+            self.store.push(job['id'], job['run_at'])
+            self.metrics['retried'] += 1
+            logger.warning("Job %s (%s) failed, retrying in %.0fs: %s", job['id'], job['type'], delay, error)
+            return
+
+        if isinstance(error, JobError):
+            message = str(error)
+        else:
+            logger.error("Job %s (%s) failed", job['id'], job['type'], exc_info=error)
+            message = 'The job could not be completed'
+        job.update(status=FAILED, error=message, updated_at=time.time())
+        self.metrics['failed'] += 1
+        self._finish(job)
+
+    def _finish(self, job):
+        self.store.save(job)
+        self.store.finish(job['id'])
+        self.store.release_dedup(job['dedup_key'], job['id'])
+
+    def _retry_lost(self, job_id):
+        job = self.store.get(job_id)
+        if job is None or job['status'] != RUNNING:
+            return
+        logger.warning("Job %s (%s) timed out or its worker died", job_id, job['type'])
+        self._fail(job, JobError('The job timed out') if job['attempts'] >= self.max_attempts
+                   else requests.exceptions.Timeout('Job worker was lost'))
+
+
+def job_view(job):
+    """
+    Get the fields of a job that are shown to its user
+
+    Args:
+        job: Job record
+
+    Returns:
+        dict: Public job fields
+    """
+    return {field: job.get(field) for field in PUBLIC_FIELDS}
+
+
+def init_job_queue(app):
+    """
+    Create the job queue, register the job handlers and attach it to the app
+
+    Uses Redis when Redis sessions are configured, the database otherwise
+    (both shared by all workers). Worker threads start lazily, on first
+    enqueue or via start_job_workers.
+
+    Args:
+        app: Flask application instance
+    """
+    from services.jobs import JOB_HANDLERS
+
+    config = app.config
+    if config.get('SESSION_TYPE') == 'redis' and config.get('SESSION_REDIS') is not None:
+        store = RedisJobStore(config['SESSION_REDIS'], ttl=config.get('JOB_RESULT_TTL', 86400))
+    else:
+        store = DatabaseJobStore(app, ttl=config.get('JOB_RESULT_TTL', 86400))
+    queue = JobQueue(
+        app,
+        store,
+        worker_threads=config.get('JOB_WORKER_THREADS', 2),
+        max_attempts=config.get('JOB_MAX_ATTEMPTS', 3),
+        retry_backoff=config.get('JOB_RETRY_BACKOFF', 5.0),
+        retry_backoff_max=config.get('JOB_RETRY_BACKOFF_MAX', 300.0),
+        job_timeout=config.get('JOB_TIMEOUT', 900)
+    )
+    for job_type, handler in JOB_HANDLERS.items():
+        queue.register(job_type, handler)
+    app.extensions['job_queue'] = queue
+
+
+def get_job_queue():
+    """
+    Get the job queue for the current app
+
+    Returns:
+        JobQueue: Queue attached by init_job_queue
+    """
+    from flask import current_app
+    return current_app.extensions['job_queue']
@@ -0,0 +1,211 @@
+"""
+Jobs
+Handlers for the work routes hand to the job queue (syncs, mood playlists, playlist writes)
+
+Each handler runs in an app context on a job worker thread and is called
+as handler(user_id, payload). It loads the user's Spotify tokens from the
+token vault itself (refreshing them if needed), so tokens are never
+stored in job records. Their Spotify calls wait up to JOB_SPOTIFY_MAX_WAIT
+for rate limit quota instead of failing fast like request handlers.
+"""
+import asyncio
+import logging
+
+import requests
+from flask import current_app
+
+from services.async_spotify_service import AsyncSpotifyService
+from services.audio_feature_fetcher import get_audio_feature_fetcher
+from services.feature_store import get_feature_store
+from services.job_queue import JobError
+from services.library_store import LibraryStore
+from services.playlist_cache import get_playlist_cache
+from services.similarity_store import get_similarity_store
+from services.spotify_rate_limiter import bind_rate_limit_user
+from services.spotify_service import SpotifyService
+from services.token_refresher import get_token_refresher
+from services.token_vault import get_token_vault
+
+logger = logging.getLogger(__name__)
+
+
+def spotify_access_token(user_id):
+    """
+    Get a usable Spotify access token for a user
+
+    Args:
+        user_id: App user ID
+
+    Returns:
+        str: Access token, refreshed first if it was about to expire
+
+    Raises:
+        JobError: If the user hasn't connected Spotify
+    """
+    tokens = get_token_vault().get(user_id)
+    if tokens is None:
+        raise JobError('Spotify not connected')
+    if tokens.get('refresh_token'):
+        tokens = get_token_refresher().ensure_fresh(user_id, tokens) or tokens
+    bind_rate_limit_user(user_id, tokens['access_token'])
+    return tokens['access_token']
+
+
+def sync_library(user_id, payload):
+    """
+    Sync the user's library from Spotify into the database
+
+    Args:
+        user_id: App user ID
+        payload: Unused
+
+    Returns:
+        dict: LibrarySync summary
+    """
+    from models import db
+    from services.library_sync import LibrarySync
+
+    try:
+        spotify_service = SpotifyService(rate_limit_wait=current_app.config.get('JOB_SPOTIFY_MAX_WAIT', 30.0))
+        summary = LibrarySync(spotify_service=spotify_service).sync(user_id, spotify_access_token(user_id))
+    except Exception:
+        db.session.rollback()
+        raise
+    get_playlist_cache().invalidate_user(user_id)
+    if summary['audio_features_fetched']:
+        # Publish the new features to the files workers map; readers update stale files
+        # themselves, so a failure here doesn't fail the sync
+        for name, store in (('feature file', get_feature_store()), ('similarity index', get_similarity_store())):
+            try:
+                store.update()
+            except Exception:
+                logger.warning("Could not add synced tracks to the %s", name, exc_info=True)
+    return summary
+
+
+def build_mood_playlist(user_id, payload):
+    """
+    Rank the user's tracks against a mood
+
+    Tracks and features come from the database after a recent library sync
+    (saved tracks plus all synced playlists by default), otherwise from
+    Spotify (saved tracks plus the first MOOD_SOURCE_PLAYLISTS).
+
+    Args:
+        user_id: App user ID
+        payload: Validated mood request (mood, targets, limit, playlist_ids)
+
+    Returns:
+        dict: Mood, library size and the ranked tracks
+    """
+    # NumPy is only loaded once a mood playlist is actually requested
+    from services.mood_engine import FeatureMatrix, MoodEngine
+
+    engine = MoodEngine()
+    target, weights = engine.mood_vector(payload['mood'], payload['targets'])
+    playlist_ids = payload['playlist_ids']
+
+    store = LibraryStore()
+    if store.is_synced(user_id, current_app.config.get('LIBRARY_SYNC_MAX_AGE', 3600)):
+        # Features come from the feature file every worker maps
+        tracks, _ = store.get_library_tracks(user_id, playlist_ids, with_features=False)
+        features = get_feature_store().matrix(list(tracks))
+    else:
+        access_token = spotify_access_token(user_id)
+        source_count = current_app.config.get('MOOD_SOURCE_PLAYLISTS', 20)
+        rate_limit_wait = current_app.config.get('JOB_SPOTIFY_MAX_WAIT', 30.0)
+        spotify_service = AsyncSpotifyService(rate_limit_wait=rate_limit_wait)
+        tracks = asyncio.run(_fetch_library_tracks(spotify_service, access_token, user_id, playlist_ids, source_count))
+        audio_features = get_audio_feature_fetcher().get_audio_features(
+            access_token, list(tracks), SpotifyService(rate_limit_wait=rate_limit_wait)
+        )
+        features = FeatureMatrix.from_audio_features(audio_features)
+
+    ranked = engine.rank(features, target, weights, payload['limit'])
+    return {
+        'mood': payload['mood'],
+        'library_size': len(tracks),
+        'scored': len(features),
+        'tracks': [
+            {
+                'id': track_id,
+                'name': tracks[track_id].get('name'),
+                'uri': tracks[track_id].get('uri'),
+                'artists': [artist.get('name') for artist in tracks[track_id].get('artists', [])],
+                'album': (tracks[track_id].get('album') or {}).get('name'),
+                'score': round(score, 4)
+            }
+            for track_id, score in ranked
+        ]
+    }
+
+
+async def _fetch_library_tracks(spotify_service, access_token, user_id, playlist_ids, source_count):
+    # A playlist's tracks are fetched again only once the listing shows a new snapshot_id
+    playlist_cache = get_playlist_cache()
+    playlists = playlist_cache.get_playlists(user_id)
+    if playlists is None:
+        playlists = await spotify_service.get_user_playlists(access_token, fetch_all=True)
+        if not playlists.get('partial'):
+            playlist_cache.set_playlists(user_id, playlists)
+    snapshots = {
+        item['id']: item.get('snapshot_id')
+        for item in playlists.get('items', []) if item and item.get('id')
+    }
+    if playlist_ids is None:
+        playlist_ids = list(snapshots)[:source_count]
+
+    current = {playlist_id: snapshots[playlist_id] for playlist_id in playlist_ids if snapshots.get(playlist_id)}
+    playlist_tracks = playlist_cache.get_playlist_entries(user_id, current)
+    cached = set(playlist_tracks)
+    tracks = await spotify_service.get_library_tracks(access_token, playlist_ids, playlist_tracks)
+    playlist_cache.set_playlist_entries(user_id, {
+        playlist_id: (current[playlist_id], playlist_tracks[playlist_id])
+        for playlist_id in current if playlist_id in playlist_tracks and playlist_id not in cached
+    })
+    return tracks
+
+
+def write_playlist(user_id, payload):
+    """
+    Apply a recorded playlist write to Spotify, resuming after earlier attempts
+
+    Args:
+        user_id: App user ID
+        payload: {'write_id': PlaylistWrite ID}
+
+    Returns:
+        dict: PlaylistWriter.run summary
+    """
+    from models import db, PlaylistWrite
+    from services.playlist_writer import RECONNECT_MESSAGE, PlaylistWriter
+
+    write = db.session.get(PlaylistWrite, payload['write_id'])
+    if write is None or write.user_id != user_id:
+        raise JobError('Playlist write not found')
+    spotify_service = SpotifyService(rate_limit_wait=current_app.config.get('JOB_SPOTIFY_MAX_WAIT', 30.0))
+    try:
+        summary = PlaylistWriter(spotify_service).run(write, spotify_access_token(user_id))
+    except requests.exceptions.HTTPError as e:
+        db.session.rollback()
+        if e.response is not None and e.response.status_code == 403:
+            # Retrying won't help until the user grants the scopes; the write can be resumed after
+            raise JobError(RECONNECT_MESSAGE) from e
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        # The listing changed even if only some chunks made it
+        get_playlist_cache().invalidate_user(user_id)
+        LibraryStore().mark_playlists_stale(user_id)
+        db.session.commit()
+    return summary
+
+
+# Job type -> handler, registered by init_job_queue
+JOB_HANDLERS = {
+    'library_sync': sync_library,
+    'mood_playlist': build_mood_playlist,
+    'playlist_write': write_playlist,
+}
@@ -0,0 +1,394 @@
+"""
+Library Store
+Database access for synced Spotify libraries: bulk upserts for the sync job
+and single-query reads for /playlists and mood playlists
+"""
+import time
+
+from sqlalchemy import delete, func, select, update
+
+from models import (
+    db,
+    FEATURE_COLUMNS,
+    AudioFeature,
+    LibrarySyncState,
+    Playlist,
+    PlaylistTrack,
+    SavedTrack,
+    Track,
+    UserPlaylist,
+)
+from utils.conditional import playlists_etag
+
+# Bind parameters per INSERT statement (SQLite builds older than 3.32 cap this at 999)
+MAX_BIND_PARAMS = {'sqlite': 999, 'postgresql': 30000}
+
+
+class LibraryStore:
+    """Reads and writes a user's synced playlists, tracks and audio features"""
+
+    def upsert(self, model, rows, update_columns=None):
+        """
+        Insert rows in multi-row statements, resolving primary-key conflicts
+
+        Uses INSERT ... ON CONFLICT on PostgreSQL and SQLite; other databases
+        fall back to session.merge per row. Does not commit.
+
+        Args:
+            model: Model class whose table receives the rows
+            rows: List of column dicts (all with the same keys)
+            update_columns: Columns overwritten on conflict (None keeps the existing row)
+        """
+        if not rows:
+            return
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            for row in rows:
+                db.session.merge(model(**row))
+            return
+
+        table = model.__table__
+        keys = [column.name for column in table.primary_key.columns]
+        chunk_size = max(1, MAX_BIND_PARAMS[dialect] // len(rows[0]))
+        for start in range(0, len(rows), chunk_size):
+            statement = insert(table).values(rows[start:start + chunk_size])
+            if update_columns:
+                statement = statement.on_conflict_do_update(
+                    index_elements=keys,
+                    set_={column: statement.excluded[column] for column in update_columns}
+                )
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=keys)
+            db.session.execute(statement)
+
+    def upsert_tracks(self, tracks):
+        """
+        Store track metadata from Spotify track objects
+
+        Args:
+            tracks: Iterable of Spotify track dicts
+        """
+        rows = {}
+        for track in tracks:
+            rows[track['id']] = {
+                'id': track['id'],
+                'name': track.get('name') or '',
+                'uri': track.get('uri'),
+                'artists': [{'id': artist.get('id'), 'name': artist.get('name')}
+                            for artist in track.get('artists') or []],
+                'album_name': (track.get('album') or {}).get('name'),
+            }
+        self.upsert(Track, list(rows.values()), update_columns=('name', 'uri', 'artists', 'album_name'))
+
+    def upsert_audio_features(self, track_ids, audio_features):
+        """
+        Store audio features, recording tracks Spotify has no analysis for
+
+        Tracks in track_ids without an entry in audio_features get an all-NULL
+        row so later syncs don't ask Spotify for them again.
+
+        Args:
+            track_ids: Track IDs that were requested
+            audio_features: Audio-feature dicts returned for them
+        """
+        now = time.time()
+        rows = {track_id: dict({name: None for name in FEATURE_COLUMNS}, track_id=track_id, fetched_at=now)
+                for track_id in track_ids}
+        for features in audio_features:
+            if features and features.get('id') in rows:
+                rows[features['id']].update({name: features.get(name) for name in FEATURE_COLUMNS})
+        self.upsert(AudioFeature, list(rows.values()), update_columns=FEATURE_COLUMNS + ('fetched_at',))
+
+    def replace_playlist_tracks(self, playlist_id, items, snapshot_id):
+        """
+        Replace a playlist's contents and mark them synced at snapshot_id
+
+        Args:
+            playlist_id: Spotify playlist ID (row must exist)
+            items: Playlist-track items in playlist order
+            snapshot_id: Snapshot the items were read at
+        """
+        tracks = [item['track'] for item in items if is_music_track(item.get('track'))]
+        self.upsert_tracks(tracks)
+        db.session.execute(delete(PlaylistTrack).where(PlaylistTrack.playlist_id == playlist_id))
+        self.upsert(PlaylistTrack, [
+            {
+                'playlist_id': playlist_id,
+                'position': position,
+                'track_id': item['track']['id'],
+                'added_at': item.get('added_at'),
+            }
+            for position, item in enumerate(items) if is_music_track(item.get('track'))
+        ])
+        db.session.execute(
+            Playlist.__table__.update()
+            .where(Playlist.id == playlist_id)
+            .values(tracks_snapshot_id=snapshot_id)
+        )
+
+    def get_sync_state(self, user_id):
+        """
+        Args:
+            user_id: User ID
+
+        Returns:
+            LibrarySyncState: Sync state, or None if the library was never synced
+        """
+        return db.session.get(LibrarySyncState, user_id)
+
+    def is_synced(self, user_id, max_age):
+        """
+        Whether the user's library was synced within max_age seconds
+
+        Args:
+            user_id: User ID
+            max_age: Maximum age in seconds of the last completed sync
+        """
+        return self.get_fresh_sync_state(user_id, max_age) is not None
+
+    def get_fresh_sync_state(self, user_id, max_age):
+        """
+        Get the sync state if the user's library was synced within max_age seconds
+
+        Args:
+            user_id: User ID
+            max_age: Maximum age in seconds of the last completed sync
+
+        Returns:
+            LibrarySyncState: Sync state, or None if never synced or too old
+        """
+        state = self.get_sync_state(user_id)
+        if state is None or state.synced_at is None or time.time() - state.synced_at > max_age:
+            return None
+        return state
+
+    def compute_playlists_etag(self, user_id):
+        """
+        ETag of the user's stored playlist listing as get_playlists returns it
+
+        Returns:
+            str: ETag value (unquoted)
+        """
+        rows = db.session.execute(
+            select(Playlist.id, Playlist.snapshot_id)
+            .join(UserPlaylist, UserPlaylist.playlist_id == Playlist.id)
+            .where(UserPlaylist.user_id == user_id)
+            .order_by(UserPlaylist.position)
+        ).all()
+        return playlists_etag([{'id': row.id, 'snapshot_id': row.snapshot_id} for row in rows], 'db')
+
+    def remove_playlist(self, user_id, playlist_id):
+        """
+        Drop a playlist from the user's stored listing and update the listing's ETag (no commit)
+
+        Args:
+            user_id: User ID
+            playlist_id: Spotify playlist ID
+        """
+        db.session.execute(delete(UserPlaylist).where(
+            UserPlaylist.user_id == user_id, UserPlaylist.playlist_id == playlist_id
+        ))
+        db.session.execute(
+            update(LibrarySyncState).where(LibrarySyncState.user_id == user_id)
+            .values(playlists_etag=self.compute_playlists_etag(user_id))
+        )
+
+    def mark_playlists_stale(self, user_id):
+        """
+        Stop serving the stored listing until the next sync (no commit)
+
+        For changes made on Spotify that the stored rows don't reflect yet
+        (created playlists, new snapshots and track counts).
+
+        Args:
+            user_id: User ID
+        """
+        db.session.execute(
+            update(LibrarySyncState).where(LibrarySyncState.user_id == user_id).values(playlists_etag=None)
+        )
+
+    def get_playlists(self, user_id):
+        """
+        Get the user's synced playlists in one query
+
+        Returns:
+            dict: Paging-object shaped like Spotify's /me/playlists (all items, 'source': 'db')
+        """
+        items = list(self.iter_playlists(user_id))
+        return {
+            'items': items,
+            'total': len(items),
+            'limit': len(items),
+            'offset': 0,
+            'next': None,
+            'previous': None,
+            'partial': False,
+            'source': 'db',
+        }
+
+    def iter_playlists(self, user_id, batch_size=500):
+        """
+        Stream the user's synced playlists in listing order
+
+        Rows are read batch_size at a time so memory stays flat.
+
+        Yields:
+            dict: Spotify-shaped playlist objects
+        """
+        rows = db.session.execute(
+            select(Playlist)
+            .join(UserPlaylist, UserPlaylist.playlist_id == Playlist.id)
+            .where(UserPlaylist.user_id == user_id)
+            .order_by(UserPlaylist.position)
+            .execution_options(yield_per=batch_size)
+        ).scalars()
+        for playlist in rows:
+            yield {
+                'id': playlist.id,
+                'name': playlist.name,
+                'snapshot_id': playlist.snapshot_id,
+                'public': playlist.public,
+                'collaborative': playlist.collaborative,
+                'owner': {'id': playlist.owner_id, 'display_name': playlist.owner_name},
+                'images': [{'url': playlist.image_url}] if playlist.image_url else [],
+                'tracks': {'total': playlist.track_count},
+            }
+
+    def count_playlists(self, user_id):
+        return db.session.execute(
+            select(func.count()).select_from(UserPlaylist).where(UserPlaylist.user_id == user_id)
+        ).scalar()
+
+    def iter_library_tracks(self, user_id, batch_size=1000):
+        """
+        Stream the user's saved and playlist tracks, ordered by name
+
+        Yields:
+            dict: Spotify-shaped track objects (id, name, uri, artists, album)
+        """
+        rows = db.session.execute(
+            select(Track.id, Track.name, Track.uri, Track.artists, Track.album_name)
+            .where(Track.id.in_(self.library_track_ids(user_id)))
+            .order_by(Track.name, Track.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for track_id, name, uri, artists, album_name in rows:
+            yield {'id': track_id, 'name': name, 'uri': uri, 'artists': artists or [], 'album': {'name': album_name}}
+
+    def count_library_tracks(self, user_id):
+        return db.session.execute(
+            select(func.count()).select_from(self.library_track_ids(user_id).subquery())
+        ).scalar()
+
+    def library_track_ids(self, user_id, playlist_ids=None):
+        """
+        Select statement for the IDs of the user's saved tracks plus playlist tracks
+
+        Args:
+            user_id: User ID
+            playlist_ids: Restrict playlist tracks to these playlists (None = all of the user's)
+
+        Returns:
+            CompoundSelect: UNION of track IDs, usable as a subquery
+        """
+        playlist_tracks = (
+            select(PlaylistTrack.track_id)
+            .join(UserPlaylist, UserPlaylist.playlist_id == PlaylistTrack.playlist_id)
+            .where(UserPlaylist.user_id == user_id)
+        )
+        if playlist_ids is not None:
+            playlist_tracks = playlist_tracks.where(PlaylistTrack.playlist_id.in_(playlist_ids))
+        return select(SavedTrack.track_id).where(SavedTrack.user_id == user_id).union(playlist_tracks)
+
+    def get_library_tracks(self, user_id, playlist_ids=None, with_features=True):
+        """
+        Get the user's tracks with their audio features in one query
+
+        Args:
+            user_id: User ID
+            playlist_ids: Playlists to include besides saved tracks (None = all synced playlists)
+            with_features: Also read audio features (False when they come from the feature store)
+
+        Returns:
+            tuple: (track ID -> Spotify-shaped track dict, list of audio-feature dicts)
+        """
+        feature_columns = [getattr(AudioFeature, name) for name in FEATURE_COLUMNS] if with_features else []
+        query = (
+            select(Track.id, Track.name, Track.uri, Track.artists, Track.album_name, *feature_columns)
+            .where(Track.id.in_(self.library_track_ids(user_id, playlist_ids)))
+        )
+        if with_features:
+            query = query.outerjoin(AudioFeature, AudioFeature.track_id == Track.id)
+        rows = db.session.execute(query).all()
+
+        tracks = {}
+        audio_features = []
+        for row in rows:
+            track_id, name, uri, artists, album_name = row[:5]
+            tracks[track_id] = {
+                'id': track_id,
+                'name': name,
+                'uri': uri,
+                'artists': artists or [],
+                'album': {'name': album_name},
+            }
+            values = row[5:]
+            if any(value is not None for value in values):
+                features = dict(zip(FEATURE_COLUMNS, values))
+                features['id'] = track_id
+                audio_features.append(features)
+        return tracks, audio_features
+
+    def get_tracks(self, track_ids):
+        """
+        Get stored tracks by ID
+
+        Args:
+            track_ids: Track IDs
+
+        Returns:
+            dict: Track ID -> Spotify-shaped track dict, for the IDs that are stored
+        """
+        if not track_ids:
+            return {}
+        rows = db.session.execute(
+            select(Track.id, Track.name, Track.uri, Track.artists, Track.album_name)
+            .where(Track.id.in_(list(track_ids)))
+        )
+        return {
+            track_id: {'id': track_id, 'name': name, 'uri': uri, 'artists': artists or [], 'album': {'name': album_name}}
+            for track_id, name, uri, artists, album_name in rows
+        }
+
+    def tracks_missing_features(self, user_id):
+        """
+        Get IDs of the user's tracks that have no audio-feature row yet
+
+        Returns:
+            list: Track IDs
+        """
+        return db.session.execute(
+            select(Track.id)
+            .outerjoin(AudioFeature, AudioFeature.track_id == Track.id)
+            .where(Track.id.in_(self.library_track_ids(user_id)), AudioFeature.track_id.is_(None))
+        ).scalars().all()
+
+    def count_saved_tracks(self, user_id):
+        return db.session.execute(
+            select(func.count()).select_from(SavedTrack).where(SavedTrack.user_id == user_id)
+        ).scalar()
+
+    def newest_saved_track(self, user_id):
+        """added_at of the most recently saved track we have stored, or None"""
+        return db.session.execute(
+            select(func.max(SavedTrack.added_at)).where(SavedTrack.user_id == user_id)
+        ).scalar()
+
+
+def is_music_track(track):
+    """True for a playable Spotify track (not a local file, episode or removed track)"""
+    return bool(track) and bool(track.get('id')) and track.get('type', 'track') == 'track'
@@ -0,0 +1,226 @@
+"""
+Library Sync
+Incrementally copies a user's Spotify playlists, saved tracks and audio features into the database
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from sqlalchemy import delete, select
+
+from models import db, LibrarySyncState, Playlist, SavedTrack, UserPlaylist
+from services.audio_feature_fetcher import get_audio_feature_fetcher
+from services.library_store import LibraryStore, is_music_track
+from services.spotify_rate_limiter import in_caller_context
+from services.spotify_service import SAVED_TRACKS_PAGE_SIZE, SKIPPABLE_STATUS_CODES, SpotifyService
+
+logger = logging.getLogger(__name__)
+
+
+class LibrarySync:
+    """
+    Syncs one user's library, fetching only what changed since the last run
+
+    - Playlists: the listing is always fetched (it is cheap); only playlists
+      whose snapshot_id differs from the one their tracks were stored at get
+      their tracks refetched.
+    - Saved tracks: pages are read newest first until they reach the stored
+      added_at cursor. If the stored count plus the saved items we don't
+      store (local files, episodes, removed tracks) then disagrees with
+      Spotify's total (tracks were removed), the saved tracks are reloaded
+      in full.
+    - Audio features: only tracks without a stored row are requested, through
+      the shared AudioFeatureFetcher so other users' fetches are reused.
+
+    Rows are written with multi-row upserts, and each step commits so an
+    interrupted sync keeps its progress.
+    """
+
+    def __init__(self, spotify_service=None, store=None, feature_fetcher=None):
+        """
+        Initialize library sync
+
+        Args:
+            spotify_service: SpotifyService used for API calls (defaults to one for current_app)
+            store: LibraryStore used for database access
+            feature_fetcher: AudioFeatureFetcher (defaults to the one attached to current_app)
+        """
+        self.spotify = spotify_service or SpotifyService()
+        self.store = store or LibraryStore()
+        self.feature_fetcher = feature_fetcher or get_audio_feature_fetcher()
+
+    def sync(self, user_id, access_token):
+        """
+        Sync the user's library
+
+        Args:
+            user_id: User ID
+            access_token: Spotify access token
+
+        Returns:
+            dict: Counts of what was fetched and written
+
+        Raises:
+            requests.exceptions.HTTPError: If Spotify fails with an error other than 403/404 on a playlist
+        """
+        started = time.time()
+        summary = {}
+        summary.update(self._sync_playlists(user_id, access_token))
+        summary.update(self._sync_saved_tracks(user_id, access_token))
+        saved_tracks_cursor = summary.pop('saved_tracks_cursor')
+        summary.update(self._sync_audio_features(user_id, access_token))
+
+        complete = not summary['playlists_partial'] and not summary['saved_tracks_partial']
+        if complete:
+            self.store.upsert(LibrarySyncState, [{
+                'user_id': user_id,
+                'saved_tracks_cursor': saved_tracks_cursor,
+                'saved_tracks_skipped': summary['saved_tracks_skipped'],
+                'playlists_etag': self.store.compute_playlists_etag(user_id),
+                'synced_at': time.time(),
+            }], update_columns=('saved_tracks_cursor', 'saved_tracks_skipped', 'playlists_etag', 'synced_at'))
+            db.session.commit()
+        summary['complete'] = complete
+        summary['duration_ms'] = round((time.time() - started) * 1000, 1)
+        return summary
+
+    def _sync_playlists(self, user_id, access_token):
+        listing = self.spotify.get_user_playlists(access_token, fetch_all=True)
+        playlists = [playlist for playlist in listing.get('items', []) if playlist and playlist.get('id')]
+
+        stored_snapshots = dict(db.session.execute(
+            select(Playlist.id, Playlist.tracks_snapshot_id)
+            .where(Playlist.id.in_([playlist['id'] for playlist in playlists]))
+        ).all()) if playlists else {}
+        changed = [playlist for playlist in playlists
+                   if stored_snapshots.get(playlist['id']) != playlist.get('snapshot_id')]
+
+        self.store.upsert(Playlist, [
+            {
+                'id': playlist['id'],
+                'name': playlist.get('name') or '',
+                'snapshot_id': playlist.get('snapshot_id'),
+                'owner_id': (playlist.get('owner') or {}).get('id'),
+                'owner_name': (playlist.get('owner') or {}).get('display_name'),
+                'public': playlist.get('public'),
+                'collaborative': bool(playlist.get('collaborative')),
+                'image_url': (playlist.get('images') or [{}])[0].get('url'),
+                'track_count': (playlist.get('tracks') or {}).get('total') or 0,
+            }
+            for playlist in playlists
+        ], update_columns=('name', 'snapshot_id', 'owner_id', 'owner_name', 'public',
+                           'collaborative', 'image_url', 'track_count'))
+
+        # A partial listing can't tell us which playlists the user dropped
+        if not listing.get('partial'):
+            db.session.execute(delete(UserPlaylist).where(UserPlaylist.user_id == user_id))
+        self.store.upsert(UserPlaylist, [
+            {'user_id': user_id, 'playlist_id': playlist['id'], 'position': position}
+            for position, playlist in enumerate(playlists)
+        ], update_columns=('position',))
+        db.session.commit()
+
+        synced, skipped = self._sync_playlist_tracks(access_token, changed)
+        return {
+            'playlists': len(playlists),
+            'playlists_changed': len(changed),
+            'playlists_synced': synced,
+            'playlists_skipped': skipped,
+            'playlists_partial': bool(listing.get('partial')) or synced + skipped < len(changed),
+        }
+
+    def _sync_playlist_tracks(self, access_token, playlists):
+        """Refetch and store the tracks of changed playlists; returns (synced, skipped)"""
+        def fetch(playlist):
+            try:
+                return self.spotify.get_playlist_tracks(access_token, playlist['id'])
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code in SKIPPABLE_STATUS_CODES:
+                    logger.info("Skipping tracks of playlist %s: HTTP %s", playlist['id'], e.response.status_code)
+                    return None
+                raise
+
+        synced = skipped = 0
+        if not playlists:
+            return synced, skipped
+        # Network fetches run in parallel; the session is only used from this thread
+        workers = max(1, min(self.spotify.page_concurrency, len(playlists)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for playlist, page in zip(playlists, executor.map(in_caller_context(fetch), playlists)):
+                if page is None:
+                    skipped += 1
+                    continue
+                if page.get('partial'):
+                    continue  # leave tracks_snapshot_id stale so the next sync retries it
+                self.store.replace_playlist_tracks(playlist['id'], page.get('items', []), playlist.get('snapshot_id'))
+                db.session.commit()
+                synced += 1
+        return synced, skipped
+
+    def _sync_saved_tracks(self, user_id, access_token):
+        state = self.store.get_sync_state(user_id)
+        cursor = state.saved_tracks_cursor if state else None
+
+        # Newest first; stop at the first page that reaches the cursor. Tracks saved
+        # in the same second share added_at, so the cursor itself is re-read and
+        # duplicates are dropped by the upsert.
+        new_items = []
+        offset = 0
+        total = 0
+        while True:
+            page = self.spotify.get_saved_tracks(access_token, offset=offset)
+            total = page.get('total', 0)
+            items = page.get('items', [])
+            fresh = [item for item in items if cursor is None or (item.get('added_at') or '') >= cursor]
+            new_items.extend(fresh)
+            if len(fresh) < len(items) or not page.get('next'):
+                break
+            offset += SAVED_TRACKS_PAGE_SIZE
+
+        self._store_saved_tracks(user_id, new_items)
+        db.session.commit()
+        partial = False
+
+        # Spotify's total also counts items we don't store. Items at the cursor were
+        # counted by the run that stored it, so only strictly newer ones are added.
+        skipped = (state.saved_tracks_skipped or 0) if cursor is not None else 0
+        skipped += sum(1 for item in new_items if not is_music_track(item.get('track'))
+                       and (cursor is None or (item.get('added_at') or '') > cursor))
+
+        if self.store.count_saved_tracks(user_id) + skipped != total:
+            # Something was unsaved (or our copy drifted): reload the whole list
+            full = self.spotify.get_saved_tracks(access_token, fetch_all=True)
+            partial = bool(full.get('partial'))
+            if not partial:
+                db.session.execute(delete(SavedTrack).where(SavedTrack.user_id == user_id))
+            self._store_saved_tracks(user_id, full.get('items', []))
+            db.session.commit()
+            new_items = full.get('items', [])
+            skipped = sum(1 for item in new_items if not is_music_track(item.get('track')))
+
+        # Newest item read, stored or not, so skipped items past the stored tracks aren't recounted
+        newest = max([item.get('added_at') or '' for item in new_items] + [cursor or ''])
+        return {
+            'saved_tracks_cursor': max(newest, self.store.newest_saved_track(user_id) or '') or None,
+            'saved_tracks': total,
+            'saved_tracks_fetched': len(new_items),
+            'saved_tracks_skipped': skipped,
+            'saved_tracks_partial': partial,
+        }
+
+    def _store_saved_tracks(self, user_id, items):
+        items = [item for item in items if is_music_track(item.get('track'))]
+        self.store.upsert_tracks(item['track'] for item in items)
+        self.store.upsert(SavedTrack, [
+            {'user_id': user_id, 'track_id': item['track']['id'], 'added_at': item.get('added_at') or ''}
+            for item in items
+        ], update_columns=('added_at',))
+
+    def _sync_audio_features(self, user_id, access_token):
+        missing = self.store.tracks_missing_features(user_id)
+        if missing:
+            audio_features = self.feature_fetcher.get_audio_features(access_token, missing, self.spotify)
+            self.store.upsert_audio_features(missing, audio_features)
+            db.session.commit()
+        return {'audio_features_fetched': len(missing)}
@@ -0,0 +1,195 @@
+"""
+Mood Engine
+Ranks a user's tracks against a mood using their Spotify audio features
+
+Features are held in a float32 NumPy matrix (one row per track, one column
+per feature, all scaled to 0..1) so a mood query is a handful of vectorized
+operations over the whole library instead of a Python loop per track.
+"""
+import numpy as np
+
+# Columns of the feature matrix, in order (the AudioFeature columns)
+from models import FEATURE_COLUMNS
+
+# Features Spotify reports outside 0..1, as (min, max) in their own units
+FEATURE_RANGES = {
+    'tempo': (0.0, 250.0),  # BPM
+    'loudness': (-60.0, 0.0),  # dB
+}
+
+# Mood presets in Spotify's units; features not listed don't affect the score
+MOOD_PRESETS = {
+    'happy': {'valence': 0.85, 'energy': 0.7, 'danceability': 0.7},
+    'sad': {'valence': 0.15, 'energy': 0.3, 'acousticness': 0.6, 'tempo': 85},
+    'energetic': {'energy': 0.9, 'danceability': 0.7, 'tempo': 140, 'loudness': -5},
+    'calm': {'energy': 0.2, 'acousticness': 0.7, 'tempo': 80, 'loudness': -18},
+    'focus': {'instrumentalness': 0.8, 'speechiness': 0.05, 'energy': 0.4},
+    'party': {'danceability': 0.85, 'energy': 0.85, 'valence': 0.7},
+    'angry': {'valence': 0.2, 'energy': 0.9, 'loudness': -4},
+    'romantic': {'valence': 0.6, 'energy': 0.4, 'acousticness': 0.5, 'tempo': 100},
+}
+
+_COLUMN_INDEX = {name: i for i, name in enumerate(FEATURE_COLUMNS)}
+_OFFSETS = np.array([FEATURE_RANGES.get(name, (0.0, 1.0))[0] for name in FEATURE_COLUMNS], dtype=np.float32)
+_SPANS = np.array([FEATURE_RANGES.get(name, (0.0, 1.0))[1] - FEATURE_RANGES.get(name, (0.0, 1.0))[0]
+                   for name in FEATURE_COLUMNS], dtype=np.float32)
+
+
+def normalize(values):
+    """
+    Scale raw feature values (last axis in FEATURE_COLUMNS order) to 0..1
+
+    Args:
+        values: Array-like of shape (..., len(FEATURE_COLUMNS))
+
+    Returns:
+        np.ndarray: float32 array of the same shape, clipped to 0..1
+    """
+    scaled = (np.asarray(values, dtype=np.float32) - _OFFSETS) / _SPANS
+    return np.clip(scaled, 0.0, 1.0)
+
+
+class FeatureMatrix:
+    """Audio features of a set of tracks as a dense, normalized float32 matrix"""
+
+    def __init__(self, track_ids, matrix):
+        """
+        Args:
+            track_ids: Track IDs, one per matrix row
+            matrix: float32 array of shape (len(track_ids), len(FEATURE_COLUMNS)), already normalized
+        """
+        self.track_ids = list(track_ids)
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    @classmethod
+    def from_audio_features(cls, audio_features):
+        """
+        Build a matrix from Spotify audio-feature objects
+
+        Entries that are None (Spotify has no analysis for the track) or miss
+        an ID are skipped; missing individual features count as the middle of
+        their range so they neither help nor hurt a track much.
+
+        Args:
+            audio_features: Iterable of audio-feature dicts from the Spotify API
+
+        Returns:
+            FeatureMatrix: Matrix with one row per usable entry
+        """
+        track_ids = []
+        rows = []
+        for features in audio_features:
+            if not features or not features.get('id'):
+                continue
+            track_ids.append(features['id'])
+            rows.append([features.get(name) for name in FEATURE_COLUMNS])
+
+        if not rows:
+            return cls([], np.empty((0, len(FEATURE_COLUMNS)), dtype=np.float32))
+        raw = np.array(rows, dtype=np.float32)  # None becomes nan
+        matrix = normalize(raw)
+        matrix[np.isnan(raw)] = 0.5
+        return cls(track_ids, np.ascontiguousarray(matrix))
+
+
+class MoodEngine:
+    """Scores tracks against a mood vector by weighted Euclidean distance"""
+
+    def mood_vector(self, mood=None, targets=None):
+        """
+        Build the normalized target and weight vectors for a mood
+
+        Args:
+            mood: Name of a preset in MOOD_PRESETS
+            targets: Dict of feature -> target value (Spotify units); overrides the preset
+
+        Returns:
+            tuple: (target vector, weight vector), both float32 of len(FEATURE_COLUMNS)
+
+        Raises:
+            ValueError: If the mood or a feature name is unknown, or nothing is targeted
+        """
+        if mood is not None and mood not in MOOD_PRESETS:
+            raise ValueError(f"Unknown mood '{mood}'")
+        wanted = dict(MOOD_PRESETS.get(mood, {}))
+        wanted.update(targets or {})
+        if not wanted:
+            raise ValueError("A mood or at least one feature target is required")
+
+        raw = np.zeros(len(FEATURE_COLUMNS), dtype=np.float32)
+        weights = np.zeros(len(FEATURE_COLUMNS), dtype=np.float32)
+        for name, value in wanted.items():
+            if name not in _COLUMN_INDEX:
+                raise ValueError(f"Unknown audio feature '{name}'")
+            raw[_COLUMN_INDEX[name]] = value
+            weights[_COLUMN_INDEX[name]] = 1.0
+        return normalize(raw), weights
+
+    def blend(self, moods):
+        """
+        Mix several moods into one target and weight vector
+
+        A feature's target is the mean of the moods that target it, weighted
+        by each mood's share; its weight is the total share of those moods,
+        relative to the most-targeted feature.
+
+        Args:
+            moods: Iterable of (mood, targets, share) as taken by mood_vector, share > 0
+
+        Returns:
+            tuple: (target vector, weight vector), both float32 of len(FEATURE_COLUMNS)
+
+        Raises:
+            ValueError: If a mood is invalid (see mood_vector)
+        """
+        total_target = np.zeros(len(FEATURE_COLUMNS), dtype=np.float32)
+        total_weight = np.zeros(len(FEATURE_COLUMNS), dtype=np.float32)
+        for mood, targets, share in moods:
+            target, weights = self.mood_vector(mood, targets)
+            total_target += target * weights * share
+            total_weight += weights * share
+        targeted = total_weight > 0
+        target = np.where(targeted, total_target / np.where(targeted, total_weight, 1.0), 0.0)
+        return target.astype(np.float32), (total_weight / total_weight.max()).astype(np.float32)
+
+    def score(self, features, target, weights):
+        """
+        Similarity of every track to the target, 1.0 being a perfect match
+
+        Args:
+            features: FeatureMatrix to score
+            target: Normalized target vector from mood_vector
+            weights: Weight vector from mood_vector
+
+        Returns:
+            np.ndarray: float32 scores in 0..1, one per row of features.matrix
+        """
+        diff = features.matrix - target
+        distance = np.sqrt((diff * diff) @ (weights / weights.sum()))
+        return 1.0 - distance
+
+    def rank(self, features, target, weights, limit=30):
+        """
+        Best matching tracks for a mood, best first
+
+        Uses argpartition so only the top `limit` rows are fully sorted.
+
+        Args:
+            features: FeatureMatrix to rank
+            target: Normalized target vector from mood_vector
+            weights: Weight vector from mood_vector
+            limit: Maximum number of tracks to return
+
+        Returns:
+            list: (track_id, score) tuples
+        """
+        if not len(features) or limit <= 0:
+            return []
+        scores = self.score(features, target, weights)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(features.track_ids[i], float(scores[i])) for i in top]
@@ -0,0 +1,192 @@
+"""
+Password Hasher
+Runs bcrypt hashing off the request thread on a bounded process pool
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.metrics import timed, BCRYPT_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherBusyError(Exception):
+    """Raised when the hashing pool is saturated and the request should back off"""
+
+    def __init__(self, retry_after=1):
+        super().__init__("Too many login attempts in progress, please retry shortly")
+        self.retry_after = retry_after
+
+
+def _generate_hash(bcrypt_instance, password, rounds):
+    """Pool worker: hash a password with the app's Flask-Bcrypt settings"""
+    hashed_password = bcrypt_instance.generate_password_hash(password, rounds)
+    # Flask-Bcrypt returns bytes; store as a string
+    if isinstance(hashed_password, bytes):
+        hashed_password = hashed_password.decode('utf-8')
+    return hashed_password
+
+
+def _check_hash(bcrypt_instance, password_hash, password):
+    """Pool worker: check a password against a stored hash"""
+    return bcrypt_instance.check_password_hash(password_hash, password)
+
+
+class PasswordHasher:
+    """
+    Bounded bcrypt executor with admission control
+
+    Hashes run in a process pool so they neither hold the GIL nor pin request
+    threads. At most workers + queue_size hashes may be running or waiting;
+    past that, callers get PasswordHasherBusyError right away instead of
+    queueing behind a burst of logins. If a pool process dies (e.g. killed
+    by the OOM killer) the broken pool is replaced and the hash retried once.
+    """
+
+    def __init__(self, bcrypt_instance, rounds=12, workers=None, queue_size=None,
+                 admission_timeout=0.05, retry_after=1):
+        """
+        Initialize password hasher
+
+        Args:
+            bcrypt_instance: Flask-Bcrypt instance (picklable; sent to pool workers)
+            rounds: bcrypt cost factor for new hashes
+            workers: Pool processes of this worker (defaults to CPU count; 0 hashes inline)
+            queue_size: Hashes allowed to wait for a free process
+            admission_timeout: Seconds to wait for a slot before rejecting
+            retry_after: Retry-After hint (seconds) returned when rejecting
+        """
+        self.bcrypt = bcrypt_instance
+        self.rounds = rounds
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.queue_size = self.workers * 4 if queue_size is None else queue_size
+        self.admission_timeout = admission_timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max(self.workers, 1) + self.queue_size)
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily so each gunicorn worker owns its pool (never inherited across fork)
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._executor_lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.admission_timeout):
+            raise PasswordHasherBusyError(self.retry_after)
+        try:
+            if self.workers == 0:
+                return fn(self.bcrypt, *args)
+            executor = self._get_executor()
+            try:
+                return executor.submit(fn, self.bcrypt, *args).result()
+            except BrokenProcessPool:
+                logger.warning("Password hashing pool broke; starting a new one")
+                self._discard_executor(executor)
+                return self._get_executor().submit(fn, self.bcrypt, *args).result()
+        finally:
+            self._slots.release()
+
+    def _discard_executor(self, executor):
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    @timed(BCRYPT_LATENCY, 'hash')
+    def hash_password(self, password):
+        """
+        Hash a password at the configured cost factor
+
+        Args:
+            password: Plain text password
+
+        Returns:
+            str: bcrypt hash
+
+        Raises:
+            PasswordHasherBusyError: If the pool is saturated
+        """
+        return self._run(_generate_hash, password, self.rounds)
+
+    @timed(BCRYPT_LATENCY, 'check')
+    def check_password(self, password_hash, password):
+        """
+        Check a password against a stored bcrypt hash
+
+        Args:
+            password_hash: Stored bcrypt hash
+            password: Plain text password
+
+        Returns:
+            bool: True if the password matches
+
+        Raises:
+            PasswordHasherBusyError: If the pool is saturated
+            ValueError: If password_hash is not a valid bcrypt hash
+        """
+        return self._run(_check_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        Check whether a hash was made with a lower cost factor than configured
+
+        Args:
+            password_hash: Stored bcrypt hash ('$2b$<rounds>$...')
+
+        Returns:
+            bool: True if the hash should be upgraded
+        """
+        try:
+            return int(password_hash.split('$')[2]) < self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    def warm_up(self):
+        """Start the pool processes now so the first logins don't pay the spawn cost"""
+        if self.workers:
+            executor = self._get_executor()
+            for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        """Stop the process pool (called when a worker exits)"""
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+def init_password_hasher(app, bcrypt_instance):
+    """
+    Create the password hasher and attach it to the app
+
+    PASSWORD_HASH_WORKERS is a per-host budget: every gunicorn worker gets
+    its own pool, so each one gets an equal share (at least one process).
+
+    Args:
+        app: Flask application instance
+        bcrypt_instance: Flask-Bcrypt instance initialized for the app
+    """
+    workers = app.config.get('PASSWORD_HASH_WORKERS')
+    if workers:
+        workers = max(1, workers // max(1, app.config.get('GUNICORN_WORKERS', 1)))
+    app.extensions['password_hasher'] = PasswordHasher(
+        bcrypt_instance,
+        rounds=app.config.get('BCRYPT_LOG_ROUNDS', 12),
+        workers=workers,
+        queue_size=app.config.get('PASSWORD_HASH_QUEUE_SIZE'),
+        admission_timeout=app.config.get('PASSWORD_HASH_ADMISSION_TIMEOUT', 0.05),
+        retry_after=app.config.get('PASSWORD_HASH_RETRY_AFTER', 1)
+    )
@@ -0,0 +1,339 @@
+"""
+Playlist Cache
+Per-user cache of Spotify playlist listings, validated by playlist snapshot_id
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from utils.conditional import playlists_etag
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with per-key TTL (used with filesystem sessions)"""
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def get_many(self, keys):
+        """Get several keys at once; returns a dict of the ones present"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, values, ttl):
+        """Set several keys (dict of key -> value) with the same TTL"""
+        with self._lock:
+            expires_at = time.time() + ttl
+            for key, value in values.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def incr_stat(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+
+class RedisCacheBackend:
+    """
+    Redis-backed cache shared by every worker
+
+    Values are stored as JSON with SETEX. Redis expires keys on its own; a
+    sorted set of keys scored by last access bounds the number of entries
+    and evicts the least recently used ones.
+    """
+
+    def __init__(self, redis_client, max_entries=2000, key_prefix='playlist_cache:'):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.key_prefix = key_prefix
+        self.lru_key = f'{key_prefix}lru'
+        self.stats_key = f'{key_prefix}stats'
+
+    def get(self, key):
+        raw = self.redis.get(self.key_prefix + key)
+        if raw is None:
+            return None
+        self.redis.zadd(self.lru_key, {key: time.time()})
+        return json.loads(raw)
+
+    def get_many(self, keys):
+        """Get several keys in one MGET; returns a dict of the ones present"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        raws = self.redis.mget([self.key_prefix + key for key in keys])
+        found = {key: json.loads(raw) for key, raw in zip(keys, raws) if raw is not None}
+        if found:
+            now = time.time()
+            self.redis.zadd(self.lru_key, {key: now for key in found})
+        return found
+
+    def set(self, key, value, ttl):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, values, ttl):
+        """Set several keys (dict of key -> value) with the same TTL in one round trip"""
+        if not values:
+            return
+        now = time.time()
+        pipe = self.redis.pipeline()
+        for key, value in values.items():
+            pipe.setex(self.key_prefix + key, int(ttl), json.dumps(value))
+        pipe.zadd(self.lru_key, {key: now for key in values})
+        pipe.zcard(self.lru_key)
+        size = pipe.execute()[-1]
+
+        overflow = size - self.max_entries
+        if overflow > 0:
+            evicted = [member for member, _ in self.redis.zpopmin(self.lru_key, overflow)]
+            if evicted:
+                keys = [self.key_prefix + (m.decode() if isinstance(m, bytes) else m) for m in evicted]
+                pipe = self.redis.pipeline()
+                pipe.delete(*keys)
+                pipe.hincrby(self.stats_key, 'evictions', len(evicted))
+                pipe.execute()
+
+    def delete(self, *keys):
+        if keys:
+            pipe = self.redis.pipeline()
+            pipe.delete(*[self.key_prefix + key for key in keys])
+            pipe.zrem(self.lru_key, *keys)
+            pipe.execute()
+
+    def delete_prefix(self, prefix):
+        keys = [key.decode() if isinstance(key, bytes) else key
+                for key in self.redis.scan_iter(match=f'{self.key_prefix}{prefix}*')]
+        self.delete(*[key[len(self.key_prefix):] for key in keys])
+
+    def incr_stat(self, name, amount=1):
+        if amount:
+            self.redis.hincrby(self.stats_key, name, amount)
+
+    def stats(self):
+        raw = self.redis.hgetall(self.stats_key)
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        for name, value in raw.items():
+            name = name.decode() if isinstance(name, bytes) else name
+            stats[name] = int(value)
+        stats['size'] = self.redis.zcard(self.lru_key)
+        return stats
+
+
+class PlaylistCache:
+    """
+    Cache in front of SpotifyService.get_user_playlists
+
+    Stores each user's full playlist listing for a short TTL, plus the
+    snapshot_id of every playlist in it. Each playlist's tracks are cached
+    under the playlist's snapshot_id and only fetched again once a listing
+    reports a different snapshot for that playlist (see jobs'
+    _fetch_library_tracks).
+    """
+
+    def __init__(self, backend, ttl=300, entry_ttl=86400):
+        """
+        Initialize playlist cache
+
+        Args:
+            backend: MemoryCacheBackend or RedisCacheBackend
+            ttl: Seconds a user's playlist listing is served without asking Spotify
+            entry_ttl: Seconds snapshot-validated per-playlist entries are kept
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.entry_ttl = entry_ttl
+
+    def get_playlists(self, user_id):
+        """
+        Get a user's cached playlist listing
+
+        Args:
+            user_id: App user ID
+
+        Returns:
+            dict: Cached playlists response, or None on a miss
+        """
+        return self.get_listing(user_id)[0]
+
+    def get_listing(self, user_id):
+        """
+        Get a user's cached playlist listing together with its ETag
+
+        Args:
+            user_id: App user ID
+
+        Returns:
+            tuple: (playlists response, ETag value), or (None, None) on a miss
+        """
+        entry = self.backend.get(f'{user_id}:playlists')
+        self.backend.incr_stat('hits' if entry else 'misses')
+        if not entry:
+            return None, None
+        etag = entry.get('etag') or playlists_etag(entry['playlists'].get('items', []), 'spotify')
+        return entry['playlists'], etag
+
+    def set_playlists(self, user_id, playlists):
+        """
+        Store a user's playlist listing and drop entries whose snapshot changed
+
+        Args:
+            user_id: App user ID
+            playlists: Full playlists response from Spotify
+
+        Returns:
+            list: IDs of playlists that are new or whose snapshot_id changed
+        """
+        snapshots = {
+            item['id']: item.get('snapshot_id')
+            for item in playlists.get('items', []) if item and item.get('id')
+        }
+        previous = self.backend.get(f'{user_id}:snapshots') or {}
+
+        changed = [pid for pid, snapshot in snapshots.items() if previous.get(pid) != snapshot]
+        removed = [pid for pid in previous if pid not in snapshots]
+        stale = changed + removed
+        if stale:
+            self.backend.delete(*[f'{user_id}:playlist:{pid}' for pid in stale])
+
+        etag = playlists_etag(playlists.get('items', []), 'spotify')
+        self.backend.set(f'{user_id}:playlists', {'playlists': playlists, 'etag': etag}, self.ttl)
+        self.backend.set(f'{user_id}:snapshots', snapshots, self.entry_ttl)
+        return changed
+
+    def get_playlist_entries(self, user_id, snapshots):
+        """
+        Get cached data for several playlists, where it matches their current snapshot
+
+        Args:
+            user_id: App user ID
+            snapshots: Playlist ID -> snapshot_id currently reported by Spotify
+
+        Returns:
+            dict: Playlist ID -> cached data, for playlists cached at that snapshot
+        """
+        keys = {f'{user_id}:playlist:{playlist_id}': playlist_id for playlist_id in snapshots}
+        found = {}
+        for key, entry in self.backend.get_many(keys).items():
+            playlist_id = keys[key]
+            if entry['snapshot_id'] == snapshots[playlist_id]:
+                found[playlist_id] = entry['data']
+        self.backend.incr_stat('hits', len(found))
+        self.backend.incr_stat('misses', len(snapshots) - len(found))
+        return found
+
+    def set_playlist_entries(self, user_id, entries):
+        """
+        Cache data for several playlists under the snapshot it was fetched at
+
+        Args:
+            user_id: App user ID
+            entries: Playlist ID -> (snapshot_id, JSON-serializable data)
+        """
+        self.backend.set_many({
+            f'{user_id}:playlist:{playlist_id}': {'snapshot_id': snapshot_id, 'data': data}
+            for playlist_id, (snapshot_id, data) in entries.items()
+        }, self.entry_ttl)
+
+    def invalidate_user(self, user_id):
+        """
+        Drop everything cached for a user (e.g. after reconnecting Spotify)
+
+        Args:
+            user_id: App user ID
+        """
+        self.backend.delete_prefix(f'{user_id}:')
+
+    def stats(self):
+        """
+        Get cache counters
+
+        Returns:
+            dict: hits, misses, evictions and current size
+        """
+        return self.backend.stats()
+
+
+def init_playlist_cache(app):
+    """
+    Create the playlist cache and attach it to the app
+
+    Reuses the session Redis connection when Redis sessions are configured,
+    otherwise falls back to an in-process cache.
+
+    Args:
+        app: Flask application instance
+    """
+    max_entries = app.config.get('PLAYLIST_CACHE_MAX_ENTRIES', 2000)
+    if app.config.get('SESSION_TYPE') == 'redis' and app.config.get('SESSION_REDIS') is not None:
+        backend = RedisCacheBackend(app.config['SESSION_REDIS'], max_entries=max_entries)
+    else:
+        backend = MemoryCacheBackend(max_entries=max_entries)
+
+    app.extensions['playlist_cache'] = PlaylistCache(
+        backend,
+        ttl=app.config.get('PLAYLIST_CACHE_TTL', 300),
+        entry_ttl=app.config.get('PLAYLIST_CACHE_ENTRY_TTL', 86400)
+    )
+
+
+def get_playlist_cache():
+    """
+    Get the playlist cache for the current app
+
+    Returns:
+        PlaylistCache: Cache attached by init_playlist_cache
+    """
+    from flask import current_app
+    return current_app.extensions['playlist_cache']
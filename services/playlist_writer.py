@@ -0,0 +1,196 @@
+"""
+Playlist Writer
+Applies chunked playlist writes to Spotify, resuming where a failed attempt stopped
+"""
+import logging
+import time
+
+from models import db, PlaylistWrite
+from services.spotify_rate_limiter import SpotifyRateLimitedError
+from services.spotify_service import PLAYLIST_WRITE_CHUNK_SIZE, SpotifyService
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('create', 'add', 'replace', 'remove')
+
+# Shown when Spotify answers 403: tokens granted before the app asked for the
+# playlist-modify scopes can read playlists but not change them
+RECONNECT_MESSAGE = 'Spotify did not allow the playlist change; reconnect Spotify to grant playlist permissions'
+
+
+class PlaylistWriter:
+    """
+    Writes a PlaylistWrite to Spotify PLAYLIST_WRITE_CHUNK_SIZE tracks at a time
+
+    Chunks are sent one after another on the shared keep-alive session (add
+    positions depend on the chunks before them). After each chunk the row
+    records how many chunks are done and the snapshot ID Spotify returned,
+    and is committed, so a retried write starts at the first missing chunk.
+
+    A chunk whose response was lost may already be on Spotify. A retry
+    compares the playlist's snapshot ID with the stored one: if they match,
+    nothing was applied since; if not, the tracks at the chunk's positions
+    are read back, and a chunk that is already there is not added again.
+    Replacing the first chunk and removing tracks are safe to repeat. A
+    retried create first looks for the (still empty) playlist an earlier
+    attempt made, so a lost response doesn't leave a duplicate behind.
+    """
+
+    def __init__(self, spotify_service=None):
+        """
+        Initialize playlist writer
+
+        Args:
+            spotify_service: SpotifyService used for API calls (defaults to one for current_app)
+        """
+        self.spotify = spotify_service or SpotifyService()
+
+    def create(self, user_id, operation, playlist_id=None, uris=(), name=None, description=None,
+               public=False, position=None):
+        """
+        Record a write to apply later
+
+        Args:
+            user_id: App user ID
+            operation: 'create', 'add', 'replace' or 'remove'
+            playlist_id: Target playlist (not for 'create')
+            uris: Track URIs to write
+            name: Name of the playlist to create
+            description: Description of the playlist to create
+            public: Whether the created playlist is public
+            position: Where to insert added tracks (None appends)
+
+        Returns:
+            PlaylistWrite: The committed write
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown playlist write: {operation}")
+        write = PlaylistWrite(
+            user_id=user_id,
+            operation=operation,
+            playlist_id=playlist_id,
+            name=name,
+            description=description,
+            public=bool(public),
+            uris=list(uris),
+            position=position,
+            created_at=time.time(),
+        )
+        db.session.add(write)
+        db.session.commit()
+        return write
+
+    def run(self, write, access_token):
+        """
+        Apply the chunks of a write that aren't on Spotify yet
+
+        Args:
+            write: PlaylistWrite to apply
+            access_token: Spotify access token of the write's user
+
+        Returns:
+            dict: write_id, operation, playlist_id, snapshot_id and track/chunk counts
+
+        Raises:
+            requests.exceptions.HTTPError: If Spotify rejects a request (progress is kept);
+                403 usually means the user's tokens predate the playlist-modify scopes
+        """
+        resuming = write.attempts > 0
+        write.attempts += 1
+        db.session.commit()
+
+        chunks = [write.uris[i:i + PLAYLIST_WRITE_CHUNK_SIZE]
+                  for i in range(0, len(write.uris), PLAYLIST_WRITE_CHUNK_SIZE)]
+
+        if write.operation == 'create' and write.playlist_id is None:
+            spotify_user = self.spotify.get_current_user(access_token)
+            # An earlier attempt may have created it and lost the response
+            playlist = self._find_created(write, spotify_user['id'], access_token) if resuming else None
+            if playlist is None:
+                playlist = self.spotify.create_playlist(
+                    access_token, spotify_user['id'], write.name, write.description or '', write.public
+                )
+            else:
+                logger.info("Playlist write %s: reusing playlist %s made by an earlier attempt", write.id, playlist['id'])
+            write.playlist_id = playlist['id']
+            write.snapshot_id = playlist.get('snapshot_id')
+            write.position = 0
+            db.session.commit()
+            resuming = False
+        elif write.operation in ('add', 'create') and write.position is None:
+            # Fix the insert position up front so every chunk has a known place
+            state = self.spotify.get_playlist_state(access_token, write.playlist_id)
+            write.position = state['tracks']['total']
+            write.snapshot_id = state['snapshot_id']
+            db.session.commit()
+            resuming = False
+        elif write.operation == 'replace' and not chunks:
+            chunks = [[]]  # replacing with nothing clears the playlist
+
+        for index in range(write.chunks_done, len(chunks)):
+            chunk = chunks[index]
+            if resuming and index == write.chunks_done and self._already_applied(write, index, chunk, access_token):
+                logger.info("Playlist write %s: chunk %d was already applied", write.id, index)
+            else:
+                write.snapshot_id = self._apply(write, index, chunk, access_token)
+            write.chunks_done = index + 1
+            db.session.commit()
+
+        write.completed_at = time.time()
+        db.session.commit()
+        return {
+            'write_id': write.id,
+            'operation': write.operation,
+            'playlist_id': write.playlist_id,
+            'snapshot_id': write.snapshot_id,
+            'tracks': len(write.uris),
+            'chunks': len(chunks),
+        }
+
+    def _apply(self, write, index, chunk, access_token):
+        if write.operation == 'remove':
+            return self.spotify.remove_playlist_tracks(access_token, write.playlist_id, chunk)
+        if write.operation == 'replace' and index == 0:
+            return self.spotify.replace_playlist_tracks(access_token, write.playlist_id, chunk)
+        return self.spotify.add_playlist_tracks(
+            access_token, write.playlist_id, chunk, self._chunk_position(write, index)
+        )
+
+    def _find_created(self, write, spotify_user_id, access_token):
+        """
+        Find the playlist an earlier attempt of a create made, if any
+
+        Until create_playlist's response is committed no track has been
+        added, so it is an empty playlist of the user's with the write's name.
+        An older empty one of the same name is just as good to fill.
+        """
+        playlists = self.spotify.get_user_playlists(access_token, fetch_all=True)
+        if playlists.get('partial'):
+            # Creating without having seen every playlist could make a duplicate; the job's backoff retries it
+            raise SpotifyRateLimitedError(1)
+        for playlist in playlists.get('items') or []:
+            if (playlist and (playlist.get('owner') or {}).get('id') == spotify_user_id
+                    and playlist.get('name') == write.name and (playlist.get('tracks') or {}).get('total') == 0):
+                return playlist
+        return None
+
+    def _chunk_position(self, write, index):
+        return (write.position or 0) + index * PLAYLIST_WRITE_CHUNK_SIZE
+
+    def _already_applied(self, write, index, chunk, access_token):
+        """
+        Check whether a chunk sent by a failed attempt reached Spotify
+
+        Only adds need checking; replacing the first chunk and removals can
+        simply be sent again.
+        """
+        if write.operation == 'remove' or (write.operation == 'replace' and index == 0):
+            return False
+        state = self.spotify.get_playlist_state(access_token, write.playlist_id)
+        if state['snapshot_id'] == write.snapshot_id:
+            return False
+        position = self._chunk_position(write, index)
+        if self.spotify.get_playlist_uris(access_token, write.playlist_id, position, len(chunk)) != chunk:
+            return False
+        write.snapshot_id = state['snapshot_id']
+        return True
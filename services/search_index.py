@@ -0,0 +1,389 @@
+"""
+Search Index
+Per-user inverted index over synced playlist names, track titles, artists and albums
+"""
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from models import LibrarySyncState, db
+from services.library_store import LibraryStore
+
+PLAYLIST, TRACK = 0, 1
+KINDS = {'playlist': PLAYLIST, 'track': TRACK}
+
+# Postings pack (doc << 2) | field into one unsigned int
+NAME, ARTIST, ALBUM = 0, 1, 2
+FIELD_WEIGHTS = (3.0, 2.0, 1.0)
+EXACT, PREFIX, FUZZY = 1.0, 0.7, 0.4
+
+MAX_QUERY_TOKENS = 8
+TOKEN = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    """
+    Split text into lowercase, accent-free search terms
+
+    Args:
+        text: Any string (None is treated as empty)
+
+    Returns:
+        list: Terms in order of appearance
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return TOKEN.findall(text)
+
+
+def within_distance(a, b, limit):
+    """Whether a and b are at most limit edits apart (swapping two adjacent letters is one edit)"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if before is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return False
+        before, previous = previous, current
+    return previous[-1] <= limit
+
+
+class UserSearchIndex:
+    """
+    Inverted index of one user's library
+
+    Each playlist and track is a document with an integer ID; postings are
+    arrays of packed (doc, field) integers, so a library of a few thousand
+    tracks costs a few hundred kilobytes. Documents can be added and
+    removed one at a time: removal only marks the ID dead, and compact()
+    rebuilds the postings once enough dead IDs pile up.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.checked_at = 0.0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        self._postings = {}  # term -> array('I') of (doc << 2) | field
+        self._terms = []  # sorted terms, rebuilt lazily for prefix/fuzzy lookups
+        self._terms_dirty = False
+        self._docs = []  # doc ID -> (kind, key, fields, detail)
+        self._doc_ids = {}  # (kind, key) -> doc ID of the live document
+        self._dead = set()
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def add(self, kind, key, fields, detail):
+        """
+        Index a document, replacing any live one with the same kind and key
+
+        Args:
+            kind: PLAYLIST or TRACK
+            key: Spotify ID
+            fields: (name, artists, album) text, in FIELD_WEIGHTS order
+            detail: Small dict returned with search results
+        """
+        doc = self._doc_ids.get((kind, key))
+        if doc is not None:
+            if self._docs[doc][2] == fields:
+                self._docs[doc] = (kind, key, fields, detail)
+                return
+            self._dead.add(doc)
+        doc = len(self._docs)
+        self._docs.append((kind, key, fields, detail))
+        self._doc_ids[(kind, key)] = doc
+        for field, text in enumerate(fields):
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = array('I')
+                    self._terms_dirty = True
+                postings.append((doc << 2) | field)
+
+    def remove(self, kind, key):
+        """Drop a document from results (its postings stay until compact())"""
+        doc = self._doc_ids.pop((kind, key), None)
+        if doc is not None:
+            self._dead.add(doc)
+
+    def keys(self):
+        """(kind, key) of every live document"""
+        return set(self._doc_ids)
+
+    def needs_compaction(self):
+        return len(self._dead) > max(64, len(self._docs) // 4)
+
+    def compact(self):
+        """Rebuild postings from the live documents, reclaiming dead IDs"""
+        live = [self._docs[doc] for doc in sorted(self._doc_ids.values())]
+        self._postings = {}
+        self._docs = []
+        self._doc_ids = {}
+        self._dead = set()
+        self._terms_dirty = True
+        for kind, key, fields, detail in live:
+            self.add(kind, key, fields, detail)
+
+    def search(self, query, limit=20, kinds=None):
+        """
+        Find documents matching every query term
+
+        Each term matches index terms exactly, by prefix (so the last word
+        can be partly typed), or, when it matches nothing that way, within
+        one edit (two for terms of eight or more characters) of a term or
+        term prefix starting with the same letter.
+
+        Args:
+            query: Free text
+            limit: Maximum results
+            kinds: Set of PLAYLIST/TRACK to include (None = both)
+
+        Returns:
+            list: (score, doc) pairs, best first
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+        if not tokens:
+            return []
+        if self._terms_dirty:
+            self._terms = sorted(self._postings)
+            self._terms_dirty = False
+
+        matched = [self._matching_terms(token) for token in tokens]
+        # Rarest tokens first, so the candidate set shrinks as fast as possible
+        matched.sort(key=lambda terms: sum(len(self._postings[term]) for term, _ in terms))
+
+        scores = None
+        for terms in matched:
+            token_scores = {}
+            for term, quality in terms:
+                for posting in self._postings[term]:
+                    doc = posting >> 2
+                    if scores is not None and doc not in scores:
+                        continue
+                    score = FIELD_WEIGHTS[posting & 3] * quality
+                    if score > token_scores.get(doc, 0):
+                        token_scores[doc] = score
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {doc: scores[doc] + score for doc, score in token_scores.items()}
+            if not scores:
+                return []
+
+        results = []
+        for doc, score in scores.items():
+            kind, _, fields, _ = self._docs[doc]
+            if doc in self._dead or (kinds is not None and kind not in kinds):
+                continue
+            results.append((-score, kind, fields[NAME].lower(), doc))
+        results.sort()
+        return [(-score, doc) for score, _, _, doc in results[:limit]]
+
+    def detail(self, doc):
+        """Search result for a document ID returned by search()"""
+        kind, key, _, detail = self._docs[doc]
+        return dict(detail, type='playlist' if kind == PLAYLIST else 'track', id=key)
+
+    def stats(self):
+        return {
+            'docs': len(self._doc_ids),
+            'dead_docs': len(self._dead),
+            'terms': len(self._postings),
+            'postings': sum(len(postings) for postings in self._postings.values()),
+        }
+
+    def _matching_terms(self, token):
+        """(term, quality) for every index term the token matches"""
+        matches = []
+        for position in range(bisect.bisect_left(self._terms, token), len(self._terms)):
+            term = self._terms[position]
+            if not term.startswith(token):
+                break
+            matches.append((term, EXACT if term == token else PREFIX))
+        if matches or len(token) < 3:
+            return matches
+
+        limit = 1 if len(token) < 8 else 2
+        start = bisect.bisect_left(self._terms, token[0])
+        end = bisect.bisect_left(self._terms, chr(ord(token[0]) + 1))
+        for term in self._terms[start:end]:
+            if len(term) < len(token) - limit:
+                continue
+            # Compare against the term's prefixes too, so a typo in a half-typed word still matches
+            if any(within_distance(token, term[:length], limit)
+                   for length in range(len(token) - limit, len(token) + limit + 1) if length <= len(term)):
+                matches.append((term, FUZZY))
+        return matches
+
+
+class SearchIndex:
+    """
+    Per-worker LRU of user search indexes, built from the synced library
+
+    An index is built on a user's first search and kept up to date by
+    comparing the library's synced_at with the version it was built at
+    (checked at most every check_interval seconds). When a sync has
+    finished since, only playlists and tracks that were added, renamed or
+    dropped are indexed or removed. At most max_users indexes are kept;
+    the least recently searched ones are evicted first, and indexes unused
+    for idle_ttl seconds are dropped.
+    """
+
+    def __init__(self, max_users=200, idle_ttl=1800, check_interval=5.0, store=None):
+        """
+        Initialize search index
+
+        Args:
+            max_users: Users whose indexes are kept in memory per worker
+            idle_ttl: Seconds an unused index is kept
+            check_interval: Seconds between checks of a user's sync version
+            store: LibraryStore used to read the synced library
+        """
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.check_interval = check_interval
+        self.store = store or LibraryStore()
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {'searches': 0, 'builds': 0, 'refreshes': 0, 'evictions': 0}
+
+    def search(self, user_id, query, limit=20, types=None):
+        """
+        Search a user's synced library
+
+        Args:
+            user_id: User ID
+            query: Free text (partial last word allowed)
+            limit: Maximum results
+            types: Iterable of 'playlist'/'track' to include (None = both)
+
+        Returns:
+            list: Result dicts (type, id, name, score, plus uri/artists/album for tracks)
+        """
+        index = self._get_index(user_id)
+        kinds = {KINDS[name] for name in types} if types else None
+        self.metrics['searches'] += 1
+        with index.lock:
+            return [dict(index.detail(doc), score=round(score, 3))
+                    for score, doc in index.search(query, limit, kinds)]
+
+    def invalidate(self, user_id):
+        """Drop a user's index from this worker (rebuilt on their next search)"""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def stats(self):
+        """
+        Get index counters
+
+        Returns:
+            dict: Counters plus users, documents, terms and postings held by this worker
+        """
+        with self._lock:
+            indexes = list(self._indexes.values())
+        totals = {'users': len(indexes), 'docs': 0, 'dead_docs': 0, 'terms': 0, 'postings': 0}
+        for index in indexes:
+            for name, value in index.stats().items():
+                totals[name] += value
+        return dict(self.metrics, **totals)
+
+    def _get_index(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = self._indexes[user_id] = UserSearchIndex()
+            self._indexes.move_to_end(user_id)
+            index.last_used = now
+            self._evict(now)
+
+        if now - index.checked_at >= self.check_interval:
+            with index.lock:
+                if now - index.checked_at >= self.check_interval:
+                    self._refresh(user_id, index)
+                    index.checked_at = now
+        return index
+
+    def _evict(self, now):
+        while len(self._indexes) > self.max_users:
+            self._indexes.popitem(last=False)
+            self.metrics['evictions'] += 1
+        for user_id, index in list(self._indexes.items()):
+            if now - index.last_used <= self.idle_ttl:
+                break  # the rest were used more recently
+            del self._indexes[user_id]
+            self.metrics['evictions'] += 1
+
+    def _refresh(self, user_id, index):
+        """Bring an index up to the user's latest sync, indexing only what changed"""
+        version = db.session.execute(
+            select(LibrarySyncState.synced_at).where(LibrarySyncState.user_id == user_id)
+        ).scalar()
+        if version == index.version:
+            return
+        self.metrics['builds' if index.version is None else 'refreshes'] += 1
+
+        stale = index.keys()
+        for playlist in self.store.iter_playlists(user_id):
+            stale.discard((PLAYLIST, playlist['id']))
+            index.add(PLAYLIST, playlist['id'], (playlist['name'], None, None), {
+                'name': playlist['name'],
+                'tracks': playlist['tracks']['total'],
+                'image_url': (playlist['images'] or [{}])[0].get('url'),
+            })
+        for track in self.store.iter_library_tracks(user_id):
+            artists = [artist.get('name') for artist in track['artists'] if artist.get('name')]
+            album = track['album']['name']
+            stale.discard((TRACK, track['id']))
+            index.add(TRACK, track['id'], (track['name'], ' '.join(artists), album), {
+                'name': track['name'],
+                'uri': track['uri'],
+                'artists': artists,
+                'album': album,
+            })
+        for kind, key in stale:
+            index.remove(kind, key)
+        if index.needs_compaction():
+            index.compact()
+        index.version = version
+
+
+def init_search_index(app):
+    """
+    Create the search index and attach it to the app
+
+    Args:
+        app: Flask application instance
+    """
+    app.extensions['search_index'] = SearchIndex(
+        max_users=app.config.get('SEARCH_INDEX_MAX_USERS', 200),
+        idle_ttl=app.config.get('SEARCH_INDEX_IDLE_TTL', 1800),
+        check_interval=app.config.get('SEARCH_INDEX_CHECK_INTERVAL', 5.0)
+    )
+
+
+def get_search_index():
+    """
+    Get the search index for the current app
+
+    Returns:
+        SearchIndex: Index attached by init_search_index
+    """
+    from flask import current_app
+    return current_app.extensions['search_index']
@@ -0,0 +1,230 @@
+"""
+Server-side sessions
+Flask-Session setup that only writes a session when its contents change
+
+The session holds just the user ID and a last-touched timestamp; Spotify
+tokens live in the token vault. With SESSION_REFRESH_EACH_REQUEST off the
+store is written when a handler changes the session, plus at most once per
+SESSION_TOUCH_INTERVAL to push its expiry forward while the user is active.
+
+Without Redis, sessions are files sharded by hash under SESSION_FILE_DIR
+(see ShardedFileSessionInterface) instead of Flask-Session's single
+flat directory.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from flask import session
+from flask_session import Session
+from flask_session.base import ServerSideSession, ServerSideSessionInterface
+from flask_session.defaults import Defaults
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # not on Windows; every process then sweeps on its own
+
+logger = logging.getLogger(__name__)
+
+# Key holding when the session was last (re)written, in whole seconds
+TOUCHED_KEY = 't'
+
+# Prefix of files being written; never read as sessions
+TEMP_PREFIX = '.tmp-'
+
+# Names cachelib's FileSystemCache gave session files (sha256 hex since cachelib 0.10, md5 hex before)
+LEGACY_FILE_NAME = re.compile(r'[0-9a-f]{64}|[0-9a-f]{32}')
+
+
+class ShardedFileSession(ServerSideSession):
+    pass
+
+
+class ShardedFileSessionInterface(ServerSideSessionInterface):
+    """
+    Stores each session in its own file under a hash-prefixed subdirectory
+
+    A session lives at <directory>/<first 2 hex chars of sha1(id)>/<sha1(id)>,
+    so no directory holds more than 1/256 of the sessions. Files are written
+    to a temp file and renamed into place, so readers never see a partial
+    session. A file's mtime is set to its expiry time: reads treat an
+    mtime in the past as missing, and a background sweep deletes expired
+    files without opening them.
+    """
+
+    session_class = ShardedFileSession
+    ttl = True  # expiry is handled here, so Flask-Session registers no cleanup
+
+    def __init__(self, app, directory, key_prefix=Defaults.SESSION_KEY_PREFIX,
+                 use_signer=Defaults.SESSION_USE_SIGNER, permanent=Defaults.SESSION_PERMANENT,
+                 sid_length=Defaults.SESSION_ID_LENGTH,
+                 serialization_format=Defaults.SESSION_SERIALIZATION_FORMAT,
+                 sweep_interval=600):
+        """
+        Initialize sharded file session storage
+
+        Args:
+            app: Flask application instance
+            directory: Root directory for session files (created if missing)
+            key_prefix: Prefix added to session IDs before hashing
+            use_signer: Sign the session ID cookie
+            permanent: Use permanent sessions
+            sid_length: Session ID length in bytes
+            serialization_format: 'msgpack' or 'json'
+            sweep_interval: Seconds between sweeps for expired sessions (0 disables)
+        """
+        self.directory = os.path.abspath(directory)
+        self.sweep_interval = sweep_interval
+        self._sweeper_pid = None
+        self._sweeper_guard = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        super().__init__(app, key_prefix, use_signer, permanent, sid_length, serialization_format)
+
+    def _path(self, store_id):
+        digest = hashlib.sha1(store_id.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _retrieve_session_data(self, store_id):
+        self._ensure_sweeper()
+        path = self._path(store_id)
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_mtime < time.time():
+                    expired = True
+                else:
+                    expired = False
+                    data = f.read()
+        except FileNotFoundError:
+            return None
+        if expired:
+            self._remove(path)
+            return None
+        try:
+            return self.serializer.decode(data)
+        except Exception:
+            return None  # unreadable (e.g. written by another format); start a new session
+
+    def _delete_session(self, store_id):
+        self._remove(self._path(store_id))
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        path = self._path(store_id)
+        shard = os.path.dirname(path)
+        os.makedirs(shard, exist_ok=True)
+        expires_at = time.time() + session_lifetime.total_seconds()
+
+        fd, temp_path = tempfile.mkstemp(dir=shard, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.serializer.encode(session))
+            os.utime(temp_path, (expires_at, expires_at))
+            os.replace(temp_path, path)
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """
+        Delete expired sessions and abandoned temp files
+
+        Only one process sweeps at a time (others skip while the lock is held).
+
+        Returns:
+            int: Number of files removed (None if another process was sweeping)
+        """
+        with open(os.path.join(self.directory, '.sweep.lock'), 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+
+            now = time.time()
+            lifetime = self.app.permanent_session_lifetime.total_seconds()
+            removed = 0
+            for entry in os.scandir(self.directory):
+                if entry.is_dir(follow_symlinks=False):
+                    for item in os.scandir(entry.path):
+                        try:
+                            mtime = item.stat(follow_symlinks=False).st_mtime
+                        except FileNotFoundError:
+                            continue
+                        # Temp files carry their creation time until renamed
+                        if item.name.startswith(TEMP_PREFIX):
+                            mtime += lifetime
+                        if mtime < now:
+                            self._remove(item.path)
+                            removed += 1
+                elif LEGACY_FILE_NAME.fullmatch(entry.name) and entry.stat().st_mtime + lifetime < now:
+                    # Flat files left by Flask-Session's old filesystem backend (cachelib)
+                    self._remove(entry.path)
+                    removed += 1
+            return removed
+
+    def _ensure_sweeper(self):
+        # Started lazily (and again after fork) so each process has its own thread
+        if not self.sweep_interval or self._sweeper_pid == os.getpid():
+            return
+        with self._sweeper_guard:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True).start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.info("Removed %d expired session files", removed)
+            except Exception:
+                logger.exception("Session sweep failed")
+
+
+def init_sessions(app):
+    """
+    Set up server-side sessions for the app
+
+    Redis sessions use Flask-Session's backend; SESSION_TYPE 'filesystem'
+    uses ShardedFileSessionInterface.
+
+    Args:
+        app: Flask application instance
+    """
+    config = app.config
+    if config.get('SESSION_TYPE') == 'filesystem':
+        app.session_interface = ShardedFileSessionInterface(
+            app,
+            config.get('SESSION_FILE_DIR', Defaults.SESSION_FILE_DIR),
+            key_prefix=config.get('SESSION_KEY_PREFIX', Defaults.SESSION_KEY_PREFIX),
+            use_signer=config.get('SESSION_USE_SIGNER', Defaults.SESSION_USE_SIGNER),
+            permanent=config.get('SESSION_PERMANENT', Defaults.SESSION_PERMANENT),
+            sid_length=config.get('SESSION_ID_LENGTH', Defaults.SESSION_ID_LENGTH),
+            serialization_format=config.get('SESSION_SERIALIZATION_FORMAT', Defaults.SESSION_SERIALIZATION_FORMAT),
+            sweep_interval=config.get('SESSION_SWEEP_INTERVAL', 600),
+        )
+    else:
+        Session(app)
+    touch_interval = config.get('SESSION_TOUCH_INTERVAL', 300)
+
+    @app.after_request
+    def touch_session(response):
+        # Only sessions a handler looked at; reading the flag itself doesn't mark access
+        if not session.accessed or 'user_id' not in session:
+            return response
+        now = int(time.time())
+        if session.modified or now - session.get(TOUCHED_KEY, 0) >= touch_interval:
+            session[TOUCHED_KEY] = now
+        return response
@@ -0,0 +1,314 @@
+"""
+Similarity Index
+Approximate nearest neighbours over the audio features of every synced track
+
+Vectors are the normalized feature rows MoodEngine scores (FEATURE_COLUMNS,
+scaled to 0..1). The index is p-stable LSH: each of `tables` hash tables
+buckets a track by `hashes` random projections floor((a . v + b) / width),
+so tracks close in feature space land in the same bucket with high
+probability. A query collects the tracks sharing a bucket with any seed
+and ranks only those exactly. Catalogues of up to exact_max tracks (and
+queries restricted to a user's library) are scanned instead, which is
+faster at that size.
+
+Every array lives in one file written with utils.mapped_file, so all
+workers map the same pages instead of loading their own copy.
+"""
+import time
+
+import numpy as np
+
+from models import FEATURE_COLUMNS
+
+DIMENSIONS = len(FEATURE_COLUMNS)
+FILE_FORMAT = 1
+
+# Bucket width in standard deviations of the projected vectors
+BUCKET_WIDTH = 0.5
+# Rows scored per step of a scan, bounding its temporary arrays
+SCAN_CHUNK = 65536
+
+
+def bucket_keys(vectors, projections, offsets, width, mixers):
+    """
+    Bucket key of each vector in each table
+
+    Args:
+        vectors: float32 array (n, DIMENSIONS)
+        projections: float32 array (tables, hashes, DIMENSIONS)
+        offsets: float32 array (tables, hashes)
+        width: Bucket width
+        mixers: uint64 array (hashes,) combining a table's hashes into one key
+
+    Returns:
+        np.ndarray: uint64 array (tables, n)
+    """
+    keys = np.empty((projections.shape[0], len(vectors)), dtype=np.uint64)
+    for start in range(0, len(vectors), SCAN_CHUNK):
+        chunk = vectors[start:start + SCAN_CHUNK]
+        projected = np.einsum('thd,nd->tnh', projections, chunk) + offsets[:, None, :]
+        levels = np.floor(projected / width).astype(np.int64).view(np.uint64)
+        keys[:, start:start + len(chunk)] = (levels * mixers).sum(axis=2)  # wraps around, which is fine for a hash
+    return keys
+
+
+class SimilarityIndex:
+    """LSH tables plus the vectors they index; arrays may be views of a mapped file"""
+
+    def __init__(self, arrays, meta):
+        """
+        Args:
+            arrays: Dict of ids, vectors, id_order, sorted_ids, keys, rows, projections, offsets, mixers
+            meta: Dict of count, tables, hashes, width, watermark, built_at, built_count, updated_at
+        """
+        self.arrays = arrays
+        self.meta = meta
+        self.ids = arrays['ids']
+        self.vectors = arrays['vectors']
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_mapped(cls, mapped):
+        """
+        Wrap an opened mapped file
+
+        Args:
+            mapped: utils.mapped_file.MappedFile
+
+        Returns:
+            SimilarityIndex: Index reading straight from the mapping
+
+        Raises:
+            ValueError: If the file was written in another format
+        """
+        if mapped.meta.get('format') != FILE_FORMAT:
+            raise ValueError(f"Unsupported similarity index format in {mapped.path}")
+        return cls(mapped.arrays, mapped.meta)
+
+    @classmethod
+    def build(cls, track_ids, vectors, tables=10, hashes=6, watermark=0.0, seed=None):
+        """
+        Build an index with fresh projections fitted to the vectors
+
+        Args:
+            track_ids: Track IDs, one per vector
+            vectors: Normalized float32 array (n, DIMENSIONS)
+            tables: Number of hash tables (more raises recall and memory)
+            hashes: Projections per table (more makes buckets smaller)
+            watermark: Newest fetched_at among the indexed features
+            seed: Random seed for the projections
+
+        Returns:
+            SimilarityIndex: In-memory index
+        """
+        rng = np.random.default_rng(seed)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, DIMENSIONS)
+        projections = rng.standard_normal((tables, hashes, DIMENSIONS)).astype(np.float32)
+        if len(vectors):
+            sample = vectors[rng.choice(len(vectors), min(len(vectors), 10000), replace=False)]
+            spread = float(np.einsum('thd,nd->tnh', projections, sample).std())
+        else:
+            spread = 1.0
+        width = max(spread * BUCKET_WIDTH, 1e-3)
+        offsets = (rng.random((tables, hashes)) * width).astype(np.float32)
+        mixers = rng.integers(1, 2 ** 63, size=hashes, dtype=np.uint64) | np.uint64(1)
+
+        now = time.time()
+        index = cls({
+            'ids': np.array(list(track_ids), dtype=np.bytes_).reshape(-1),
+            'vectors': vectors,
+            'projections': projections,
+            'offsets': offsets,
+            'mixers': mixers,
+        }, {
+            'format': FILE_FORMAT,
+            'tables': tables,
+            'hashes': hashes,
+            'width': width,
+            'watermark': watermark,
+            'built_at': now,
+            'built_count': len(vectors),
+            'updated_at': now,
+        })
+        index._hash_all()
+        return index
+
+    def insert(self, track_ids, vectors, watermark):
+        """
+        Add tracks, hashing them with the existing projections
+
+        Tracks already in the index are skipped; a rebuild picks up changed
+        features.
+
+        Args:
+            track_ids: Track IDs, one per vector
+            vectors: Normalized float32 array (n, DIMENSIONS)
+            watermark: Newest fetched_at among the new features
+
+        Returns:
+            SimilarityIndex: New in-memory index (this one is unchanged)
+        """
+        track_ids = np.array(list(track_ids), dtype=np.bytes_).reshape(-1)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, DIMENSIONS)
+        _, missing = self.rows_for(track_ids)
+        missing = set(missing)
+        fresh = [i for i, track_id in enumerate(track_ids) if track_id.decode() in missing]
+        _, first = np.unique(track_ids[fresh], return_index=True)
+        fresh = np.array(fresh, dtype=np.intp)[np.sort(first)]
+        track_ids, vectors = track_ids[fresh], vectors[fresh]
+
+        width = max(self.ids.dtype.itemsize, track_ids.dtype.itemsize, 1)
+        arrays = dict(self.arrays)
+        arrays['ids'] = np.concatenate([self.ids.astype(f'S{width}'), track_ids.astype(f'S{width}')])
+        arrays['vectors'] = np.concatenate([self.vectors, vectors])
+        meta = dict(self.meta, watermark=max(self.meta['watermark'], watermark), updated_at=time.time())
+        index = SimilarityIndex(arrays, meta)
+        index._hash_all(previous=self, new_vectors=vectors)
+        return index
+
+    def _hash_all(self, previous=None, new_vectors=None):
+        """Fill the ID lookup and the hash tables; with previous, only the new rows are hashed"""
+        arrays = self.arrays
+        arrays['id_order'] = np.argsort(self.ids, kind='stable').astype(np.uint32)
+        arrays['sorted_ids'] = self.ids[arrays['id_order']]
+        if previous is None:
+            keys = bucket_keys(self.vectors, arrays['projections'], arrays['offsets'],
+                               self.meta['width'], arrays['mixers'])
+            rows = np.broadcast_to(np.arange(len(self), dtype=np.uint32), keys.shape)
+        else:
+            new_keys = bucket_keys(new_vectors, arrays['projections'], arrays['offsets'],
+                                   self.meta['width'], arrays['mixers'])
+            new_rows = np.arange(len(previous), len(self), dtype=np.uint32)
+            keys = np.concatenate([previous.arrays['keys'], new_keys], axis=1)
+            rows = np.concatenate([previous.arrays['rows'],
+                                   np.broadcast_to(new_rows, new_keys.shape)], axis=1)
+        order = np.argsort(keys, axis=1, kind='stable')
+        arrays['keys'] = np.take_along_axis(keys, order, axis=1)
+        arrays['rows'] = np.take_along_axis(rows, order, axis=1)
+        self.meta['count'] = len(self)
+
+    def rows_for(self, track_ids):
+        """
+        Find the rows of track IDs
+
+        Args:
+            track_ids: Iterable of track IDs (str or bytes)
+
+        Returns:
+            tuple: (uint32 array of rows found, list of IDs not in the index)
+        """
+        wanted = [track_id.encode() if isinstance(track_id, str) else bytes(track_id) for track_id in track_ids]
+        if not wanted or not len(self):
+            return np.empty(0, dtype=np.uint32), [track_id.decode() for track_id in wanted]
+        sorted_ids = self.arrays['sorted_ids']
+        positions = np.searchsorted(sorted_ids, np.array(wanted, dtype=self.ids.dtype))
+        positions = np.minimum(positions, len(self) - 1)
+        found = sorted_ids[positions] == np.array(wanted, dtype=np.bytes_)
+        rows = self.arrays['id_order'][positions[found]]
+        missing = [track_id.decode() for track_id, hit in zip(wanted, found) if not hit]
+        return rows, missing
+
+    def candidates(self, seed_rows):
+        """
+        Rows sharing a bucket with any seed in any table
+
+        Args:
+            seed_rows: Rows of the seed tracks
+
+        Returns:
+            np.ndarray: Sorted unique uint32 rows (seeds included)
+        """
+        table_keys = self.arrays['keys']
+        table_rows = self.arrays['rows']
+        keys = bucket_keys(self.vectors[seed_rows], self.arrays['projections'], self.arrays['offsets'],
+                           self.meta['width'], self.arrays['mixers'])
+        parts = [np.asarray(seed_rows, dtype=np.uint32)]
+        for table in range(keys.shape[0]):
+            starts = np.searchsorted(table_keys[table], keys[table], side='left')
+            ends = np.searchsorted(table_keys[table], keys[table], side='right')
+            parts.extend(table_rows[table, start:end] for start, end in zip(starts, ends))
+        return np.unique(np.concatenate(parts))
+
+    def score(self, targets, weights, rows=None):
+        """
+        Similarity of rows to the closest target, 1.0 being a perfect match
+
+        Uses MoodEngine's measure: 1 - weighted RMS distance.
+
+        Args:
+            targets: float32 array (k, DIMENSIONS) of normalized vectors
+            weights: float32 array (DIMENSIONS,)
+            rows: Rows to score (None = all, scanned in chunks)
+
+        Returns:
+            np.ndarray: float32 scores, one per row scored
+        """
+        weights = np.asarray(weights, dtype=np.float32)
+        weights = weights / weights.sum()
+        count = len(self) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCAN_CHUNK):
+            if rows is None:
+                chunk = self.vectors[start:start + SCAN_CHUNK]
+            else:
+                chunk = self.vectors[rows[start:start + SCAN_CHUNK]]
+            best = None
+            for target in targets:
+                diff = chunk - target
+                distance = (diff * diff) @ weights
+                best = distance if best is None else np.minimum(best, distance)
+            scores[start:start + len(chunk)] = 1.0 - np.sqrt(best)
+        return scores
+
+    def similar(self, seed_rows, limit=30, rows=None, exact_max=20000):
+        """
+        Tracks closest to any of the seeds, best first (seeds excluded)
+
+        Args:
+            seed_rows: Rows of the seed tracks
+            limit: Maximum tracks returned
+            rows: Restrict results to these rows (scanned exactly)
+            exact_max: Index size up to which queries scan instead of using buckets
+
+        Returns:
+            tuple: (list of (track_id, score), whether buckets were used)
+        """
+        seed_rows = np.asarray(seed_rows, dtype=np.uint32)
+        used_buckets = False
+        if rows is None and len(self) > exact_max:
+            rows = self.candidates(seed_rows)
+            used_buckets = True
+            if len(rows) < limit + len(seed_rows):
+                rows, used_buckets = None, False  # too few neighbours share a bucket; scan instead
+        return self.nearest(self.vectors[seed_rows], limit=limit, rows=rows, exclude_rows=seed_rows), used_buckets
+
+    def nearest(self, targets, weights=None, limit=30, rows=None, exclude_rows=None):
+        """
+        Best matching tracks for one or more target vectors by exact scoring, best first
+
+        Args:
+            targets: Normalized vectors (k, DIMENSIONS); a track scores by its closest target
+            weights: Per-feature weights (None = all features equally)
+            limit: Maximum tracks returned
+            rows: Rows to score (None = every track)
+            exclude_rows: Rows never returned
+
+        Returns:
+            list: (track_id, score) tuples
+        """
+        targets = np.asarray(targets, dtype=np.float32).reshape(-1, DIMENSIONS)
+        if weights is None:
+            weights = np.ones(DIMENSIONS, dtype=np.float32)
+        scores = self.score(targets, weights, rows)
+        row_ids = np.arange(len(self), dtype=np.uint32) if rows is None else np.asarray(rows, dtype=np.uint32)
+        if exclude_rows is not None and len(exclude_rows):
+            keep = ~np.isin(row_ids, exclude_rows)
+            scores, row_ids = scores[keep], row_ids[keep]
+        limit = min(limit, len(scores))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.ids[row_ids[i]].decode(), float(scores[i])) for i in top]
@@ -0,0 +1,174 @@
+"""
+Similarity Store
+Publishes the track similarity index as a mapped file and keeps each worker on the latest version
+
+NumPy and the index code are imported on first use, so workers that never
+serve a recommendation don't load them.
+"""
+import logging
+import os
+import time
+
+from services.feature_store import load_feature_vectors
+from utils.mapped_file import MappedStore
+
+logger = logging.getLogger(__name__)
+
+
+class SimilarityStore(MappedStore):
+    """
+    Owns the similarity index file and this worker's mapping of it
+
+    update() brings the file up to date with the AudioFeature table. It
+    inserts features fetched since the file's watermark, hashing them with
+    the existing projections. It rebuilds from scratch (compaction: fresh
+    projections, changed features picked up) once the file is older than
+    compact_interval or has doubled in size since its last build. Writers
+    take an exclusive lock on a file next to the index, so only one
+    process updates it at a time. The new version is written beside the
+    old one and renamed over it.
+
+    get() returns the mapped index, refreshed as described in MappedStore.
+    """
+
+    label = 'similarity index'
+
+    def __init__(self, path, tables=10, hashes=6, exact_max=20000, check_interval=30,
+                 refresh_interval=600, compact_interval=86400):
+        """
+        Initialize similarity store
+
+        Args:
+            path: Index file shared by every worker on the host
+            tables: LSH tables of a rebuilt index
+            hashes: Projections per table of a rebuilt index
+            exact_max: Index size up to which queries scan instead of using buckets
+            check_interval: Seconds between checks for a newer file
+            refresh_interval: Seconds after which a reader has the file updated
+            compact_interval: Seconds after which an update rebuilds the index
+        """
+        super().__init__(path, check_interval, refresh_interval)
+        self.tables = tables
+        self.hashes = hashes
+        self.exact_max = exact_max
+        self.compact_interval = compact_interval
+        self.metrics.update(queries=0, bucket_queries=0, inserted=0, rebuilds=0)
+
+    def similar(self, seed_ids, limit=30, track_ids=None):
+        """
+        Tracks most like the seeds
+
+        Args:
+            seed_ids: Track IDs to find neighbours of
+            limit: Maximum tracks returned
+            track_ids: Only return these tracks (e.g. the user's library)
+
+        Returns:
+            tuple: (list of (track_id, score), list of seed IDs without indexed features)
+        """
+        index = self.get()
+        seed_rows, missing = index.rows_for(seed_ids)
+        if not len(seed_rows):
+            return [], missing
+        rows = index.rows_for(track_ids)[0] if track_ids is not None else None
+        results, used_buckets = index.similar(seed_rows, limit, rows, self.exact_max)
+        self.metrics['queries'] += 1
+        self.metrics['bucket_queries'] += used_buckets
+        return results, missing
+
+    def nearest(self, target, weights, limit=30, track_ids=None):
+        """
+        Tracks closest to a weighted target vector (scanned exactly)
+
+        Args:
+            target: Normalized target vector
+            weights: Per-feature weights
+            limit: Maximum tracks returned
+            track_ids: Only return these tracks (e.g. the user's library)
+
+        Returns:
+            list: (track_id, score) tuples, best first
+        """
+        index = self.get()
+        rows = index.rows_for(track_ids)[0] if track_ids is not None else None
+        self.metrics['queries'] += 1
+        return index.nearest([target], weights, limit, rows)
+
+    def update(self, rebuild=False):
+        """
+        Bring the index file up to date with the stored audio features
+
+        Args:
+            rebuild: Rebuild from scratch even if compaction isn't due
+
+        Returns:
+            dict: tracks indexed, tracks inserted and whether it was rebuilt
+        """
+        from services.similarity_index import SimilarityIndex
+        from utils.mapped_file import MappedFile, write_lock, write_mapped_file
+
+        with write_lock(self.path):
+            try:
+                current = SimilarityIndex.from_mapped(MappedFile(self.path))
+            except (FileNotFoundError, ValueError):
+                current = None
+            self.metrics['updates'] += 1
+
+            if current is not None and not rebuild:
+                meta = current.meta
+                rebuild = (not meta['built_count']  # bucket width was never fitted to real data
+                           or time.time() - meta['built_at'] > self.compact_interval
+                           or len(current) > 2 * max(meta['built_count'], 1000))
+            if current is None or rebuild:
+                track_ids, vectors, watermark = load_feature_vectors()
+                index = SimilarityIndex.build(track_ids, vectors, self.tables, self.hashes, watermark)
+                inserted = len(index)
+                self.metrics['rebuilds'] += 1
+            else:
+                track_ids, vectors, watermark = load_feature_vectors(since=current.meta['watermark'])
+                index = current.insert(track_ids, vectors, watermark) if track_ids else None
+                if index is None or len(index) == len(current):
+                    os.utime(self.path)  # checked and current: readers needn't update it for a while
+                    return {'tracks': len(current), 'inserted': 0, 'rebuilt': False}
+                inserted = len(index) - len(current)
+            write_mapped_file(self.path, index.meta, index.arrays)
+
+        self.metrics['inserted'] += inserted
+        logger.info("Similarity index %s: %d tracks (%d new)", 'rebuilt' if rebuild or current is None else 'updated',
+                    len(index), inserted)
+        return {'tracks': len(index), 'inserted': inserted, 'rebuilt': bool(rebuild or current is None)}
+
+    def _load(self, mapped):
+        from services.similarity_index import SimilarityIndex
+
+        return SimilarityIndex.from_mapped(mapped)
+
+
+def init_similarity_store(app):
+    """
+    Create the similarity store and attach it to the app
+
+    Args:
+        app: Flask application instance
+    """
+    config = app.config
+    app.extensions['similarity_store'] = SimilarityStore(
+        config.get('SIMILARITY_INDEX_PATH', './data/similarity.idx'),
+        tables=config.get('SIMILARITY_INDEX_TABLES', 10),
+        hashes=config.get('SIMILARITY_INDEX_HASHES', 6),
+        exact_max=config.get('SIMILARITY_INDEX_EXACT_MAX', 20000),
+        check_interval=config.get('SIMILARITY_INDEX_CHECK_INTERVAL', 30),
+        refresh_interval=config.get('SIMILARITY_INDEX_REFRESH_INTERVAL', 600),
+        compact_interval=config.get('SIMILARITY_INDEX_COMPACT_INTERVAL', 86400)
+    )
+
+
+def get_similarity_store():
+    """
+    Get the similarity store for the current app
+
+    Returns:
+        SimilarityStore: Store attached by init_similarity_store
+    """
+    from flask import current_app
+    return current_app.extensions['similarity_store']
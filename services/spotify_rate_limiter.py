@@ -0,0 +1,429 @@
+"""
+Spotify Rate Limiter
+Keeps outbound Spotify calls under the app's quota and merges duplicate GETs
+
+Spotify rate limits per client ID, so every worker shares one budget. With
+Redis the buckets live in Redis and are updated by a Lua script, so all
+workers draw from the same quota; without Redis each worker gets an equal
+share of it in-process. Every call takes a token from the app-wide bucket
+and from the calling user's bucket, so one heavy user runs out of their
+own share long before they can starve everybody else.
+
+A caller that would have to wait longer than max_wait for a token gets
+SpotifyRateLimitedError (answered with 429 and Retry-After) instead of
+queueing up behind Spotify. When Spotify itself answers 429, its
+Retry-After is recorded as a cool-down that every worker honours.
+"""
+import asyncio
+import contextvars
+import hashlib
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# (access token, user ID) of the user the current request or job calls Spotify for
+_rate_limit_user = contextvars.ContextVar('spotify_rate_limit_user', default=None)
+
+# KEYS: cool-down key, then bucket keys; ARGV: rate and capacity per bucket.
+# Takes a token from every bucket only if all of them have one; returns
+# the seconds to wait as a string (Lua numbers would be truncated).
+ACQUIRE_SCRIPT = """
+local cooldown = redis.call('PTTL', KEYS[1])
+if cooldown > 0 then
+    return tostring(cooldown / 1000)
+end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels = {}
+local wait = 0
+for i = 2, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 3])
+    local capacity = tonumber(ARGV[2 * i - 2])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+end
+for i = 2, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 3])
+    local capacity = tonumber(ARGV[2 * i - 2])
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - 1
+    end
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate * 1000) + 1000)
+end
+return tostring(wait)
+"""
+
+
+class SpotifyRateLimitedError(Exception):
+    """Raised when a Spotify call would exceed the app's or the user's quota"""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"Too many Spotify requests; retry in {self.retry_after} seconds")
+
+
+class SpotifyRateLimiter:
+    """
+    Token buckets for outbound Spotify calls plus in-flight GET coalescing
+
+    Buckets: one app-wide (rate/burst) and one per user (user_rate/user_burst),
+    keyed by the user ID bound with bind_rate_limit_user, so a refreshed
+    token keeps drawing on the same bucket (calls with a token nobody bound
+    fall back to a hash of the token). Calls made with the app's own
+    credentials (the token endpoint) only use the app-wide bucket.
+
+    With Redis, the async methods run their Redis round trips on the event
+    loop's executor, so a slow Redis doesn't stall every other call on the
+    worker's shared loop.
+    """
+
+    KEY_PREFIX = 'spotify_rate:'
+
+    def __init__(self, redis_client=None, rate=25.0, burst=100, user_rate=5.0, user_burst=50, max_wait=2.0):
+        """
+        Initialize rate limiter
+
+        Args:
+            redis_client: Redis client shared across workers (None for in-process buckets)
+            rate: App-wide Spotify calls per second (sustained)
+            burst: App-wide calls allowed in a burst
+            user_rate: Calls per second for a single user
+            user_burst: Calls a single user may make in a burst
+            max_wait: Longest a caller waits for a token before getting SpotifyRateLimitedError
+        """
+        self.redis = redis_client
+        self.rate = rate
+        self.burst = burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_wait = max_wait
+        self._script = redis_client.register_script(ACQUIRE_SCRIPT) if redis_client is not None else None
+        self._buckets = {}  # key -> [tokens, updated] for the in-process fallback
+        self._cooldown_until = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._in_flight_async = {}
+        self.metrics = {
+            'acquired': 0,
+            'waited': 0,
+            'rejected': 0,
+            'coalesced': 0,
+            'spotify_throttled': 0,
+        }
+
+    def stats(self):
+        """
+        Get limiter counters
+
+        Returns:
+            dict: Counters plus the number of GETs currently in flight
+        """
+        return dict(self.metrics, in_flight=len(self._in_flight) + len(self._in_flight_async))
+
+    def acquire(self, access_token=None, max_wait=None):
+        """
+        Take a token for one Spotify call, waiting up to max_wait
+
+        Args:
+            access_token: Caller's Spotify access token (None for app-level calls)
+            max_wait: Override of the limiter's max_wait (background jobs wait longer)
+
+        Raises:
+            SpotifyRateLimitedError: If no token frees up within max_wait
+        """
+        deadline = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+        buckets = self._bucket_specs(access_token)
+        while True:
+            wait = self._try_acquire(buckets)
+            if not wait:
+                self.metrics['acquired'] += 1
+                return
+            self._check_deadline(wait, deadline)
+            time.sleep(wait)
+
+    async def acquire_async(self, access_token=None, max_wait=None):
+        """Same as acquire, but waits (and talks to Redis) without blocking the event loop"""
+        deadline = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+        buckets = self._bucket_specs(access_token)
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._script is not None:
+                wait = await loop.run_in_executor(None, self._try_acquire, buckets)
+            else:
+                wait = self._try_acquire(buckets)
+            if not wait:
+                self.metrics['acquired'] += 1
+                return
+            self._check_deadline(wait, deadline)
+            await asyncio.sleep(wait)
+
+    def _check_deadline(self, wait, deadline):
+        if time.monotonic() + wait > deadline:
+            self.metrics['rejected'] += 1
+            raise SpotifyRateLimitedError(wait)
+        self.metrics['waited'] += 1
+
+    def throttled(self, retry_after):
+        """
+        Record that Spotify answered 429, pausing all calls until Retry-After passes
+
+        Args:
+            retry_after: Retry-After header value (seconds), or None
+        """
+        self.metrics['spotify_throttled'] += 1
+        try:
+            seconds = max(float(retry_after), 1.0)
+        except (TypeError, ValueError):
+            seconds = 1.0
+        if self.redis is not None:
+            try:
+                self.redis.set(f'{self.KEY_PREFIX}cooldown', 1, px=int(seconds * 1000))
+                return
+            except Exception:
+                logger.warning("Could not share Spotify cool-down through Redis", exc_info=True)
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+
+    async def throttled_async(self, retry_after):
+        """Same as throttled, but records the shared cool-down without blocking the event loop"""
+        if self.redis is None:
+            self.throttled(retry_after)
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self.throttled, retry_after)
+
+    def _bucket_specs(self, access_token):
+        # Resolved on the caller's side: the bound user lives in the caller's context
+        buckets = [(f'{self.KEY_PREFIX}app', self.rate, self.burst)]
+        if access_token:
+            bound = _rate_limit_user.get()
+            if bound is not None and bound[0] == access_token:
+                user_key = bound[1]
+            else:
+                user_key = 'token:' + hashlib.sha1(access_token.encode()).hexdigest()[:16]
+            buckets.append((f'{self.KEY_PREFIX}user:{user_key}', self.user_rate, self.user_burst))
+        return buckets
+
+    def _try_acquire(self, buckets):
+        """
+        Take a token from every bucket the call draws on, if all have one
+
+        Args:
+            buckets: (key, rate, capacity) of each bucket, from _bucket_specs
+
+        Returns:
+            float: 0 if the call may go ahead, otherwise seconds until it may
+        """
+        if self._script is not None:
+            args = []
+            for _, rate, capacity in buckets:
+                args.extend((rate, capacity))
+            try:
+                keys = [f'{self.KEY_PREFIX}cooldown'] + [key for key, _, _ in buckets]
+                return float(self._script(keys=keys, args=args))
+            except Exception:
+                # Keep serving on per-process buckets rather than failing every Spotify call
+                logger.warning("Spotify rate limiter fell back to in-process buckets", exc_info=True)
+        return self._try_acquire_local(buckets)
+
+    def _try_acquire_local(self, buckets):
+        with self._lock:
+            now = time.monotonic()
+            if self._cooldown_until > now:
+                return self._cooldown_until - now
+            levels = []
+            wait = 0
+            for key, rate, capacity in buckets:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = [tokens if wait else tokens - 1, now]
+            if len(self._buckets) > 10000:
+                self._prune(now)
+            return wait
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.user_rate >= self.user_burst:
+                del self._buckets[key]
+
+    def coalesce(self, key, fetch):
+        """
+        Run fetch, unless an identical call is already in flight in this process
+
+        Callers that arrive while the first call is running get its result
+        (or exception) instead of calling Spotify again. The result is shared,
+        so callers must not modify it.
+
+        Args:
+            key: Hashable identity of the call (method, URL, params, token)
+            fetch: Callable performing the call
+
+        Returns:
+            object: fetch's result
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            self.metrics['coalesced'] += 1
+            return future.result()
+
+        try:
+            result = fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    async def coalesce_async(self, key, fetch):
+        """
+        Async version of coalesce (must be awaited on the runtime loop)
+
+        Args:
+            key: Hashable identity of the call (method, URL, params, token)
+            fetch: Callable returning the coroutine that performs the call
+
+        Returns:
+            object: The coroutine's result
+        """
+        future = self._in_flight_async.get(key)
+        if future is not None:
+            self.metrics['coalesced'] += 1
+            # Shielded so a waiter that gets cancelled doesn't cancel the shared call
+            return await asyncio.shield(future)
+
+        future = self._in_flight_async[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here, so asyncio doesn't log it when nobody waited
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._in_flight_async.pop(key, None)
+
+
+def bind_rate_limit_user(user_id, access_token):
+    """
+    Charge Spotify calls made with access_token in this context to user_id's bucket
+
+    Called where the user behind a token is known (spotify_auth_required,
+    background jobs). The binding follows the context into async calls
+    scheduled from it, and is ignored for any other token.
+
+    Args:
+        user_id: App user ID
+        access_token: The user's current Spotify access token
+    """
+    _rate_limit_user.set((access_token, user_id))
+
+
+def in_caller_context(fn):
+    """
+    Wrap a function so it runs in a copy of the calling context on any thread
+
+    ThreadPoolExecutor threads don't inherit context variables, so calls
+    fanned out to them would lose the bind_rate_limit_user binding and be
+    charged to a per-token bucket. Each call gets its own copy, since one
+    context can't be entered by two threads at once.
+
+    Args:
+        fn: Function to submit to an executor
+
+    Returns:
+        callable: fn, run inside the caller's context
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def request_key(method, url, params=None, access_token=None):
+    """
+    Build the coalescing key for a Spotify call
+
+    Args:
+        method: HTTP method
+        url: Request URL
+        params: Query parameters
+        access_token: Caller's access token (calls for different users never merge)
+
+    Returns:
+        tuple: Hashable key
+    """
+    return (method, url, tuple(sorted((params or {}).items())), access_token)
+
+
+def init_spotify_rate_limiter(app):
+    """
+    Create the Spotify rate limiter and attach it to the app
+
+    Uses the session Redis connection when Redis sessions are configured;
+    otherwise each of the GUNICORN_WORKERS workers gets an equal share of
+    the app-wide quota.
+
+    Args:
+        app: Flask application instance
+    """
+    config = app.config
+    if not config.get('SPOTIFY_RATE_LIMIT_ENABLED', True):
+        return
+    redis_client = config.get('SESSION_REDIS') if config.get('SESSION_TYPE') == 'redis' else None
+    rate = config.get('SPOTIFY_RATE_LIMIT_RATE', 25.0)
+    burst = config.get('SPOTIFY_RATE_LIMIT_BURST', 100)
+    if redis_client is None:
+        workers = max(1, config.get('GUNICORN_WORKERS', 1))
+        rate, burst = rate / workers, max(1, burst // workers)
+    app.extensions['spotify_rate_limiter'] = SpotifyRateLimiter(
+        redis_client,
+        rate=rate,
+        burst=burst,
+        user_rate=config.get('SPOTIFY_RATE_LIMIT_USER_RATE', 5.0),
+        user_burst=config.get('SPOTIFY_RATE_LIMIT_USER_BURST', 50),
+        max_wait=config.get('SPOTIFY_RATE_LIMIT_MAX_WAIT', 2.0)
+    )
+
+
+def get_spotify_rate_limiter():
+    """
+    Get the Spotify rate limiter for the current app
+
+    Returns:
+        SpotifyRateLimiter: Limiter attached by init_spotify_rate_limiter, or
+            None outside an app context or when rate limiting is disabled
+    """
+    from flask import current_app, has_app_context
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('spotify_rate_limiter')
@@ -2,31 +2,77 @@
 Spotify API Service
 Handles all Spotify API interactions
 """
-import requests
+import threading
 import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import requests
+
+from services.http_client import get_http_session, get_timeout
+from services.spotify_rate_limiter import (
+    SpotifyRateLimitedError, get_spotify_rate_limiter, in_caller_context, request_key
+)
+from utils.metrics import timed, SPOTIFY_CALL_LATENCY
+
+# Largest page / batch sizes the Web API accepts for each endpoint
+SAVED_TRACKS_PAGE_SIZE = 50
+PLAYLIST_TRACKS_PAGE_SIZE = 100
+AUDIO_FEATURES_BATCH_SIZE = 100
+PLAYLIST_WRITE_CHUNK_SIZE = 100  # URIs per add/replace/remove request
+# Playlists Spotify won't return tracks for (e.g. some Spotify-owned ones) answer with these
+SKIPPABLE_STATUS_CODES = (403, 404)
+
+# Only the track fields the app uses, so playlist pages stay small
+PLAYLIST_TRACK_FIELDS = 'items(added_at,track(id,type,name,uri,artists(id,name),album(id,name))),limit,offset,total,next'
+
+
+def is_throttled(error):
+    """
+    Check whether a failed Spotify call was turned away for rate limiting
+
+    Args:
+        error: Exception raised by a Spotify call
+
+    Returns:
+        bool: True for SpotifyRateLimitedError and HTTP 429 responses
+    """
+    if isinstance(error, SpotifyRateLimitedError):
+        return True
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code == 429
+
 
 class SpotifyService:
     """Service for interacting with Spotify API"""
     
-    def __init__(self, config=None):
+    def __init__(self, config=None, http_session=None, rate_limiter=None, rate_limit_wait=None):
         """
         Initialize Spotify service
         
         Args:
             config: Flask app config object or dict with Spotify config
+            http_session: Optional requests session (defaults to the shared pooled session)
+            rate_limiter: Optional SpotifyRateLimiter (defaults to the current app's, if any)
+            rate_limit_wait: Seconds to wait for rate limit quota (defaults to the limiter's max_wait)
         """
         if config is None:
             from flask import current_app
             config = current_app.config
         
+        self.http = http_session or get_http_session(config)
+        self.limiter = rate_limiter or get_spotify_rate_limiter()
+        self.rate_limit_wait = rate_limit_wait
+        self.timeout = get_timeout(config)
+        
         self.client_id = config.get('SPOTIFY_CLIENT_ID')
         self.client_secret = config.get('SPOTIFY_CLIENT_SECRET')
         self.redirect_uri = config.get('SPOTIFY_REDIRECT_URI')
         self.auth_url = config.get('SPOTIFY_AUTH_URL')
         self.token_url = config.get('SPOTIFY_TOKEN_URL')
         self.api_base_url = config.get('SPOTIFY_API_BASE_URL')
+        self.page_concurrency = config.get('SPOTIFY_PAGINATION_CONCURRENCY', 4)
     
     def get_auth_url(self, scope='user-read-private user-read-email user-library-read', show_dialog=True):
         """
@@ -50,6 +96,7 @@ class SpotifyService:
         auth_url = f"{self.auth_url}?{urllib.parse.urlencode(params)}"
         return auth_url
     
+    @timed(SPOTIFY_CALL_LATENCY, 'exchange_code_for_tokens')
     def exchange_code_for_tokens(self, code):
         """
         Exchange authorization code for access and refresh tokens
@@ -68,10 +115,9 @@ class SpotifyService:
             'client_secret': self.client_secret
         }
         
-        response = requests.post(self.token_url, data=request_body)
-        response.raise_for_status()  # Raise exception for bad status codes
-        return response.json()
+        return self._post_token(request_body)
     
+    @timed(SPOTIFY_CALL_LATENCY, 'refresh_access_token')
     def refresh_access_token(self, refresh_token):
         """
         Refresh access token using refresh token
@@ -89,11 +135,10 @@ class SpotifyService:
             'client_secret': self.client_secret
         }
         
-        response = requests.post(self.token_url, data=request_body)
-        response.raise_for_status()
-        return response.json()
+        return self._post_token(request_body)
     
-    def get_user_playlists(self, access_token, limit=50, offset=0):
+    @timed(SPOTIFY_CALL_LATENCY, 'get_user_playlists')
+    def get_user_playlists(self, access_token, limit=50, offset=0, fetch_all=False):
         """
         Get user's playlists from Spotify
         
@@ -101,24 +146,440 @@ class SpotifyService:
             access_token: Spotify access token
             limit: Number of playlists to retrieve (max 50)
             offset: Offset for pagination
+            fetch_all: Fetch every page after offset and merge them into one response
             
         Returns:
-            dict: Playlists response from Spotify API
+            dict: Playlists response from Spotify API. With fetch_all, 'items' holds
+                every playlist in order; 'partial' is True and 'next' points at the
+                first missing page if Spotify kept rate limiting us.
         """
-        headers = {
-            'Authorization': f"Bearer {access_token}"
-        }
-        
-        params = {
-            'limit': limit,
-            'offset': offset
-        }
+        url = f"{self.api_base_url}me/playlists"
+        return self._get_paged(url, access_token, limit, offset, fetch_all)
+    
+    def iter_user_playlists(self, access_token, limit=50):
+        """
+        Yield the user's playlist pages in order as they arrive
         
+        Args:
+            access_token: Spotify access token
+            limit: Page size (max 50)
+            
+        Yields:
+            dict: Playlist pages (see _iter_pages for the throttled marker page)
+        """
         url = f"{self.api_base_url}me/playlists"
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
+        return self._iter_pages(url, access_token, limit)
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'get_saved_tracks')
+    def get_saved_tracks(self, access_token, limit=SAVED_TRACKS_PAGE_SIZE, offset=0, fetch_all=False):
+        """
+        Get tracks from the user's library ("Liked Songs"), newest first
+        
+        Args:
+            access_token: Spotify access token
+            limit: Number of tracks per page (max 50)
+            offset: Offset for pagination
+            fetch_all: Fetch every page after offset and merge them into one response
+            
+        Returns:
+            dict: Paging object of saved-track items ({'added_at', 'track'})
+        """
+        url = f"{self.api_base_url}me/tracks"
+        return self._get_paged(url, access_token, limit, offset, fetch_all)
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'get_playlist_tracks')
+    def get_playlist_tracks(self, access_token, playlist_id):
+        """
+        Get every track of a playlist
+        
+        Args:
+            access_token: Spotify access token
+            playlist_id: Spotify playlist ID
+            
+        Returns:
+            dict: Merged paging object of playlist-track items ({'added_at', 'track'})
+        """
+        url = f"{self.api_base_url}playlists/{playlist_id}/tracks"
+        params = {'fields': PLAYLIST_TRACK_FIELDS}
+        return self._get_paged(url, access_token, PLAYLIST_TRACKS_PAGE_SIZE, 0, True, params)
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'get_audio_features')
+    def get_audio_features(self, access_token, track_ids):
+        """
+        Get audio features for many tracks, AUDIO_FEATURES_BATCH_SIZE IDs per request
+        
+        Args:
+            access_token: Spotify access token
+            track_ids: Track IDs (any number)
+            
+        Returns:
+            list: Audio-feature dicts; tracks Spotify has no analysis for are omitted
+        """
+        url = f"{self.api_base_url}audio-features"
+        track_ids = list(track_ids)
+        batches = [track_ids[i:i + AUDIO_FEATURES_BATCH_SIZE]
+                   for i in range(0, len(track_ids), AUDIO_FEATURES_BATCH_SIZE)]
+        
+        def fetch_batch(batch):
+            return self._get(url, access_token, {'ids': ','.join(batch)}).get('audio_features') or []
+        
+        if not batches:
+            return []
+        workers = max(1, min(self.page_concurrency, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(in_caller_context(fetch_batch), batches))
+        return [features for batch in results for features in batch if features]
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'get_current_user')
+    def get_current_user(self, access_token):
+        """
+        Get the Spotify profile of the token's owner
+        
+        Args:
+            access_token: Spotify access token
+            
+        Returns:
+            dict: User object (id, display_name, ...)
+        """
+        return self._get(f"{self.api_base_url}me", access_token)
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'get_playlist_state')
+    def get_playlist_state(self, access_token, playlist_id):
+        """
+        Get a playlist's current snapshot ID and track count
+        
+        Args:
+            access_token: Spotify access token
+            playlist_id: Spotify playlist ID
+            
+        Returns:
+            dict: {'snapshot_id': str, 'tracks': {'total': int}}
+        """
+        url = f"{self.api_base_url}playlists/{playlist_id}"
+        return self._get(url, access_token, {'fields': 'snapshot_id,tracks.total'})
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'get_playlist_uris')
+    def get_playlist_uris(self, access_token, playlist_id, offset, limit):
+        """
+        Get the URIs of a run of a playlist's tracks
+        
+        Args:
+            access_token: Spotify access token
+            playlist_id: Spotify playlist ID
+            offset: Position of the first track
+            limit: Number of tracks (max 100)
+            
+        Returns:
+            list: Track URIs in playlist order (None for removed tracks)
+        """
+        url = f"{self.api_base_url}playlists/{playlist_id}/tracks"
+        page = self._get(url, access_token, {'fields': 'items(track(uri))', 'offset': offset, 'limit': limit})
+        return [(item.get('track') or {}).get('uri') for item in page.get('items', [])]
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'create_playlist')
+    def create_playlist(self, access_token, spotify_user_id, name, description='', public=False):
+        """
+        Create an empty playlist owned by the user
+        
+        Args:
+            access_token: Spotify access token
+            spotify_user_id: Spotify ID of the token's owner
+            name: Playlist name
+            description: Playlist description
+            public: Whether the playlist is public
+            
+        Returns:
+            dict: Playlist object of the new playlist (id, snapshot_id, ...)
+        """
+        url = f"{self.api_base_url}users/{spotify_user_id}/playlists"
+        body = {'name': name, 'description': description, 'public': public}
+        return self._write('POST', url, access_token, body)
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'add_playlist_tracks')
+    def add_playlist_tracks(self, access_token, playlist_id, uris, position=None):
+        """
+        Insert up to PLAYLIST_WRITE_CHUNK_SIZE tracks into a playlist
+        
+        Args:
+            access_token: Spotify access token
+            playlist_id: Spotify playlist ID
+            uris: Track URIs
+            position: Position to insert at (None appends)
+            
+        Returns:
+            str: The playlist's new snapshot ID
+        """
+        body = {'uris': list(uris)}
+        if position is not None:
+            body['position'] = position
+        url = f"{self.api_base_url}playlists/{playlist_id}/tracks"
+        return self._write('POST', url, access_token, body)['snapshot_id']
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'replace_playlist_tracks')
+    def replace_playlist_tracks(self, access_token, playlist_id, uris):
+        """
+        Replace every track of a playlist with up to PLAYLIST_WRITE_CHUNK_SIZE tracks
+        
+        Args:
+            access_token: Spotify access token
+            playlist_id: Spotify playlist ID
+            uris: Track URIs (empty clears the playlist)
+            
+        Returns:
+            str: The playlist's new snapshot ID
+        """
+        url = f"{self.api_base_url}playlists/{playlist_id}/tracks"
+        return self._write('PUT', url, access_token, {'uris': list(uris)})['snapshot_id']
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'remove_playlist_tracks')
+    def remove_playlist_tracks(self, access_token, playlist_id, uris):
+        """
+        Remove every occurrence of up to PLAYLIST_WRITE_CHUNK_SIZE tracks from a playlist
+        
+        Removing tracks that aren't in the playlist is a no-op, so repeating
+        a call is safe.
+        
+        Args:
+            access_token: Spotify access token
+            playlist_id: Spotify playlist ID
+            uris: Track URIs
+            
+        Returns:
+            str: The playlist's new snapshot ID
+        """
+        url = f"{self.api_base_url}playlists/{playlist_id}/tracks"
+        body = {'tracks': [{'uri': uri} for uri in uris]}
+        return self._write('DELETE', url, access_token, body)['snapshot_id']
+    
+    @timed(SPOTIFY_CALL_LATENCY, 'unfollow_playlist')
+    def unfollow_playlist(self, access_token, playlist_id):
+        """
+        Remove a playlist from the user's library (deletes it for its owner)
+        
+        Args:
+            access_token: Spotify access token
+            playlist_id: Spotify playlist ID
+        """
+        url = f"{self.api_base_url}playlists/{playlist_id}/followers"
+        self._write('DELETE', url, access_token)
+    
+    def _get(self, url, access_token, params=None):
+        """
+        GET a Spotify API resource through the rate limiter
+        
+        Identical GETs already in flight in this worker are shared rather than
+        repeated, so the returned dict must not be modified.
+        
+        Args:
+            url: Endpoint URL
+            access_token: Spotify access token
+            params: Query parameters
+            
+        Returns:
+            dict: Parsed JSON body
+            
+        Raises:
+            SpotifyRateLimitedError: If the app or user is over its quota
+            requests.exceptions.HTTPError: If Spotify answers with an error
+        """
+        def fetch():
+            if self.limiter is not None:
+                self.limiter.acquire(access_token, self.rate_limit_wait)
+            response = self.http.get(url, headers={'Authorization': f"Bearer {access_token}"},
+                                     params=params, timeout=self.timeout)
+            self._raise_for_status(response)
+            return response.json()
+        
+        if self.limiter is None:
+            return fetch()
+        return self.limiter.coalesce(request_key('GET', url, params, access_token), fetch)
+    
+    def _write(self, method, url, access_token, body=None):
+        """
+        Send a write request through the rate limiter (never coalesced)
+        
+        Args:
+            method: POST, PUT or DELETE
+            url: Endpoint URL
+            access_token: Spotify access token
+            body: JSON body
+            
+        Returns:
+            dict: Parsed JSON body ({} if Spotify sent none)
+        """
+        if self.limiter is not None:
+            self.limiter.acquire(access_token, self.rate_limit_wait)
+        response = self.http.request(method, url, headers={'Authorization': f"Bearer {access_token}"},
+                                     json=body, timeout=self.timeout)
+        self._raise_for_status(response)
+        return response.json() if response.content else {}
+    
+    def _post_token(self, request_body):
+        """
+        POST to the token endpoint through the app-wide rate limit
+        
+        Args:
+            request_body: Form fields
+            
+        Returns:
+            dict: Token response
+        """
+        if self.limiter is not None:
+            self.limiter.acquire(max_wait=self.rate_limit_wait)
+        response = self.http.post(self.token_url, data=request_body, timeout=self.timeout)
+        self._raise_for_status(response)
         return response.json()
     
+    def _raise_for_status(self, response):
+        # A 429 that outlasted the client's retries pauses every worker's calls
+        if response.status_code == 429 and self.limiter is not None:
+            self.limiter.throttled(response.headers.get('Retry-After'))
+        response.raise_for_status()
+    
+    def _get_paged(self, url, access_token, limit, offset, fetch_all, params=None):
+        """
+        Get one page of a Spotify paging object, or every page from offset on
+        
+        Args:
+            url: Endpoint returning a paging object
+            access_token: Spotify access token
+            limit: Page size
+            offset: Offset of the first page
+            fetch_all: Fetch and merge the remaining pages too
+            params: Extra query parameters sent with every page
+            
+        Returns:
+            dict: Paging object (merged when fetch_all)
+        """
+        def fetch_page(page_offset):
+            return self._get(url, access_token, dict(params or {}, limit=limit, offset=page_offset))
+        
+        first_page = fetch_page(offset)
+        if not fetch_all:
+            return first_page
+        return self._fetch_remaining_pages(fetch_page, first_page, limit, offset)
+    
+    def _iter_pages(self, url, access_token, limit, params=None):
+        """
+        Yield every page of a paging object in order, prefetching a few ahead
+        
+        The first page is fetched when the generator is first advanced (so
+        callers can handle errors before starting a response). At most
+        page_concurrency later pages are in flight at once, which keeps memory
+        bounded however large the listing is. If Spotify keeps answering 429
+        (or the rate limiter turns a page away), a final marker page {'items': [], 'partial': True, 'next': url} is
+        yielded instead of the rest.
+        
+        Args:
+            url: Endpoint returning a paging object
+            access_token: Spotify access token
+            limit: Page size
+            params: Extra query parameters sent with every page
+            
+        Yields:
+            dict: Pages in offset order
+        """
+        @timed(SPOTIFY_CALL_LATENCY, 'iter_pages')
+        def fetch_page(page_offset):
+            return self._get(url, access_token, dict(params or {}, limit=limit, offset=page_offset))
+        
+        first_page = fetch_page(0)
+        yield first_page
+        
+        offsets = iter(range(limit, first_page.get('total', 0), limit))
+        workers = max(1, self.page_concurrency)
+        fetch_page = in_caller_context(fetch_page)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque(
+                (page_offset, executor.submit(fetch_page, page_offset))
+                for _, page_offset in zip(range(workers), offsets)
+            )
+            while in_flight:
+                page_offset, future = in_flight.popleft()
+                try:
+                    page = future.result()
+                except (requests.exceptions.HTTPError, SpotifyRateLimitedError) as e:
+                    if not is_throttled(e):
+                        raise
+                    for _, pending in in_flight:
+                        pending.cancel()
+                    query = urllib.parse.urlencode(dict(params or {}, limit=limit, offset=page_offset))
+                    yield {'items': [], 'partial': True, 'next': f"{url}?{query}"}
+                    return
+                next_offset = next(offsets, None)
+                if next_offset is not None:
+                    in_flight.append((next_offset, executor.submit(fetch_page, next_offset)))
+                yield page
+    
+    def _fetch_remaining_pages(self, fetch_page, first_page, limit, offset):
+        """
+        Fetch the pages after first_page concurrently and merge them in order
+        
+        Uses 'total' from the first page to work out the remaining offsets, then
+        fetches them with at most page_concurrency requests in flight. If Spotify
+        answers 429 (after the HTTP client's own Retry-After retries) or the
+        rate limiter turns a page away, no new
+        pages are started; the missing ones are retried one at a time, and if
+        that is still throttled the contiguous prefix is returned as partial.
+        
+        Args:
+            fetch_page: Callable taking an offset and returning one page dict
+            first_page: Already fetched page at offset
+            limit: Page size
+            offset: Offset of first_page
+            
+        Returns:
+            dict: first_page with 'items' replaced by the merged items
+        """
+        offsets = list(range(offset + limit, first_page.get('total', 0), limit))
+        pages = {offset: first_page}
+        throttled = threading.Event()
+        
+        def fetch_unless_throttled(page_offset):
+            if throttled.is_set():
+                return None
+            try:
+                return fetch_page(page_offset)
+            except (requests.exceptions.HTTPError, SpotifyRateLimitedError) as e:
+                if is_throttled(e):
+                    throttled.set()
+                    return None
+                raise
+        
+        if offsets:
+            workers = max(1, min(self.page_concurrency, len(offsets)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for page_offset, page in zip(offsets, executor.map(in_caller_context(fetch_unless_throttled), offsets)):
+                    if page is not None:
+                        pages[page_offset] = page
+        
+        # Degrade to sequential fetching for pages skipped while throttled
+        for page_offset in offsets:
+            if page_offset in pages:
+                continue
+            try:
+                pages[page_offset] = fetch_page(page_offset)
+            except (requests.exceptions.HTTPError, SpotifyRateLimitedError) as e:
+                if is_throttled(e):
+                    break
+                raise
+        
+        # Merge the contiguous run of pages so offsets stay meaningful
+        items = []
+        last_page = first_page
+        for page_offset in [offset] + offsets:
+            page = pages.get(page_offset)
+            if page is None:
+                break
+            items.extend(page.get('items', []))
+            last_page = page
+        
+        merged = dict(first_page)
+        merged['items'] = items
+        merged['partial'] = any(page_offset not in pages for page_offset in offsets)
+        merged['next'] = last_page.get('next') if merged['partial'] else None
+        return merged
+    
     def is_token_expired(self, expires_at):
         """
         Check if access token has expired
@@ -0,0 +1,168 @@
+"""
+Token Refresher
+Single-flight Spotify access-token refresh shared by threads and workers
+"""
+import threading
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+
+from services.http_client import max_request_time
+from services.spotify_service import SpotifyService
+
+
+class TokenRefreshBusyError(Exception):
+    """Raised when another worker holds the refresh lock for too long"""
+    pass
+
+
+class TokenRefresher:
+    """
+    Refreshes a user's Spotify token at most once per expiry window
+
+    Concurrent callers for the same user are serialized with a per-user
+    thread lock and, when Redis is available, a Redis lock shared by every
+    worker. The winner stores the new token in the token vault; everyone
+    else re-reads it after acquiring the lock instead of calling
+    SPOTIFY_TOKEN_URL again. The Redis lock outlives the slowest possible
+    refresh (lock_ttl), so it can't expire while its holder is still
+    waiting on Spotify.
+    """
+
+    LOCK_PREFIX = 'spotify_token:'
+
+    def __init__(self, vault, redis_client=None, window=300, lock_timeout=10, lock_ttl=None):
+        """
+        Initialize token refresher
+
+        Args:
+            vault: TokenVault holding users' current tokens
+            redis_client: Redis client shared across workers (None for in-process only)
+            window: Seconds before expires_at at which a token is refreshed
+            lock_timeout: Seconds to wait for another worker's refresh
+            lock_ttl: Seconds the cross-worker lock is held at most (longer than
+                any refresh; defaults to lock_timeout)
+        """
+        self.vault = vault
+        self.redis = redis_client
+        self.window = window
+        self.lock_timeout = lock_timeout
+        self.lock_ttl = max(lock_ttl or 0, lock_timeout)
+        # Only users being refreshed right now have a lock; it goes away with its last holder
+        self._user_locks = weakref.WeakValueDictionary()
+        self._user_locks_guard = threading.Lock()
+
+    def needs_refresh(self, expires_at, window=None):
+        """
+        Check whether a token is inside the refresh window
+
+        Args:
+            expires_at: Timestamp when the token expires
+            window: Seconds of lead time (defaults to the refresher's window)
+
+        Returns:
+            bool: True if the token expires within `window` seconds
+        """
+        window = self.window if window is None else window
+        return expires_at is not None and time.time() > expires_at - window
+
+    def _user_lock(self, user_id):
+        with self._user_locks_guard:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = self._user_locks[user_id] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def _shared_lock(self, user_id):
+        lock = self.redis.lock(
+            f'{self.LOCK_PREFIX}{user_id}:lock',
+            timeout=self.lock_ttl,
+            blocking_timeout=self.lock_timeout
+        )
+        if not lock.acquire():
+            raise TokenRefreshBusyError(f"Timed out waiting for token refresh of user {user_id}")
+        try:
+            yield
+        finally:
+            try:
+                lock.release()
+            except Exception:
+                pass  # lock already gone (e.g. Redis restarted); nothing left to release
+
+    def ensure_fresh(self, user_id, tokens, config=None, window=None):
+        """
+        Return fresh tokens for a user, refreshing through Spotify only if needed
+
+        Args:
+            user_id: App user ID
+            tokens: dict with the caller's access_token, refresh_token, expires_at
+                (as read from the vault)
+            config: Optional config passed to SpotifyService
+            window: Refresh lead time override (the background scheduler refreshes
+                earlier than request-time refreshes)
+
+        Returns:
+            dict: Fresh tokens if the caller's tokens were in the refresh window,
+                None if they are still good
+
+        Raises:
+            requests.exceptions.HTTPError: If Spotify rejects the refresh
+            TokenRefreshBusyError: If another worker held the lock too long
+        """
+        if not self.needs_refresh(tokens.get('expires_at'), window):
+            return None
+
+        with self._user_lock(user_id):
+            latest = self.vault.get(user_id)
+            if latest and not self.needs_refresh(latest['expires_at'], window):
+                return latest
+
+            shared_lock = self._shared_lock(user_id) if self.redis is not None else nullcontext()
+            with shared_lock:
+                # Another worker may have finished while we waited for the lock
+                latest = self.vault.get(user_id)
+                if latest and not self.needs_refresh(latest['expires_at'], window):
+                    return latest
+
+                refresh_token = (latest or tokens).get('refresh_token')
+                token_response = SpotifyService(config).refresh_access_token(refresh_token)
+                fresh = {
+                    'access_token': token_response['access_token'],
+                    'refresh_token': token_response.get('refresh_token', refresh_token),
+                    'expires_at': time.time() + token_response.get('expires_in', 3600)
+                }
+                self.vault.set(user_id, fresh)
+                return fresh
+
+
+def init_token_refresher(app):
+    """
+    Create the token refresher and attach it to the app (after init_token_vault)
+
+    The cross-worker lock is kept for the worst case of the refresh call: the
+    rate limit wait plus every retry's timeouts and backoff, with a margin.
+
+    Args:
+        app: Flask application instance
+    """
+    redis_client = app.config.get('SESSION_REDIS') if app.config.get('SESSION_TYPE') == 'redis' else None
+    refresh_time = max_request_time(app.config, app.config.get('SPOTIFY_RATE_LIMIT_MAX_WAIT', 2.0))
+    app.extensions['token_refresher'] = TokenRefresher(
+        app.extensions['token_vault'],
+        redis_client,
+        window=app.config.get('SPOTIFY_TOKEN_REFRESH_WINDOW', 300),
+        lock_timeout=app.config.get('SPOTIFY_TOKEN_REFRESH_LOCK_TIMEOUT', 10),
+        lock_ttl=refresh_time + 5
+    )
+
+
+def get_token_refresher():
+    """
+    Get the token refresher for the current app
+
+    Returns:
+        TokenRefresher: Refresher attached by init_token_refresher
+    """
+    from flask import current_app
+    return current_app.extensions['token_refresher']
@@ -0,0 +1,272 @@
+"""
+Token Refresh Scheduler
+Background thread that refreshes Spotify tokens of active sessions before they expire
+"""
+import heapq
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+
+from services.token_refresher import TokenRefreshBusyError
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Simple thread-safe token bucket (rate tokens/second, up to capacity)"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Take one token if available
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+class TokenRefreshScheduler:
+    """
+    Keeps tokens of recently active sessions warm
+
+    Every scan_interval seconds the leader worker scans the Redis session
+    store for sessions written within active_within seconds, looks up their
+    users' tokens in the token vault, and queues tokens expiring within
+    horizon seconds in a heap ordered by expiry. Each entry is refreshed
+    `lead` seconds before the request-time refresh window would open,
+    through TokenRefresher so it stays single-flight. Calls to the token
+    endpoint are rate limited.
+    """
+
+    LEADER_KEY = 'token_scheduler:leader'
+
+    def __init__(self, app, refresher, scan_interval=60, horizon=900, lead=120,
+                 active_within=1800, rate=2.0, burst=5):
+        """
+        Initialize scheduler
+
+        Args:
+            app: Flask application instance (for config and session store access)
+            refresher: TokenRefresher used to perform refreshes
+            scan_interval: Seconds between session store scans
+            horizon: Only queue tokens expiring within this many seconds
+            lead: Extra seconds ahead of the refresher's window to refresh at
+            active_within: Only consider sessions written within this many seconds
+            rate: Token endpoint calls per second (sustained)
+            burst: Token endpoint calls allowed in a burst
+        """
+        self.app = app
+        self.refresher = refresher
+        self.vault = refresher.vault
+        self.redis = app.config['SESSION_REDIS']
+        self.scan_interval = scan_interval
+        self.horizon = horizon
+        self.lead = lead
+        self.active_within = active_within
+        self.bucket = TokenBucket(rate, burst)
+        self.metrics = {
+            'scans': 0,
+            'sessions_scanned': 0,
+            'queued': 0,
+            'refreshed': 0,
+            'refresh_failures': 0,
+            'rate_limited_waits': 0,
+        }
+        self._queue = []  # (refresh_at, user_id, tokens)
+        self._queued_users = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self._worker_id = f'{os.getpid()}:{random.getrandbits(32)}'
+
+    def start(self):
+        """Start the scheduler thread (no-op if already running in this process)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='token-refresh-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """
+        Stop the scheduler thread and give up leadership
+
+        Args:
+            timeout: Seconds to wait for the thread to exit
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            if self.redis.get(self.LEADER_KEY) == self._worker_id.encode():
+                self.redis.delete(self.LEADER_KEY)
+        except Exception:
+            pass
+
+    def stats(self):
+        """
+        Get scheduler counters
+
+        Returns:
+            dict: Counters plus current queue depth
+        """
+        return dict(self.metrics, queue_depth=len(self._queue))
+
+    def _is_leader(self):
+        # One worker scans; the lease is renewed every loop and expires if the worker dies
+        ttl = self.scan_interval * 3
+        if self.redis.set(self.LEADER_KEY, self._worker_id, nx=True, ex=ttl):
+            return True
+        if self.redis.get(self.LEADER_KEY) == self._worker_id.encode():
+            self.redis.expire(self.LEADER_KEY, ttl)
+            return True
+        return False
+
+    def _run(self):
+        next_scan = 0
+        while not self._stop.is_set():
+            try:
+                if time.time() >= next_scan:
+                    next_scan = time.time() + self.scan_interval
+                    if self._is_leader():
+                        self._scan()
+                wait = self._refresh_due()
+            except Exception:
+                logger.exception("Token refresh scheduler iteration failed")
+                wait = self.scan_interval
+            self._stop.wait(min(wait, max(next_scan - time.time(), 0.1)))
+
+    def _scan(self):
+        """Queue tokens of active sessions that will expire within the horizon"""
+        interface = self.app.session_interface
+        lifetime = self.app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        self.metrics['scans'] += 1
+
+        for keys in self._scan_batches(f'{interface.key_prefix}*'):
+            pipe = self.redis.pipeline()
+            for key in keys:
+                pipe.get(key)
+                pipe.ttl(key)
+            results = pipe.execute()
+
+            active_users = set()
+            for raw, ttl in zip(results[::2], results[1::2]):
+                self.metrics['sessions_scanned'] += 1
+                # Sessions are rewritten with a full lifetime TTL (at least every
+                # SESSION_TOUCH_INTERVAL while in use); a low TTL means idle
+                if not raw or ttl is None or ttl < 0 or lifetime - ttl > self.active_within:
+                    continue
+                try:
+                    data = interface.serializer.decode(raw)
+                except Exception:
+                    continue
+                user_id = data.get('user_id')
+                if user_id and user_id not in self._queued_users:
+                    active_users.add(user_id)
+
+            for user_id, tokens in self.vault.get_many(list(active_users)).items():
+                if not tokens.get('refresh_token') or tokens['expires_at'] - now > self.horizon:
+                    continue
+                refresh_at = tokens['expires_at'] - self.refresher.window - self.lead
+                heapq.heappush(self._queue, (refresh_at, user_id, tokens))
+                self._queued_users.add(user_id)
+                self.metrics['queued'] += 1
+
+    def _scan_batches(self, pattern, batch_size=200):
+        batch = []
+        for key in self.redis.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _refresh_due(self):
+        """
+        Refresh queued tokens whose refresh time has come
+
+        Returns:
+            float: Seconds until the next queued refresh is due
+        """
+        while self._queue and not self._stop.is_set():
+            refresh_at, user_id, tokens = self._queue[0]
+            now = time.time()
+            if refresh_at > now:
+                return refresh_at - now
+
+            wait = self.bucket.try_acquire()
+            if wait:
+                self.metrics['rate_limited_waits'] += 1
+                return wait
+
+            heapq.heappop(self._queue)
+            self._queued_users.discard(user_id)
+            try:
+                self.refresher.ensure_fresh(
+                    user_id, tokens, self.app.config,
+                    window=self.refresher.window + self.lead
+                )
+                self.metrics['refreshed'] += 1
+            except (requests.exceptions.RequestException, TokenRefreshBusyError) as e:
+                self.metrics['refresh_failures'] += 1
+                logger.warning("Background token refresh failed for user %s: %s", user_id, e)
+        return self.scan_interval
+
+
+def init_token_scheduler(app):
+    """
+    Create the background token refresh scheduler if enabled
+
+    Requires Redis sessions (the scheduler scans the shared session store).
+    The thread is started lazily by start_token_scheduler so it never runs
+    in a process that is about to fork.
+
+    Args:
+        app: Flask application instance
+    """
+    if not app.config.get('TOKEN_SCHEDULER_ENABLED') or app.config.get('SESSION_TYPE') != 'redis':
+        return
+    app.extensions['token_scheduler'] = TokenRefreshScheduler(
+        app,
+        app.extensions['token_refresher'],
+        scan_interval=app.config.get('TOKEN_SCHEDULER_SCAN_INTERVAL', 60),
+        horizon=app.config.get('TOKEN_SCHEDULER_HORIZON', 900),
+        lead=app.config.get('TOKEN_SCHEDULER_LEAD', 120),
+        active_within=app.config.get('TOKEN_SCHEDULER_ACTIVE_WITHIN', 1800),
+        rate=app.config.get('TOKEN_SCHEDULER_RATE', 2.0),
+        burst=app.config.get('TOKEN_SCHEDULER_BURST', 5)
+    )
+
+
+def start_token_scheduler(app):
+    """Start the scheduler thread for this process, if one is configured"""
+    scheduler = app.extensions.get('token_scheduler')
+    if scheduler is not None:
+        scheduler.start()
+
+
+def stop_token_scheduler(app):
+    """Stop the scheduler thread for this process, if one is running"""
+    scheduler = app.extensions.get('token_scheduler')
+    if scheduler is not None:
+        scheduler.stop()
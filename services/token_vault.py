@@ -0,0 +1,169 @@
+"""
+Token Vault
+Per-user store for Spotify tokens, kept out of the session blob
+
+Each user's tokens are stored once, shared by all workers and all of the
+user's sessions, so a token refreshed on one device or worker is used by
+the others, and background jobs on any worker (or `flask jobs-worker`)
+can load them. With Redis they are one hash (spotify_tokens:<user_id>);
+without Redis, one spotify_tokens row, read and written in short
+transactions of their own.
+"""
+import time
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, SpotifyToken
+
+# Hash fields, in the order the rest of the app reads them
+TOKEN_FIELDS = ('access_token', 'refresh_token', 'expires_at')
+
+# Session key tokens were kept under before they moved to the database (moved on first read)
+SESSION_KEY = 'spotify_tokens'
+
+
+class TokenVault:
+    """Reads and writes users' Spotify tokens"""
+
+    KEY_PREFIX = 'spotify_tokens:'
+
+    def __init__(self, redis_client=None, ttl=2592000):
+        """
+        Initialize token vault
+
+        Args:
+            redis_client: Redis client (None to keep tokens in the database)
+            ttl: Seconds a user's tokens are kept in Redis after they were last written
+        """
+        self.redis = redis_client
+        self.ttl = ttl
+
+    def get(self, user_id):
+        """
+        Get a user's tokens
+
+        Args:
+            user_id: App user ID
+
+        Returns:
+            dict: access_token, refresh_token, expires_at; or None if Spotify isn't connected
+        """
+        if self.redis is not None:
+            return self._decode(self.redis.hgetall(self.KEY_PREFIX + user_id))
+        tokens = self.get_many([user_id]).get(user_id)
+        if tokens is None:
+            tokens = self._move_session_tokens(user_id)
+        return tokens
+
+    def get_many(self, user_ids):
+        """
+        Get tokens for several users in one round trip
+
+        Args:
+            user_ids: App user IDs
+
+        Returns:
+            dict: user ID -> tokens, for users that have tokens
+        """
+        if self.redis is None:
+            with db.engine.connect() as connection:
+                rows = connection.execute(
+                    select(SpotifyToken).where(SpotifyToken.user_id.in_(list(user_ids)))
+                ).mappings().all()
+            return {row['user_id']: {field: row[field] for field in TOKEN_FIELDS} for row in rows}
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(self.KEY_PREFIX + user_id)
+        found = {}
+        for user_id, raw in zip(user_ids, pipe.execute()):
+            tokens = self._decode(raw)
+            if tokens is not None:
+                found[user_id] = tokens
+        return found
+
+    def set(self, user_id, tokens):
+        """
+        Store a user's tokens
+
+        Args:
+            user_id: App user ID
+            tokens: dict with access_token, refresh_token, expires_at
+        """
+        tokens = {field: tokens.get(field) for field in TOKEN_FIELDS}
+        if self.redis is not None:
+            key = self.KEY_PREFIX + user_id
+            pipe = self.redis.pipeline()
+            pipe.delete(key)  # drop a refresh_token the new tokens don't carry
+            pipe.hset(key, mapping={field: value for field, value in tokens.items() if value is not None})
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+            return
+        values = dict(tokens, expires_at=float(tokens['expires_at']), updated_at=time.time())
+        try:
+            self._write_row(user_id, values)
+        except IntegrityError:
+            self._write_row(user_id, values)  # inserted by another worker in the meantime: now an update
+
+    def delete(self, user_id):
+        """
+        Forget a user's tokens
+
+        Args:
+            user_id: App user ID
+        """
+        if self.redis is not None:
+            self.redis.delete(self.KEY_PREFIX + user_id)
+            return
+        with db.engine.begin() as connection:
+            connection.execute(delete(SpotifyToken).where(SpotifyToken.user_id == user_id))
+
+    def _decode(self, raw):
+        if not raw or b'access_token' not in raw:
+            return None
+        tokens = {field: raw[field.encode()].decode() if field.encode() in raw else None for field in TOKEN_FIELDS}
+        tokens['expires_at'] = float(tokens['expires_at']) if tokens['expires_at'] else time.time()
+        return tokens
+
+    def _write_row(self, user_id, values):
+        with db.engine.begin() as connection:
+            if not connection.execute(
+                update(SpotifyToken).where(SpotifyToken.user_id == user_id).values(**values)
+            ).rowcount:
+                connection.execute(insert(SpotifyToken).values(user_id=user_id, **values))
+
+    def _move_session_tokens(self, user_id):
+        from flask import has_request_context, session
+        if not has_request_context() or session.get('user_id') != user_id or SESSION_KEY not in session:
+            return None
+        tokens = session.pop(SESSION_KEY)
+        if tokens:
+            self.set(user_id, tokens)
+        return tokens or None
+
+
+def init_token_vault(app):
+    """
+    Create the token vault and attach it to the app
+
+    Uses the session Redis connection when Redis sessions are configured, the database otherwise.
+
+    Args:
+        app: Flask application instance
+    """
+    redis_client = app.config.get('SESSION_REDIS') if app.config.get('SESSION_TYPE') == 'redis' else None
+    app.extensions['token_vault'] = TokenVault(
+        redis_client,
+        ttl=app.config.get('TOKEN_VAULT_TTL', 2592000)
+    )
+
+
+def get_token_vault():
+    """
+    Get the token vault for the current app
+
+    Returns:
+        TokenVault: Vault attached by init_token_vault
+    """
+    from flask import current_app
+    return current_app.extensions['token_vault']
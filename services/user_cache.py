@@ -0,0 +1,185 @@
+"""
+User Cache
+Per-worker cache of user ID -> username lookups, invalidated across workers over Redis pub/sub
+"""
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from services.playlist_cache import MemoryCacheBackend
+
+logger = logging.getLogger(__name__)
+
+# What handlers need from the user row; never carries the password hash
+CachedUser = namedtuple('CachedUser', ['id', 'username'])
+
+
+class UserCache:
+    """
+    Caches the fields of the logged-in user that requests need
+
+    Entries live for `ttl` seconds in an LRU-bounded in-process cache.
+    invalidate() drops an entry locally and, with Redis, publishes the user
+    ID so every other worker drops it too. If a broadcast is missed (Redis
+    briefly down) the TTL bounds how long a stale entry can be served.
+    """
+
+    CHANNEL = 'user_cache:invalidate'
+
+    def __init__(self, redis_client=None, ttl=300, max_entries=10000):
+        """
+        Initialize user cache
+
+        Args:
+            redis_client: Redis client for cross-worker invalidation (None for in-process only)
+            ttl: Seconds an entry is served without reloading it
+            max_entries: LRU bound on cached users per worker
+        """
+        self.redis = redis_client
+        self.ttl = ttl
+        self.backend = MemoryCacheBackend(max_entries=max_entries)
+        self._listener = None
+        self._listener_pid = None
+        self._listener_guard = threading.Lock()
+
+    def get_user(self, user_id, loader):
+        """
+        Get a user, loading and caching it on a miss
+
+        Args:
+            user_id: User ID
+            loader: Callable taking user_id and returning a User row or None
+
+        Returns:
+            CachedUser: Cached user fields, or None if the user doesn't exist
+        """
+        self._ensure_listener()
+        cached = self.backend.get(user_id)
+        if cached is not None:
+            self.backend.incr_stat('hits')
+            return cached
+
+        self.backend.incr_stat('misses')
+        user = loader(user_id)
+        if user is None:
+            return None
+        cached = CachedUser(user.id, user.username)
+        self.backend.set(user_id, cached, self.ttl)
+        return cached
+
+    def invalidate(self, user_id, broadcast=True):
+        """
+        Drop a user from this worker's cache and, optionally, every other worker's
+
+        Args:
+            user_id: User ID
+            broadcast: Publish the invalidation to other workers over Redis
+        """
+        self.backend.delete(user_id)
+        if broadcast and self.redis is not None:
+            try:
+                self.redis.publish(self.CHANNEL, user_id)
+            except Exception:
+                logger.warning("Could not broadcast user cache invalidation for %s", user_id, exc_info=True)
+
+    def stats(self):
+        """
+        Get cache counters
+
+        Returns:
+            dict: hits, misses, evictions and current size
+        """
+        return self.backend.stats()
+
+    def stop(self):
+        """Stop this worker's invalidation listener, if running"""
+        with self._listener_guard:
+            if self._listener is not None and self._listener_pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._listener_pid = None
+
+    def _ensure_listener(self):
+        # Started lazily (and again after fork) so each worker has its own subscription
+        if self.redis is None or self._listener_pid == os.getpid():
+            return
+        with self._listener_guard:
+            if self._listener_pid == os.getpid():
+                return
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.CHANNEL: self._on_message})
+                self._listener = pubsub.run_in_thread(
+                    sleep_time=1.0, daemon=True, exception_handler=self._on_listener_error
+                )
+                self._listener_pid = os.getpid()
+            except Exception:
+                logger.warning("User cache invalidation listener not started; relying on TTL", exc_info=True)
+
+    def _on_message(self, message):
+        user_id = message.get('data')
+        if isinstance(user_id, bytes):
+            user_id = user_id.decode()
+        self.backend.delete(user_id)
+
+    def _on_listener_error(self, error, pubsub, thread):
+        # Keep the thread alive; the next get_message() reconnects and resubscribes
+        logger.warning("User cache invalidation listener error: %s", error)
+        time.sleep(1.0)
+
+
+_user_events_registered = False
+
+
+def _register_user_events():
+    from flask import current_app, has_app_context
+    from sqlalchemy import event
+    from models import User
+
+    # Listeners are registered on the model class, so only once per process
+    global _user_events_registered
+    if _user_events_registered:
+        return
+    _user_events_registered = True
+
+    def invalidate_changed_user(mapper, connection, target):
+        if has_app_context() and 'user_cache' in current_app.extensions:
+            current_app.extensions['user_cache'].invalidate(target.id)
+
+    event.listen(User, 'after_update', invalidate_changed_user)
+    event.listen(User, 'after_delete', invalidate_changed_user)
+
+
+def init_user_cache(app):
+    """
+    Create the user cache and attach it to the app
+
+    Uses the session Redis connection for invalidation broadcasts when Redis
+    sessions are configured. Updates and deletes of User rows invalidate the
+    user automatically.
+
+    Args:
+        app: Flask application instance
+    """
+    redis_client = None
+    if app.config.get('SESSION_TYPE') == 'redis':
+        redis_client = app.config.get('SESSION_REDIS')
+    app.extensions['user_cache'] = UserCache(
+        redis_client,
+        ttl=app.config.get('USER_CACHE_TTL', 300),
+        max_entries=app.config.get('USER_CACHE_MAX_ENTRIES', 10000)
+    )
+    _register_user_events()
+
+
+def get_user_cache():
+    """
+    Get the user cache for the current app
+
+    Returns:
+        UserCache: Cache attached by init_user_cache
+    """
+    from flask import current_app
+    return current_app.extensions['user_cache']
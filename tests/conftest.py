@@ -0,0 +1,67 @@
+"""
+Shared fixtures: the app on SQLite and filesystem sessions, against the
+benchmark suite's fake Spotify server
+"""
+import os
+import uuid
+
+import pytest
+
+# config.py reads the environment at import, and importing app.py builds its module-level app
+os.environ['FLASK_ENV'] = 'development'
+os.environ.setdefault('SECRET_KEY', 'test-secret')
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ.pop('REDIS_URL', None)
+os.environ.pop('REDISCLOUD_URL', None)
+
+from benchmarks.fake_spotify import FakeSpotifyConfig, start_fake_spotify
+
+
+@pytest.fixture(scope='session')
+def fake_spotify():
+    """Fake Spotify server shared by the whole run; tests read its counters"""
+    server, base_url, config = start_fake_spotify(FakeSpotifyConfig(
+        latency_ms=0, jitter_ms=0, playlist_count=30, saved_track_count=40, tracks_per_playlist=5, catalog_size=200
+    ))
+    yield base_url, config
+    server.shutdown()
+
+
+@pytest.fixture
+def app(tmp_path, fake_spotify):
+    """App with its own database, session directory and data files"""
+    from app import create_app
+
+    base_url, _ = fake_spotify
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "app.db"}',
+        'DB_CREATE_ALL': True,
+        'SESSION_TYPE': 'filesystem',
+        'SESSION_REDIS': None,
+        'SESSION_FILE_DIR': str(tmp_path / 'sessions'),
+        'SESSION_SWEEP_INTERVAL': 0,
+        'FEATURE_STORE_PATH': str(tmp_path / 'features.col'),
+        'SIMILARITY_INDEX_PATH': str(tmp_path / 'similarity.idx'),
+        'PASSWORD_HASH_WORKERS': 0,
+        'BCRYPT_LOG_ROUNDS': 4,
+        'JOB_WORKER_THREADS': 1,
+        'SPOTIFY_CLIENT_ID': 'test-client',
+        'SPOTIFY_CLIENT_SECRET': 'test-secret',
+        'SPOTIFY_TOKEN_URL': f'{base_url}/api/token',
+        'SPOTIFY_API_BASE_URL': f'{base_url}/v1/',
+    })
+    yield app
+    app.extensions['job_queue'].stop()
+
+
+@pytest.fixture
+def client(app):
+    """Test client for a registered user who has connected Spotify"""
+    client = app.test_client()
+    credentials = {'username': f'user_{uuid.uuid4().hex[:8]}', 'password': 'test-password'}
+    assert client.post('/register', json=credentials).status_code == 201
+    assert client.post('/spotify-exchange', json={'code': 'test-code'}).status_code == 200
+    return client
+
@@ -0,0 +1,160 @@
+import time
+
+import pytest
+import requests
+
+from services.job_queue import DatabaseJobStore, JobError, JobQueue
+from services.spotify_rate_limiter import SpotifyRateLimitedError
+
+
+@pytest.fixture
+def store(app):
+    return DatabaseJobStore(app)
+
+
+@pytest.fixture
+def queue(app, store):
+    # No worker threads: tests claim and run jobs themselves
+    return JobQueue(app, store, worker_threads=0, max_attempts=3, retry_backoff=0.01, retry_backoff_max=0.05,
+                    job_timeout=60)
+
+
+def run_next(queue, wait=1):
+    job_id = queue.store.claim(timeout=wait)
+    assert job_id is not None, 'no job was due'
+    queue._run(job_id)
+    return queue.get(job_id)
+
+
+def test_job_runs_once_and_keeps_its_result(queue):
+    queue.register('echo', lambda user_id, payload: {'user': user_id, **payload})
+    job = queue.enqueue('echo', 'user-1', {'value': 1})
+
+    finished = run_next(queue)
+
+    assert finished['id'] == job['id']
+    assert finished['status'] == 'succeeded'
+    assert finished['result'] == {'user': 'user-1', 'value': 1}
+    assert queue.store.claim(timeout=0) is None
+
+
+def test_identical_pending_job_is_deduplicated(queue):
+    queue.register('echo', lambda user_id, payload: payload)
+    first = queue.enqueue('echo', 'user-1', {'value': 1})
+
+    assert queue.enqueue('echo', 'user-1', {'value': 1})['id'] == first['id']
+    assert queue.enqueue('echo', 'user-2', {'value': 1})['id'] != first['id']
+    run_next(queue)
+    assert queue.enqueue('echo', 'user-1', {'value': 1})['id'] != first['id']
+
+
+def test_only_one_store_claims_a_job(app, queue):
+    queue.register('echo', lambda user_id, payload: payload)
+    job = queue.enqueue('echo', 'user-1')
+    other_worker = DatabaseJobStore(app)
+
+    assert queue.store.claim(timeout=0) == job['id']
+    assert other_worker.claim(timeout=0) is None
+
+
+def test_throttled_job_is_retried_after_a_delay(queue):
+    attempts = []
+
+    def handler(user_id, payload):
+        attempts.append(time.time())
+        if len(attempts) == 1:
+            raise SpotifyRateLimitedError(1)
+        return 'done'
+
+    queue.register('flaky', handler)
+    job = queue.enqueue('flaky', 'user-1')
+
+    retrying = run_next(queue)
+    assert retrying['status'] == 'retrying'
+    assert retrying['run_at'] >= attempts[0] + 1
+    assert queue.store.claim(timeout=0) is None  # not due yet
+
+    finished = run_next(queue, wait=3)
+    assert finished['id'] == job['id']
+    assert finished['status'] == 'succeeded'
+    assert finished['attempts'] == 2
+
+
+def test_job_error_fails_without_retrying(queue):
+    def handler(user_id, payload):
+        raise JobError('Reconnect Spotify')
+
+    queue.register('broken', handler)
+    queue.enqueue('broken', 'user-1')
+
+    failed = run_next(queue)
+
+    assert failed['status'] == 'failed'
+    assert failed['error'] == 'Reconnect Spotify'
+    assert failed['attempts'] == 1
+
+
+def test_retries_stop_after_max_attempts(queue):
+    def handler(user_id, payload):
+        raise requests.exceptions.ConnectionError('still down')
+
+    queue.register('down', handler)
+    queue.enqueue('down', 'user-1')
+
+    statuses = [run_next(queue)['status'] for _ in range(queue.max_attempts)]
+
+    assert statuses == ['retrying', 'retrying', 'failed']
+
+
+def test_unexpected_error_fails_without_retrying(queue):
+    def handler(user_id, payload):
+        raise ValueError('bug')
+
+    queue.register('buggy', handler)
+    queue.enqueue('buggy', 'user-1')
+
+    failed = run_next(queue)
+
+    assert failed['status'] == 'failed'
+    assert failed['error'] == 'The job could not be completed'
+
+
+def test_lost_running_job_is_reaped_and_requeued(queue):
+    queue.register('echo', lambda user_id, payload: 'done')
+    job = queue.enqueue('echo', 'user-1')
+    assert queue.store.claim(timeout=0) == job['id']
+    # The worker died after marking the job running
+    queue.store.save(dict(job, status='running', attempts=1, updated_at=time.time() - 120))
+
+    lost = queue.store.reap(queue.job_timeout)
+    assert lost == [job['id']]
+    queue._retry_lost(job['id'])
+    assert queue.get(job['id'])['status'] == 'retrying'
+
+    finished = run_next(queue)
+    assert finished['status'] == 'succeeded'
+    assert finished['attempts'] == 2
+
+
+def test_lost_job_fails_once_out_of_attempts(queue):
+    queue.register('echo', lambda user_id, payload: 'done')
+    job = queue.enqueue('echo', 'user-1')
+    queue.store.claim(timeout=0)
+    queue.store.save(dict(job, status='running', attempts=queue.max_attempts, updated_at=time.time() - 120))
+
+    queue._retry_lost(job['id'])
+
+    failed = queue.get(job['id'])
+    assert failed['status'] == 'failed'
+    assert failed['error'] == 'The job timed out'
+
+
+def test_reap_drops_expired_results(app, queue):
+    store = DatabaseJobStore(app, ttl=60)
+    queue.register('echo', lambda user_id, payload: 'done')
+    job = queue.enqueue('echo', 'user-1')
+    run_next(queue)
+    store.save(dict(queue.get(job['id']), updated_at=time.time() - 120))
+
+    assert store.reap(queue.job_timeout) == []
+    assert store.get(job['id']) is None
@@ -0,0 +1,181 @@
+import pytest
+import requests
+
+from models import db, User
+from services.playlist_writer import PlaylistWriter
+from services.spotify_rate_limiter import SpotifyRateLimitedError
+
+URIS = [f'spotify:track:{number:06d}' for number in range(250)]
+
+
+class LostResponse(requests.exceptions.ConnectionError):
+    pass
+
+
+class FakePlaylists:
+    """Stands in for SpotifyService's playlist calls, keeping playlists in memory"""
+
+    def __init__(self):
+        self.playlists = {}
+        self.calls = []
+        self.lose_response = None  # (method, call number): applied on "Spotify", but the caller gets an error
+        self.fail_request = None  # (method, call number): never reaches "Spotify"
+        self.partial_listing = False
+
+    def _call(self, method):
+        self.calls.append(method)
+        count = self.calls.count(method)
+        if self.fail_request == (method, count):
+            raise requests.exceptions.ConnectionError('request failed')
+        return self.lose_response == (method, count)
+
+    def _changed(self, playlist_id):
+        playlist = self.playlists[playlist_id]
+        playlist['version'] += 1
+        return f"{playlist_id}-snapshot-{playlist['version']}"
+
+    def _listing(self, playlist_id):
+        playlist = self.playlists[playlist_id]
+        return {
+            'id': playlist_id,
+            'name': playlist['name'],
+            'owner': {'id': 'spotify-user'},
+            'snapshot_id': f"{playlist_id}-snapshot-{playlist['version']}",
+            'tracks': {'total': len(playlist['uris'])},
+        }
+
+    def get_current_user(self, access_token):
+        return {'id': 'spotify-user'}
+
+    def get_user_playlists(self, access_token, fetch_all=False):
+        self._call('get_user_playlists')
+        return {'items': [self._listing(playlist_id) for playlist_id in self.playlists], 'partial': self.partial_listing}
+
+    def create_playlist(self, access_token, spotify_user_id, name, description='', public=False):
+        lost = self._call('create_playlist')
+        playlist_id = f'playlist{len(self.playlists)}'
+        self.playlists[playlist_id] = {'name': name, 'uris': [], 'version': 0}
+        if lost:
+            raise LostResponse('response lost')
+        return self._listing(playlist_id)
+
+    def get_playlist_state(self, access_token, playlist_id):
+        return self._listing(playlist_id)
+
+    def get_playlist_uris(self, access_token, playlist_id, offset, limit):
+        return self.playlists[playlist_id]['uris'][offset:offset + limit]
+
+    def add_playlist_tracks(self, access_token, playlist_id, uris, position=None):
+        lost = self._call('add_playlist_tracks')
+        playlist = self.playlists[playlist_id]
+        position = len(playlist['uris']) if position is None else position
+        playlist['uris'][position:position] = uris
+        snapshot_id = self._changed(playlist_id)
+        if lost:
+            raise LostResponse('response lost')
+        return snapshot_id
+
+    def replace_playlist_tracks(self, access_token, playlist_id, uris):
+        self._call('replace_playlist_tracks')
+        self.playlists[playlist_id]['uris'] = list(uris)
+        return self._changed(playlist_id)
+
+    def remove_playlist_tracks(self, access_token, playlist_id, uris):
+        self._call('remove_playlist_tracks')
+        playlist = self.playlists[playlist_id]
+        playlist['uris'] = [uri for uri in playlist['uris'] if uri not in uris]
+        return self._changed(playlist_id)
+
+
+@pytest.fixture
+def spotify():
+    return FakePlaylists()
+
+
+@pytest.fixture
+def writer(app, spotify):
+    with app.app_context():
+        yield PlaylistWriter(spotify)
+
+
+@pytest.fixture
+def user_id(writer):
+    user = User(username='writer', password='unused')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def test_writes_in_chunks(writer, spotify, user_id):
+    write = writer.create(user_id, 'create', uris=URIS, name='Mix')
+    result = writer.run(write, 'token')
+
+    assert result['chunks'] == 3
+    assert spotify.playlists[result['playlist_id']]['uris'] == URIS
+    assert write.completed_at is not None
+
+
+def test_retried_create_reuses_the_playlist_an_earlier_attempt_made(writer, spotify, user_id):
+    spotify.lose_response = ('create_playlist', 1)
+    write = writer.create(user_id, 'create', uris=URIS, name='Mix')
+    with pytest.raises(LostResponse):
+        writer.run(write, 'token')
+
+    result = writer.run(write, 'token')
+
+    assert spotify.calls.count('create_playlist') == 1
+    assert list(spotify.playlists) == [result['playlist_id']]
+    assert spotify.playlists[result['playlist_id']]['uris'] == URIS
+
+
+def test_retried_create_does_not_reuse_a_playlist_with_tracks(writer, spotify, user_id):
+    spotify.playlists['old'] = {'name': 'Mix', 'uris': ['spotify:track:old'], 'version': 0}
+    spotify.fail_request = ('create_playlist', 1)
+    write = writer.create(user_id, 'create', uris=URIS, name='Mix')
+    with pytest.raises(requests.exceptions.ConnectionError):
+        writer.run(write, 'token')
+
+    result = writer.run(write, 'token')
+
+    assert result['playlist_id'] != 'old'
+    assert spotify.playlists['old']['uris'] == ['spotify:track:old']
+
+
+def test_retried_create_waits_for_the_whole_listing(writer, spotify, user_id):
+    spotify.lose_response = ('create_playlist', 1)
+    write = writer.create(user_id, 'create', uris=URIS, name='Mix')
+    with pytest.raises(LostResponse):
+        writer.run(write, 'token')
+
+    spotify.partial_listing = True
+    with pytest.raises(SpotifyRateLimitedError):
+        writer.run(write, 'token')
+    assert spotify.calls.count('create_playlist') == 1
+    assert write.playlist_id is None
+
+
+def test_resume_skips_a_chunk_that_reached_spotify(writer, spotify, user_id):
+    spotify.playlists['target'] = {'name': 'Target', 'uris': ['spotify:track:first'], 'version': 0}
+    spotify.lose_response = ('add_playlist_tracks', 2)
+    write = writer.create(user_id, 'add', playlist_id='target', uris=URIS)
+    with pytest.raises(LostResponse):
+        writer.run(write, 'token')
+    assert write.chunks_done == 1
+
+    writer.run(write, 'token')
+
+    assert spotify.calls.count('add_playlist_tracks') == 3
+    assert spotify.playlists['target']['uris'] == ['spotify:track:first'] + URIS
+
+
+def test_resume_resends_a_chunk_that_never_arrived(writer, spotify, user_id):
+    spotify.playlists['target'] = {'name': 'Target', 'uris': [], 'version': 0}
+    spotify.fail_request = ('add_playlist_tracks', 2)
+    write = writer.create(user_id, 'add', playlist_id='target', uris=URIS)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        writer.run(write, 'token')
+
+    writer.run(write, 'token')
+
+    assert spotify.playlists['target']['uris'] == URIS
+    assert write.attempts == 2
@@ -0,0 +1,68 @@
+import time
+
+
+def wait_for_job(client, response, timeout=10):
+    """Poll a 202 job response until the job finishes"""
+    assert response.status_code == 202, response.get_json()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(response.headers['Location']).get_json()
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job did not finish in {timeout}s: {job}")
+
+
+def synced_client(client):
+    job = wait_for_job(client, client.post('/library/sync'))
+    assert job['status'] == 'succeeded', job
+    return client
+
+
+def test_listing_answers_304_for_a_matching_etag(client):
+    response = client.get('/playlists')
+    etag = response.headers['ETag']
+
+    response = client.get('/playlists', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_synced_listing_is_served_from_the_database(client, fake_spotify):
+    _, spotify = fake_spotify
+    synced_client(client)
+    calls = spotify.counters['playlists']
+
+    response = client.get('/playlists')
+    etag = response.headers['ETag']
+
+    assert response.status_code == 200
+    assert len(response.get_json()['items']) == spotify.playlist_count
+    assert client.get('/playlists', headers={'If-None-Match': etag}).status_code == 304
+    assert spotify.counters['playlists'] == calls
+
+
+def test_unlink_changes_the_etag(client, fake_spotify):
+    _, spotify = fake_spotify
+    synced_client(client)
+    response = client.get('/playlists')
+    etag = response.headers['ETag']
+    playlist_id = response.get_json()['items'][0]['id']
+
+    response = client.post('/unlink-playlist', json={'playlist_id': playlist_id})
+    assert response.status_code == 200
+
+    response = client.get('/playlists', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    items = response.get_json()['items']
+    assert playlist_id not in [item['id'] for item in items]
+    assert len(items) == spotify.playlist_count - 1
+    assert client.get('/playlists', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_unlink_validates_input(client):
+    response = client.post('/unlink-playlist', json={})
+
+    assert response.status_code == 400
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import time
+
+from services.sessions import ShardedFileSessionInterface
+
+
+def session_files(directory):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), directory)
+        for root, _, names in os.walk(directory)
+        for name in names if not name.startswith('.')
+    )
+
+
+def test_sessions_are_stored_in_hash_shards(app, client):
+    interface = app.session_interface
+    assert isinstance(interface, ShardedFileSessionInterface)
+
+    files = session_files(interface.directory)
+
+    assert len(files) == 1
+    shard, name = os.path.split(files[0])
+    assert len(name) == 40 and shard == name[:2]
+    assert client.get('/@me').status_code == 200
+
+
+def test_sharded_path_is_sha1_of_the_store_id(app):
+    digest = hashlib.sha1(b'session:abc').hexdigest()
+
+    assert app.session_interface._path('session:abc') == os.path.join(app.session_interface.directory, digest[:2], digest)
+
+
+def test_expired_session_is_not_read(app, client):
+    interface = app.session_interface
+    path = os.path.join(interface.directory, session_files(interface.directory)[0])
+    os.utime(path, (time.time() - 1, time.time() - 1))
+
+    assert client.get('/@me').status_code == 401
+    assert not os.path.exists(path)
+
+
+def test_sweep_removes_expired_and_legacy_flat_files(app, client):
+    interface = app.session_interface
+    directory = interface.directory
+    lifetime = app.permanent_session_lifetime.total_seconds()
+    live = session_files(directory)[0]
+
+    expired = os.path.join(directory, 'ab', 'ab' + '0' * 38)
+    os.makedirs(os.path.dirname(expired), exist_ok=True)
+    open(expired, 'wb').close()
+    os.utime(expired, (time.time() - 1, time.time() - 1))
+
+    # Files left in the flat directory by Flask-Session's old cachelib backend
+    old_legacy = os.path.join(directory, 'f' * 64)
+    recent_legacy = os.path.join(directory, 'e' * 32)
+    unrelated = os.path.join(directory, 'notes.txt')
+    for path in (old_legacy, recent_legacy, unrelated):
+        open(path, 'wb').close()
+    os.utime(old_legacy, (time.time() - lifetime - 60,) * 2)
+    os.utime(unrelated, (time.time() - lifetime - 60,) * 2)
+
+    assert interface.sweep() == 2
+    assert session_files(directory) == sorted([live, 'e' * 32, 'notes.txt'])
+    assert client.get('/@me').status_code == 200
+
+
+def test_logout_deletes_the_session_file(app, client):
+    assert client.post('/logout').status_code == 200
+
+    assert session_files(app.session_interface.directory) == []
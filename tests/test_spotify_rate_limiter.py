@@ -0,0 +1,88 @@
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import fakeredis
+import pytest
+
+from services.spotify_rate_limiter import (
+    SpotifyRateLimitedError, SpotifyRateLimiter, bind_rate_limit_user, in_caller_context
+)
+
+
+def bucket_keys(limiter, access_token):
+    return [key for key, _, _ in limiter._bucket_specs(access_token)]
+
+
+def in_new_context(fn, *args):
+    # Bindings are context variables; keep each test's out of the others
+    return contextvars.copy_context().run(fn, *args)
+
+
+def test_app_credentials_only_use_the_app_bucket():
+    assert bucket_keys(SpotifyRateLimiter(), None) == ['spotify_rate:app']
+
+
+def test_unbound_token_gets_a_bucket_per_token():
+    digest = hashlib.sha1(b'token-a').hexdigest()[:16]
+    assert bucket_keys(SpotifyRateLimiter(), 'token-a') == ['spotify_rate:app', f'spotify_rate:user:token:{digest}']
+
+
+def test_bound_token_is_charged_to_its_user():
+    limiter = SpotifyRateLimiter()
+
+    def keys():
+        bind_rate_limit_user('user-1', 'token-a')
+        return bucket_keys(limiter, 'token-a'), bucket_keys(limiter, 'token-b')
+
+    bound, other = in_new_context(keys)
+    assert bound == ['spotify_rate:app', 'spotify_rate:user:user-1']
+    assert other[1].startswith('spotify_rate:user:token:')
+
+
+def test_refreshed_token_keeps_drawing_on_the_same_bucket():
+    limiter = SpotifyRateLimiter(rate=100, burst=100, user_rate=0.001, user_burst=2, max_wait=0)
+
+    def calls():
+        bind_rate_limit_user('user-1', 'token-a')
+        limiter.acquire('token-a')
+        limiter.acquire('token-a')
+        bind_rate_limit_user('user-1', 'token-b')
+        with pytest.raises(SpotifyRateLimitedError):
+            limiter.acquire('token-b')
+        # Other users still have their own quota
+        bind_rate_limit_user('user-2', 'token-c')
+        limiter.acquire('token-c')
+
+    in_new_context(calls)
+
+
+def test_binding_follows_calls_into_executor_threads():
+    limiter = SpotifyRateLimiter()
+
+    def user_bucket(_):
+        return bucket_keys(limiter, 'token-a')[1]
+
+    def fan_out():
+        bind_rate_limit_user('user-1', 'token-a')
+        with ThreadPoolExecutor(2) as executor:
+            return list(executor.map(user_bucket, range(3))), list(executor.map(in_caller_context(user_bucket), range(3)))
+
+    plain, wrapped = in_new_context(fan_out)
+    assert all(key.startswith('spotify_rate:user:token:') for key in plain)
+    assert wrapped == ['spotify_rate:user:user-1'] * 3
+
+
+def test_redis_buckets_are_shared_between_workers():
+    redis_client = fakeredis.FakeRedis()
+    workers = [SpotifyRateLimiter(redis_client, user_rate=0.001, user_burst=2, max_wait=0) for _ in range(2)]
+
+    def calls():
+        bind_rate_limit_user('user-1', 'token-a')
+        workers[0].acquire('token-a')
+        workers[1].acquire('token-a')
+        with pytest.raises(SpotifyRateLimitedError):
+            workers[0].acquire('token-a')
+
+    in_new_context(calls)
+    assert redis_client.exists('spotify_rate:user:user-1')
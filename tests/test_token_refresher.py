@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from models import db, User
+
+EXPIRED = {'access_token': 'old-access', 'refresh_token': 'old-refresh', 'expires_at': 0}
+
+
+@pytest.fixture
+def slow_token_endpoint(fake_spotify):
+    # Long enough for every caller to arrive while the first refresh is in flight
+    _, spotify = fake_spotify
+    spotify.latency_ms = 100
+    yield spotify
+    spotify.latency_ms = 0
+
+
+@pytest.fixture
+def user_id(app):
+    with app.app_context():
+        user = User(username='refresher', password='unused')
+        db.session.add(user)
+        db.session.commit()
+        app.extensions['token_vault'].set(user.id, dict(EXPIRED))
+        return user.id
+
+
+def test_fresh_token_is_not_refreshed(app, user_id, fake_spotify):
+    _, spotify = fake_spotify
+    calls = spotify.counters['token']
+    tokens = {'access_token': 'a', 'refresh_token': 'r', 'expires_at': time.time() + 3600}
+
+    with app.app_context():
+        assert app.extensions['token_refresher'].ensure_fresh(user_id, tokens) is None
+    assert spotify.counters['token'] == calls
+
+
+def test_concurrent_refreshes_call_spotify_once(app, user_id, slow_token_endpoint):
+    refresher = app.extensions['token_refresher']
+    calls = slow_token_endpoint.counters['token']
+    results = []
+    start = threading.Barrier(8)
+
+    def refresh():
+        with app.app_context():
+            start.wait()
+            results.append(refresher.ensure_fresh(user_id, dict(EXPIRED)))
+
+    threads = [threading.Thread(target=refresh) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert slow_token_endpoint.counters['token'] == calls + 1
+    assert len({result['access_token'] for result in results}) == 1
+    with app.app_context():
+        stored = app.extensions['token_vault'].get(user_id)
+    assert stored['access_token'] == results[0]['access_token']
+    assert stored['refresh_token'] == 'fake-refresh'
+
+
+def test_refresh_token_route_goes_through_the_refresher(app, client, fake_spotify):
+    _, spotify = fake_spotify
+    with client.session_transaction() as session:
+        user_id = session['user_id']
+    with app.app_context():
+        app.extensions['token_vault'].set(user_id, dict(EXPIRED))
+    calls = spotify.counters['token']
+
+    first = client.post('/refresh-token')
+    second = client.post('/refresh-token')
+
+    assert first.status_code == 200 and first.get_json()['message'] == 'Token refreshed'
+    assert second.status_code == 200 and second.get_json()['message'] == 'Token is still valid'
+    # The second call finds the token refreshed by the first
+    assert spotify.counters['token'] == calls + 1
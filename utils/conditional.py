@@ -0,0 +1,83 @@
+"""
+Conditional GET helpers
+ETags and 304 responses for endpoints the frontend polls
+"""
+import hashlib
+
+from flask import Response, request
+
+
+def make_etag(*parts):
+    """
+    Build an ETag value from the parts that determine a representation
+
+    Args:
+        parts: Values whose change must change the ETag (stringified)
+
+    Returns:
+        str: Opaque ETag value (unquoted)
+    """
+    digest = hashlib.sha1('\x1f'.join(str(part) for part in parts).encode())
+    return digest.hexdigest()[:32]
+
+
+def playlists_etag(items, *parts):
+    """
+    ETag for a playlist listing, from the playlist IDs and snapshot IDs in order
+
+    Spotify changes a playlist's snapshot_id whenever its details or tracks
+    change, so the listing only needs a new ETag when one of these does.
+
+    Args:
+        items: Playlist objects in listing order
+        parts: Extra values that shape the representation (source, limit, offset)
+
+    Returns:
+        str: ETag value (unquoted)
+    """
+    return make_etag(*parts, *(f"{item.get('id')}:{item.get('snapshot_id')}" for item in items if item))
+
+
+def is_not_modified(etag):
+    """
+    Whether the request's If-None-Match already matches etag
+
+    Args:
+        etag: Current ETag value, or None if unknown
+
+    Returns:
+        bool: True if a 304 can be returned
+    """
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def with_etag(response, etag, cache_control=None):
+    """
+    Attach ETag (weak) and Cache-Control headers to a response
+
+    Args:
+        response: Flask response
+        etag: ETag value (unquoted)
+        cache_control: Cache-Control header value, if any
+
+    Returns:
+        Response: The same response
+    """
+    response.set_etag(etag, weak=True)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def not_modified(etag, cache_control=None):
+    """
+    Build an empty 304 Not Modified response
+
+    Args:
+        etag: ETag value the client already has
+        cache_control: Cache-Control header value, if any
+
+    Returns:
+        Response: 304 response
+    """
+    return with_etag(Response(status=304), etag, cache_control)
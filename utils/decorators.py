@@ -1,44 +1,118 @@
 """
 Decorators for route protection and authentication
 """
+import inspect
 from functools import wraps
-from flask import session, jsonify, request
+from flask import session, jsonify, request, g
 from datetime import datetime
+import requests
 
+from models import db, User
+from services.spotify_rate_limiter import bind_rate_limit_user
+from services.token_refresher import get_token_refresher, TokenRefreshBusyError
+from services.token_vault import TOKEN_FIELDS, get_token_vault
+from services.user_cache import get_user_cache
 
-def login_required(f):
+
+def _guard(f, check):
     """
-    Decorator to require user login for a route
+    Wrap a view so check() runs first; works for both sync and async views
+
+    Args:
+        f: View function (def or async def)
+        check: Callable returning an error response, or None to continue
     """
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def async_decorated_function(*args, **kwargs):
+            error_response = check()
+            if error_response is not None:
+                return error_response
+            return await f(*args, **kwargs)
+        return async_decorated_function
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return jsonify({'error': 'Unauthorized', 'message': 'Please log in to access this resource'}), 401
+        error_response = check()
+        if error_response is not None:
+            return error_response
         return f(*args, **kwargs)
     return decorated_function
 
 
+def load_current_user():
+    """
+    Resolve the session's user through the user cache, once per request
+    
+    Returns:
+        CachedUser: id and username of the logged-in user (also stored on
+            g.current_user), or None if nobody is logged in or the user is gone
+    """
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        g.current_user = get_user_cache().get_user(user_id, lambda uid: db.session.get(User, uid)) if user_id else None
+    return g.current_user
+
+
+def login_required(f=None, *, load_user=False):
+    """
+    Decorator to require user login for a route
+    
+    Use as @login_required, or @login_required(load_user=True) to also put
+    the user on g.current_user (see load_current_user); a session whose user
+    no longer exists is then cleared and gets 401.
+    """
+    def decorator(view):
+        def check():
+            if 'user_id' not in session:
+                return jsonify({'error': 'Unauthorized', 'message': 'Please log in to access this resource'}), 401
+            if load_user and load_current_user() is None:
+                session.pop('user_id', None)
+                return jsonify({'error': 'Unauthorized', 'message': 'Please log in to access this resource'}), 401
+            return None
+        return _guard(view, check)
+    
+    if f is not None:
+        return decorator(f)
+    return decorator
+
+
 def spotify_auth_required(f):
     """
-    Decorator to require Spotify authentication for a route
-    Checks if access token exists and is not expired
+    Decorator to require Spotify authentication for a route (after login_required)
+    Loads the user's tokens from the token vault into g.spotify_tokens,
+    refreshing them first when within SPOTIFY_TOKEN_REFRESH_WINDOW of expiring,
+    and charges the request's Spotify calls to the user's rate limit bucket
     """
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'access_token' not in session:
+    def check():
+        user_id = session.get('user_id')
+        vault = get_token_vault()
+        if user_id and 'access_token' in session:
+            # Session written before tokens moved to the vault
+            vault.set(user_id, {field: session.pop(field, None) for field in TOKEN_FIELDS})
+        tokens = vault.get(user_id) if user_id else None
+        if tokens is None:
             return jsonify({
                 'error': 'Spotify not connected',
                 'message': 'Please connect your Spotify account'
             }), 401
-        
+
+        # Refresh ahead of expiry (single-flight per user across threads and workers)
+        if tokens.get('refresh_token'):
+            try:
+                tokens = get_token_refresher().ensure_fresh(user_id, tokens) or tokens
+            except (requests.exceptions.RequestException, TokenRefreshBusyError):
+                pass  # fall through; the expiry check below decides
+        g.spotify_tokens = tokens
+        bind_rate_limit_user(user_id, tokens['access_token'])
+
         # Check if token is expired
-        expires_at = session.get('expires_at')
+        expires_at = tokens['expires_at']
         if expires_at and datetime.now().timestamp() > expires_at:
             return jsonify({
                 'error': 'Token expired',
                 'message': 'Spotify token has expired. Please reconnect.'
             }), 401
-        
-        return f(*args, **kwargs)
-    return decorated_function
 
+        return None
+    return _guard(f, check)
@@ -0,0 +1,285 @@
+"""
+Mapped files
+Single-file containers of named NumPy arrays that every worker maps read-only
+
+A file is written next to its destination and moved into place with
+os.replace, so readers see either the old version or the new one, never a
+partial write. Readers keep the version they mapped until they open the
+new one; the old inode stays valid until its last mapping goes away. The
+page cache backs every mapping, so all workers on a host share one copy.
+
+Layout: magic, header length (uint64 LE), JSON header, then each array's
+raw bytes starting on a 64-byte boundary.
+
+MappedStore is the base of the stores that publish such a file (features,
+similarity index). NumPy is imported on first use, so importing a store
+doesn't load it.
+"""
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MOODARR1'
+ALIGNMENT = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_mapped_file(path, meta, arrays):
+    """
+    Atomically write arrays and metadata to path
+
+    Args:
+        path: Destination file (its directory is created if needed)
+        meta: JSON-serializable dict stored in the header
+        arrays: Dict of name -> np.ndarray (written C-contiguous)
+    """
+    import numpy as np
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    layout = {}
+    offset = 0
+    contiguous = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        contiguous[name] = array
+        offset = _aligned(offset)
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += array.nbytes
+    header = json.dumps({'meta': meta, 'arrays': layout}).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+            for name, array in contiguous.items():
+                f.seek(data_start + layout[name]['offset'])
+                f.write(array.data)
+            f.truncate(data_start + offset)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+@contextmanager
+def write_lock(path):
+    """
+    Hold an exclusive lock for writing path, across processes
+
+    The lock is taken on a separate file next to path, so readers are never blocked.
+
+    Args:
+        path: Mapped file about to be written
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class MappedFile:
+    """A mapped-file version opened read-only; arrays are zero-copy views of the mapping"""
+
+    def __init__(self, path):
+        """
+        Map a file written by write_mapped_file
+
+        Args:
+            path: File to open
+
+        Raises:
+            FileNotFoundError: If the file doesn't exist
+            ValueError: If it isn't a mapped file
+        """
+        import numpy as np
+
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a mapped array file")
+        (header_length,) = struct.unpack('<Q', buffer[len(MAGIC):len(MAGIC) + 8])
+        header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_length])
+        data_start = _aligned(len(MAGIC) + 8 + header_length)
+
+        self.path = path
+        self.inode = stat.st_ino
+        self.size = stat.st_size
+        self.meta = header['meta']
+        self.arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            self.arrays[name] = np.frombuffer(
+                buffer, dtype=dtype, count=count, offset=data_start + spec['offset']
+            ).reshape(spec['shape'])
+
+    def is_current(self):
+        """
+        Whether path still names the version this object mapped
+
+        Every version is a new file, and the mapping keeps this one's inode
+        from being reused, so comparing inodes is enough (touching the file
+        doesn't count as a new version).
+        """
+        try:
+            return os.stat(self.path).st_ino == self.inode
+        except FileNotFoundError:
+            return False
+
+
+class MappedStore:
+    """
+    Base for a store that publishes a mapped file and keeps this worker on its latest version
+
+    Subclasses implement update(), which rewrites the file under write_lock,
+    and _load(), which turns a MappedFile into what get() serves.
+
+    get() checks at most every check_interval seconds whether a newer file
+    was published. If the file is missing or hasn't been updated for
+    refresh_interval seconds, one background thread per worker updates it,
+    so web workers on a host without a jobs worker still catch up; until
+    then get() keeps serving the version it has. Only a worker with nothing
+    mapped yet waits for the update.
+    """
+
+    # Name used in log messages
+    label = 'mapped file'
+
+    def __init__(self, path, check_interval=30, refresh_interval=600):
+        """
+        Initialize mapped store
+
+        Args:
+            path: File shared by every worker on the host
+            check_interval: Seconds between checks for a newer file
+            refresh_interval: Seconds after which a reader has the file updated
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self.refresh_interval = refresh_interval
+        self._mapped = None
+        self._value = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.metrics = {'updates': 0, 'remaps': 0, 'refresh_errors': 0}
+
+    def get(self):
+        """
+        Get the latest published version, mapping a new one if there is one
+
+        Returns:
+            What _load made of the mapped file
+        """
+        now = time.monotonic()
+        if self._value is not None and now - self._checked_at < self.check_interval:
+            return self._value
+        with self._lock:
+            if self._value is not None and now - self._checked_at < self.check_interval:
+                return self._value
+            if self._mapped is None or not self._mapped.is_current():
+                self._map()
+            self._checked_at = now
+            stale = self._mapped is not None and self._is_stale()
+        if stale:
+            self._refresh_in_background()
+        elif self._mapped is None:
+            # Nothing to serve yet: the first caller updates, the others wait for it
+            with self._refresh_lock:
+                if self._mapped is None:
+                    self.update()
+                    with self._lock:
+                        self._map()
+        return self._value
+
+    def update(self):
+        """Publish a new version of the file (holding write_lock)"""
+        raise NotImplementedError
+
+    def stats(self):
+        """
+        Get store counters
+
+        Returns:
+            dict: Counters plus the size and age of the mapped version
+        """
+        mapped = self._mapped
+        return dict(
+            self.metrics,
+            tracks=mapped.meta.get('count', 0) if mapped else 0,
+            file_bytes=mapped.size if mapped else 0,
+            age_seconds=round(time.time() - mapped.meta['updated_at'], 1) if mapped else 0,
+        )
+
+    def _load(self, mapped):
+        """
+        Make what get() serves out of a newly mapped version
+
+        Raises:
+            ValueError: If the version can't be used (it is skipped)
+        """
+        return mapped
+
+    def _is_stale(self):
+        try:
+            return time.time() - os.stat(self.path).st_mtime > self.refresh_interval
+        except FileNotFoundError:
+            return True  # removed under us: keep serving the mapping and write a new file
+
+    def _refresh_in_background(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # already being refreshed
+        try:
+            from flask import current_app
+            app = current_app._get_current_object()
+            threading.Thread(target=self._refresh, args=(app,), name=f'{self.label} refresh', daemon=True).start()
+        except BaseException:
+            self._refresh_lock.release()
+            raise
+
+    def _refresh(self, app):
+        try:
+            with app.app_context():
+                self.update()
+            with self._lock:
+                if not self._mapped.is_current():
+                    self._map()
+        except Exception:
+            self.metrics['refresh_errors'] += 1
+            logger.exception("Updating %s %s failed", self.label, self.path)
+        finally:
+            self._refresh_lock.release()
+
+    def _map(self):
+        try:
+            mapped = MappedFile(self.path)
+            value = self._load(mapped)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            logger.warning("Ignoring unreadable %s %s", self.label, self.path, exc_info=True)
+            return
+        # The old mapping is unmapped once requests still using it are done
+        self._mapped, self._value = mapped, value
+        self.metrics['remaps'] += 1
@@ -0,0 +1,258 @@
+"""
+Latency metrics
+Prometheus histograms for requests, Spotify calls, DB queries, bcrypt and sessions
+
+When PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it), every worker
+writes its samples to mmap'd files in that directory and /metrics aggregates
+them, so any worker can answer a scrape.
+"""
+import inspect
+import os
+import time
+from functools import wraps
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Buckets in seconds, from sub-millisecond cache hits up to slow Spotify pages
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint',
+    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS
+)
+SPOTIFY_CALL_LATENCY = Histogram(
+    'spotify_call_duration_seconds', 'Outbound Spotify call latency by service method',
+    ['method'], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Database statement execution time',
+    buckets=LATENCY_BUCKETS
+)
+BCRYPT_LATENCY = Histogram(
+    'bcrypt_duration_seconds', 'Password hash/check time including pool queueing',
+    ['operation'], buckets=LATENCY_BUCKETS
+)
+DB_POOL_CHECKOUT_LATENCY = Histogram(
+    'db_pool_checkout_duration_seconds', 'Time to get a connection from the pool (queueing plus connect)',
+    buckets=LATENCY_BUCKETS
+)
+SESSION_LATENCY = Histogram(
+    'session_io_duration_seconds', 'Server-side session load/save time',
+    ['operation'], buckets=LATENCY_BUCKETS
+)
+
+
+def timed(histogram, *label_values):
+    """
+    Decorator that observes a function's duration (sync or async) in a histogram
+
+    Args:
+        histogram: Histogram to observe into
+        label_values: Label values for the histogram, if it has labels
+    """
+    metric = histogram.labels(*label_values) if label_values else histogram
+
+    def decorator(f):
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def async_timed_function(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await f(*args, **kwargs)
+                finally:
+                    metric.observe(time.perf_counter() - start)
+            return async_timed_function
+
+        @wraps(f)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - start)
+        return timed_function
+    return decorator
+
+
+class _ExtensionStatsCollector:
+    """
+    Exposes counters kept by app extensions (caches, token scheduler) at scrape time
+
+    The values are read from the process answering the scrape. Under
+    PROMETHEUS_MULTIPROC_DIR the other gunicorn workers' extension counters
+    are not included, so these gauges describe a single worker rather than
+    the whole deployment.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def collect(self):
+        cache = self.app.extensions.get('playlist_cache')
+        if cache is not None:
+            family = GaugeMetricFamily('playlist_cache', 'Playlist cache counters', labels=['stat'])
+            for name, value in cache.stats().items():
+                family.add_metric([name], value)
+            yield family
+
+        user_cache = self.app.extensions.get('user_cache')
+        if user_cache is not None:
+            family = GaugeMetricFamily('user_cache', 'User lookup cache counters', labels=['stat'])
+            for name, value in user_cache.stats().items():
+                family.add_metric([name], value)
+            yield family
+
+        fetcher = self.app.extensions.get('audio_feature_fetcher')
+        if fetcher is not None:
+            family = GaugeMetricFamily('audio_feature_cache', 'Audio feature fetcher counters', labels=['stat'])
+            for name, value in fetcher.stats().items():
+                family.add_metric([name], value)
+            yield family
+
+        search_index = self.app.extensions.get('search_index')
+        if search_index is not None:
+            family = GaugeMetricFamily('search_index', 'Library search index counters (this worker)', labels=['stat'])
+            for name, value in search_index.stats().items():
+                family.add_metric([name], value)
+            yield family
+
+        feature_store = self.app.extensions.get('feature_store')
+        if feature_store is not None:
+            family = GaugeMetricFamily('feature_store', 'Mapped audio feature file counters (this worker)', labels=['stat'])
+            for name, value in feature_store.stats().items():
+                family.add_metric([name], value)
+            yield family
+
+        similarity = self.app.extensions.get('similarity_store')
+        if similarity is not None:
+            family = GaugeMetricFamily('similarity_index', 'Track similarity index counters (this worker)', labels=['stat'])
+            for name, value in similarity.stats().items():
+                family.add_metric([name], value)
+            yield family
+
+        engine = self._engine()
+        if engine is not None and hasattr(engine.pool, 'checkedout'):
+            family = GaugeMetricFamily('db_pool', 'Database connection pool state (this worker)', labels=['stat'])
+            family.add_metric(['size'], engine.pool.size())
+            family.add_metric(['checked_out'], engine.pool.checkedout())
+            family.add_metric(['overflow'], engine.pool.overflow())
+            yield family
+
+        limiter = self.app.extensions.get('spotify_rate_limiter')
+        if limiter is not None:
+            family = GaugeMetricFamily('spotify_rate_limiter', 'Outbound Spotify rate limiter counters', labels=['stat'])
+            for name, value in limiter.stats().items():
+                family.add_metric([name], value)
+            yield family
+
+        job_queue = self.app.extensions.get('job_queue')
+        if job_queue is not None:
+            family = GaugeMetricFamily('job_queue', 'Background job counters', labels=['stat'])
+            for name, value in job_queue.stats().items():
+                family.add_metric([name], value)
+            yield family
+
+        scheduler = self.app.extensions.get('token_scheduler')
+        if scheduler is not None:
+            family = GaugeMetricFamily('token_scheduler', 'Background token refresh counters', labels=['stat'])
+            for name, value in scheduler.stats().items():
+                family.add_metric([name], value)
+            yield family
+
+    def _engine(self):
+        if 'sqlalchemy' not in self.app.extensions:
+            return None
+        with self.app.app_context():
+            return self.app.extensions['sqlalchemy'].engine
+
+
+def _instrument_requests(app):
+    from flask import g, request
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe_request_latency(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            REQUEST_LATENCY.labels(
+                request.endpoint or 'unmatched', request.method, response.status_code
+            ).observe(time.perf_counter() - start)
+        return response
+
+
+_db_instrumented = False
+
+
+def _instrument_db():
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    # Listeners are registered on the Engine class, so only once per process
+    global _db_instrumented
+    if _db_instrumented:
+        return
+    _db_instrumented = True
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def observe_query_time(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_LATENCY.observe(time.perf_counter() - conn.info['query_start'].pop())
+
+    @event.listens_for(Engine, 'handle_error')
+    def discard_query_timer(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_start'):
+            conn.info['query_start'].pop()
+
+
+def _instrument_sessions(app):
+    interface = app.session_interface
+    interface.open_session = timed(SESSION_LATENCY, 'load')(interface.open_session)
+    interface.save_session = timed(SESSION_LATENCY, 'save')(interface.save_session)
+
+
+def init_metrics(app):
+    """
+    Instrument the app: request, DB and session timers plus the scrape registry
+
+    Args:
+        app: Flask application instance (call after Session(app))
+    """
+    _instrument_requests(app)
+    _instrument_db()
+    _instrument_sessions(app)
+    app.extensions['metrics_collector'] = _ExtensionStatsCollector(app)
+
+
+def render_metrics(app):
+    """
+    Render all metrics in Prometheus text format
+
+    Args:
+        app: Flask application instance
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY
+        registry = CollectorRegistry()
+        registry.register(REGISTRY)
+    registry.register(app.extensions['metrics_collector'])
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,115 @@
+"""
+Startup timing
+Measures how long app.py spends importing modules and running each init step
+
+The total is always reported. With STARTUP_TIMING=true the report also
+breaks down import time per module (by wrapping __import__ during startup)
+and time per init step.
+"""
+import builtins
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Collects import and init-phase durations for one process start"""
+
+    def __init__(self, trace_imports=False):
+        """
+        Initialize timer and, if requested, start timing first-time imports
+
+        Args:
+            trace_imports: Record self time per module imported from now on
+        """
+        self.started = time.perf_counter()
+        self.imports = {}  # module -> seconds spent in its own body
+        self.phases = []  # (name, seconds) in run order
+        self.detailed = trace_imports
+        self._stack = []
+        self._original_import = None
+        if trace_imports:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        # Self time = wall time minus time spent in imports it triggered
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            self.imports[name] = self.imports.get(name, 0.0) + elapsed - children
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def stop_tracing(self):
+        """Restore the original __import__"""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a block of startup work
+
+        Args:
+            name: Label shown in the report
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self, top=15):
+        """
+        Build the startup report
+
+        Args:
+            top: Number of most expensive import groups to list
+
+        Returns:
+            str: One summary line, plus the breakdown when detailed
+        """
+        self.stop_tracing()
+        total = time.perf_counter() - self.started
+        init_total = sum(seconds for _, seconds in self.phases)
+        lines = [f"App ready in {total * 1000:.0f} ms "
+                 f"(init {init_total * 1000:.0f} ms, pid {os.getpid()})"]
+        if not self.detailed:
+            return lines[0]
+
+        if self.imports:
+            # Third-party modules are grouped by top-level package; first-party stay per module
+            first_party = ('app', 'config', 'models', 'routes', 'services', 'utils', 'errors')
+            groups = {}
+            for name, seconds in self.imports.items():
+                root = name.split('.')[0]
+                key = name if root in first_party else root
+                groups[key] = groups.get(key, 0.0) + seconds
+            lines.append(f"  imports: {sum(groups.values()) * 1000:.0f} ms")
+            for key, seconds in sorted(groups.items(), key=lambda item: -item[1])[:top]:
+                lines.append(f"    {seconds * 1000:8.1f} ms  {key}")
+
+        lines.append("  init:")
+        for name, seconds in self.phases:
+            lines.append(f"    {seconds * 1000:8.1f} ms  {name}")
+        return '\n'.join(lines)
+
+
+def start_timer():
+    """
+    Create the process's startup timer (call before app.py's other imports)
+
+    Returns:
+        StartupTimer: Timer tracing imports when STARTUP_TIMING=true
+    """
+    return StartupTimer(trace_imports=os.environ.get('STARTUP_TIMING', 'false').lower() == 'true')
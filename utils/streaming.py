@@ -0,0 +1,162 @@
+"""
+Streaming JSON responses
+Writes large listings to the client item by item, optionally gzip/brotli compressed
+"""
+import json
+import zlib
+
+from flask import Response, stream_with_context
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # brotli is optional; gzip is always available
+
+# Flush the compressor after this many bytes of JSON so the client sees data early
+FLUSH_BYTES = 16 * 1024
+
+
+def trim_playlist(playlist):
+    """
+    Keep only the playlist fields the frontend renders
+
+    Args:
+        playlist: Spotify (or LibraryStore) playlist object
+
+    Returns:
+        dict: Same shape as Spotify's object, minus everything unused
+    """
+    images = playlist.get('images') or []
+    owner = playlist.get('owner') or {}
+    return {
+        'id': playlist.get('id'),
+        'name': playlist.get('name'),
+        'snapshot_id': playlist.get('snapshot_id'),
+        'public': playlist.get('public'),
+        'owner': {'id': owner.get('id'), 'display_name': owner.get('display_name')},
+        'images': [{'url': images[0].get('url')}] if images else [],
+        'tracks': {'total': (playlist.get('tracks') or {}).get('total')},
+    }
+
+
+def trim_track(track):
+    """
+    Keep only the track fields the frontend renders
+
+    Args:
+        track: Spotify (or LibraryStore) track object
+
+    Returns:
+        dict: id, name, uri, artist names and album name
+    """
+    return {
+        'id': track.get('id'),
+        'name': track.get('name'),
+        'uri': track.get('uri'),
+        'artists': [artist.get('name') for artist in track.get('artists') or []],
+        'album': (track.get('album') or {}).get('name'),
+    }
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the response encoding from an Accept-Encoding header
+
+    Args:
+        accept_encoding: Raw header value (may be empty)
+
+    Returns:
+        str: 'br', 'gzip' or None for identity
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', accepted.get('*', 0)) > 0:
+        return 'gzip'
+    return None
+
+
+def json_stream(items, header=None, footer=None):
+    """
+    Serialize {**header, "items": [...], **footer} one item at a time
+
+    Args:
+        items: Iterable of JSON-serializable items (consumed lazily)
+        header: Dict of fields written before the items
+        footer: Callable returning a dict of fields written after the items
+            (called once the items are exhausted, e.g. to report 'partial')
+
+    Yields:
+        str: JSON text fragments
+    """
+    prefix = json.dumps(header or {})[:-1]
+    yield prefix + (', ' if header else '') + '"items": ['
+    for index, item in enumerate(items):
+        yield (',' if index else '') + json.dumps(item)
+    tail = json.dumps(footer() if footer else {})[1:]
+    yield ']' + (', ' + tail if tail != '}' else '}')
+
+
+def _encode(chunks, encoding):
+    """Encode text chunks and compress them, flushing every FLUSH_BYTES"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=4)  # fast enough to keep up with the stream
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    elif encoding == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+        compress, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    else:
+        compress = flush = finish = None
+
+    pending = 0
+    for chunk in chunks:
+        data = chunk.encode()
+        if compress is None:
+            yield data
+            continue
+        out = compress(data)
+        pending += len(data)
+        if pending >= FLUSH_BYTES:
+            out += flush()
+            pending = 0
+        if out:
+            yield out
+    if finish is not None:
+        yield finish()
+
+
+def streaming_json_response(chunks, accept_encoding=None, status=200):
+    """
+    Build a streaming application/json response from json_stream output
+
+    Args:
+        chunks: Iterable of JSON text fragments (see json_stream)
+        accept_encoding: Client Accept-Encoding header used to choose compression
+        status: HTTP status code
+
+    Returns:
+        Response: Chunked response that keeps the request context while streaming
+    """
+    encoding = negotiate_encoding(accept_encoding)
+    response = Response(
+        stream_with_context(_encode(chunks, encoding)),
+        status=status,
+        mimetype='application/json'
+    )
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let proxies buffer the stream
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
@@ -81,7 +81,7 @@ def validate_playlist_unlink_data(data):
     Validate playlist unlink data
     
     Args:
-        data: Dictionary containing playlist ID
+        data: Dictionary containing playlist ID and an optional "unfollow" flag
         
     Raises:
         ValidationError: If validation fails
@@ -94,6 +94,253 @@ def validate_playlist_unlink_data(data):
     if not playlist_id:
         raise ValidationError("Playlist ID is required")
     
-    return {'playlist_id': playlist_id}
+    unfollow = data.get('unfollow', False)
+    if not isinstance(unfollow, bool):
+        raise ValidationError("unfollow must be true or false")
+    
+    return {'playlist_id': playlist_id, 'unfollow': unfollow}
+
+
+# Spotify's limit on tracks in one playlist
+MAX_PLAYLIST_TRACKS = 10000
+
+TRACK_URI = re.compile(r'spotify:(track|episode):[A-Za-z0-9]{22}')
+
+
+def validate_track_uris(uris, required=True):
+    """
+    Validate a list of Spotify track/episode URIs
+    
+    Args:
+        uris: Value of the request's "uris" field
+        required: Whether at least one URI must be given
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    if uris is None and not required:
+        return []
+    if not isinstance(uris, list) or (required and not uris):
+        raise ValidationError("URIs must be a non-empty list" if required else "URIs must be a list")
+    if len(uris) > MAX_PLAYLIST_TRACKS:
+        raise ValidationError(f"At most {MAX_PLAYLIST_TRACKS} URIs can be written at once")
+    for uri in uris:
+        if not isinstance(uri, str) or not TRACK_URI.fullmatch(uri):
+            raise ValidationError(f"Invalid track URI: {uri!r}")
+    return uris
+
+
+def validate_playlist_create_data(data):
+    """
+    Validate playlist creation data
+    
+    Args:
+        data: Dictionary containing name, optional description, public and uris
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    if not data:
+        raise ValidationError("Request body is required")
+    
+    name = data.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise ValidationError("Playlist name is required")
+    if len(name) > 100:
+        raise ValidationError("Playlist name must be at most 100 characters")
+    
+    description = data.get('description') or ''
+    if not isinstance(description, str) or len(description) > 300:
+        raise ValidationError("Description must be a string of at most 300 characters")
+    
+    public = data.get('public', False)
+    if not isinstance(public, bool):
+        raise ValidationError("Public must be true or false")
+    
+    return {
+        'name': name.strip(),
+        'description': description,
+        'public': public,
+        'uris': validate_track_uris(data.get('uris'), required=False)
+    }
+
+
+def validate_playlist_tracks_data(data, allow_empty=False):
+    """
+    Validate data for adding, replacing or removing playlist tracks
+    
+    Args:
+        data: Dictionary containing uris and, for additions, an optional position
+        allow_empty: Accept an empty list (replacing with nothing clears the playlist)
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    if data is None:
+        raise ValidationError("Request body is required")
+    
+    uris = data.get('uris')
+    uris = validate_track_uris(uris, required=not (allow_empty and uris == []))
+    
+    position = data.get('position')
+    if position is not None and (isinstance(position, bool) or not isinstance(position, int) or position < 0):
+        raise ValidationError("Position must be a non-negative integer")
+    
+    return {'uris': uris, 'position': position}
+
+
+def validate_mood_data(data):
+    """
+    Validate mood playlist generation data
+    
+    Args:
+        data: Dictionary containing a mood name and/or feature targets,
+            plus optional limit and playlist_ids
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    if not data:
+        raise ValidationError("Request body is required")
+    
+    mood = data.get('mood')
+    targets = data.get('targets') or {}
+    
+    if mood is not None and not isinstance(mood, str):
+        raise ValidationError("Mood must be a string")
+    
+    if not isinstance(targets, dict):
+        raise ValidationError("Targets must be an object of audio feature values")
+    
+    if not mood and not targets:
+        raise ValidationError("A mood or feature targets are required")
+    
+    for name, value in targets.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValidationError(f"Target for '{name}' must be a number")
+    
+    limit = data.get('limit', 30)
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= 100:
+        raise ValidationError("Limit must be an integer between 1 and 100")
+    
+    playlist_ids = data.get('playlist_ids')
+    if playlist_ids is not None:
+        if not isinstance(playlist_ids, list) or not all(isinstance(p, str) and p for p in playlist_ids):
+            raise ValidationError("Playlist IDs must be a list of strings")
+    
+    return {
+        'mood': mood.strip().lower() if mood else None,
+        'targets': targets,
+        'limit': limit,
+        'playlist_ids': playlist_ids
+    }
+
+
+def validate_search_params(args):
+    """
+    Validate library search query parameters
+    
+    Args:
+        args: Request args with q, plus optional limit and type
+            ('playlist' or 'track', comma-separated)
+        
+    Returns:
+        dict: Validated q, limit and types (None = all types)
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    query = args.get('q')
+    if query is None:
+        raise ValidationError("Query parameter 'q' is required")
+    if len(query) > 200:
+        raise ValidationError("Query must be at most 200 characters")
+    
+    try:
+        limit = int(args.get('limit', 20))
+    except ValueError:
+        raise ValidationError("Limit must be an integer between 1 and 100")
+    if not 1 <= limit <= 100:
+        raise ValidationError("Limit must be an integer between 1 and 100")
+    
+    types = None
+    if args.get('type'):
+        types = [name.strip() for name in args['type'].split(',') if name.strip()]
+        if not types or any(name not in ('playlist', 'track') for name in types):
+            raise ValidationError("Type must be 'playlist', 'track' or both, comma-separated")
+    
+    return {'q': query, 'limit': limit, 'types': types}
+
+
+def validate_similar_data(data):
+    """
+    Validate "more like these tracks" request data
+    
+    Args:
+        data: Dictionary containing track_ids (1-25 seed track IDs), plus
+            optional limit and from_library
+        
+    Returns:
+        dict: Validated track_ids, limit and from_library
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    if not data:
+        raise ValidationError("Request body is required")
+    
+    track_ids = data.get('track_ids')
+    if not isinstance(track_ids, list) or not all(isinstance(t, str) and t for t in track_ids):
+        raise ValidationError("Track IDs must be a list of strings")
+    if not 1 <= len(track_ids) <= 25:
+        raise ValidationError("Between 1 and 25 seed tracks are required")
+    
+    return dict(_validate_recommendation_options(data), track_ids=list(dict.fromkeys(track_ids)))
 
 
+def validate_blend_data(data):
+    """
+    Validate mood blend request data
+    
+    Args:
+        data: Dictionary containing moods (2-4 objects, each a mood name
+            and/or feature targets plus an optional weight), plus optional
+            limit and from_library
+        
+    Returns:
+        dict: Validated moods (mood, targets, weight), limit and from_library
+        
+    Raises:
+        ValidationError: If validation fails
+    """
+    if not data:
+        raise ValidationError("Request body is required")
+    
+    moods = data.get('moods')
+    if not isinstance(moods, list) or not 2 <= len(moods) <= 4:
+        raise ValidationError("Between 2 and 4 moods are required")
+    
+    validated_moods = []
+    for entry in moods:
+        if not isinstance(entry, dict):
+            raise ValidationError("Each mood must be an object")
+        mood = validate_mood_data({'mood': entry.get('mood'), 'targets': entry.get('targets')})
+        weight = entry.get('weight', 1)
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight <= 0:
+            raise ValidationError("Mood weight must be a positive number")
+        validated_moods.append({'mood': mood['mood'], 'targets': mood['targets'], 'weight': weight})
+    
+    return dict(_validate_recommendation_options(data), moods=validated_moods)
+
+
+def _validate_recommendation_options(data):
+    """Validate the limit and from_library options shared by recommendation requests"""
+    limit = data.get('limit', 30)
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= 100:
+        raise ValidationError("Limit must be an integer between 1 and 100")
+    
+    from_library = data.get('from_library', False)
+    if not isinstance(from_library, bool):
+        raise ValidationError("from_library must be a boolean")
+    
+    return {'limit': limit, 'from_library': from_library}